@@ -20,7 +20,8 @@ def setup_periodic_tasks(sender, **kwargs):
     from django_celery_beat.models import PeriodicTask, IntervalSchedule
 
     # beat가 주기적으로 실행할 task의 주기를 설정하고 이를 db에 저장
-    schedule, _ = IntervalSchedule.objects.get_or_create(every=1, period=IntervalSchedule.SECONDS)
-    _, created = PeriodicTask.objects.get_or_create(interval=schedule, name="Run Match Orders Task", task="orders.tasks.run_matching_engine")
+    # 매칭은 주문 접수 시 거래쌍 단위로 요청되므로 beat는 유실된 요청을 복구하는 용도로만 느린 주기로 실행
+    schedule, _ = IntervalSchedule.objects.get_or_create(every=30, period=IntervalSchedule.SECONDS)
+    _, created = PeriodicTask.objects.update_or_create(name="Run Match Orders Task", defaults={"interval": schedule, "task": "orders.tasks.run_matching_engine"})
 
     print("Periodic task created." if created else "Periodic task already exists.")
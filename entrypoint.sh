@@ -4,6 +4,14 @@ set -e
 if [ "$1" = "worker" ]; then
     echo "Starting Celery worker..."
     celery -A conf.celery worker --loglevel=info
+elif [ "$1" = "matcher" ]; then
+    echo "Starting matching workers..."
+    # 파티션마다 concurrency 1인 worker를 하나씩 띄워 거래쌍이 항상 하나의 프로세스에서만 매칭되도록 함
+    for partition in $(seq 0 $((${MATCHING_PARTITIONS:-4} - 1))); do
+        celery -A conf.celery worker --loglevel=info --concurrency=1 -Q "matching-$partition" -n "matcher-$partition@%h" &
+    done
+    wait -n
+    exit $?
 elif [ "$1" = "beat" ]; then
     echo "Starting Celery Beat..."
     celery -A conf.celery beat --loglevel=info --scheduler django_celery_beat.schedulers:DatabaseScheduler
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MarketsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "markets"
+
+    def ready(self):
+        # signals는 모델이 로드되었을 때만 작동하므로 AppConfig의 ready() 메서드를 사용해야 함
+        import markets.signals  # noqa
+
+        return super().ready()
@@ -2,9 +2,11 @@ import random
 from decimal import Decimal
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
-from markets.models import CryptoCurrency
+from markets.models import CryptoCurrency, TradingPair
 from orders.models import Order
+from orders.services import funds_currency_id, hold_balance, order_hold, push_new_orders
 from users.models import CustomUser, Wallet, WalletBalance
 
 
@@ -16,6 +18,7 @@ class Command(BaseCommand):
 
         users = self._create_users()
         cryptos = self._create_cryptocurrencies()
+        self._create_trading_pairs(cryptos)
 
         self._create_wallets_and_balances(users, cryptos)
         self._create_orders(users, cryptos)
@@ -56,6 +59,25 @@ class Command(BaseCommand):
             cryptos.append(crypto)
         return cryptos
 
+    def _create_trading_pairs(self, cryptos):
+        # 매칭 엔진은 TradingPair 단위로 동작하므로 KRW 마켓의 거래쌍을 생성
+        quote_currency = CryptoCurrency.objects.filter(symbol="KRW").first()
+        if not quote_currency:
+            return
+
+        pair_data = {
+            "min_price": Decimal("1"),
+            "max_price": Decimal("100000000"),
+            "tick_size": Decimal("0.00000001"),
+            "min_quantity": Decimal("0.001"),
+            "max_quantity": Decimal("100000"),
+            "step_size": Decimal("0.00000001"),
+        }
+        for crypto in cryptos:
+            if crypto == quote_currency:
+                continue
+            TradingPair.objects.get_or_create(base_asset=crypto, quote_asset=quote_currency, defaults=pair_data)
+
     def _create_wallets_and_balances(self, users, cryptos):
         for user in users:
             if not hasattr(user, "wallet"):
@@ -70,38 +92,50 @@ class Command(BaseCommand):
 
     def _create_orders(self, users, cryptos):
         # KRW를 기준으로 암호화폐를 무작위로 매수/매도 주문 생성
+        # 주문 수량은 이미 예약된 잔고를 제외한 사용 가능한 잔고 안에서 정함
         quote_currency = CryptoCurrency.objects.filter(symbol="KRW").first()
         if not quote_currency:
             return
 
         for user in users:
-            user_wallet = user.wallet
-
-            try:
-                quote_balance = user_wallet.balances.get(currency=quote_currency).amount
-            except WalletBalance.DoesNotExist:
-                quote_balance = Decimal("0")
-
             for crypto in cryptos:
                 if crypto == quote_currency:
                     continue
 
-                try:
-                    base_balance = user_wallet.balances.get(currency=crypto).amount
-                except WalletBalance.DoesNotExist:
-                    base_balance = Decimal("0")
-
-                if base_balance > 0:
+                base_balance = self._available_balance(user, crypto)
+                min_sell_amt = Decimal("0.001")
+                if base_balance > min_sell_amt:
                     sell_price = Decimal(random.uniform(10000, 20000)).quantize(Decimal("0.00000001"))
-                    min_sell_amt = Decimal("0.001")
-                    if base_balance > min_sell_amt:
-                        sell_amount = Decimal(random.uniform(float(min_sell_amt), float(base_balance))).quantize(Decimal("0.00000001"))
-                        Order.objects.create(user=user, order_type="limit", base_currency=crypto, quote_currency=quote_currency, side="sell", price=sell_price, amount=sell_amount)
-
-                if quote_balance > 0:
-                    buy_price = Decimal(random.uniform(10000, 20000)).quantize(Decimal("0.00000001"))
-                    max_buy_amt = quote_balance / buy_price
-                    min_buy_amt = Decimal("0.001")
-                    if max_buy_amt > min_buy_amt:
-                        buy_amount = Decimal(random.uniform(float(min_buy_amt), float(max_buy_amt))).quantize(Decimal("0.00000001"))
-                        Order.objects.create(user=user, order_type="limit", base_currency=crypto, quote_currency=quote_currency, side="buy", price=buy_price, amount=buy_amount)
+                    sell_amount = Decimal(random.uniform(float(min_sell_amt), float(base_balance))).quantize(Decimal("0.00000001"))
+                    self._place_order(user, "sell", crypto, quote_currency, sell_price, sell_amount)
+
+                quote_balance = self._available_balance(user, quote_currency)
+                buy_price = Decimal(random.uniform(10000, 20000)).quantize(Decimal("0.00000001"))
+                max_buy_amt = quote_balance / buy_price
+                min_buy_amt = Decimal("0.001")
+                if max_buy_amt > min_buy_amt:
+                    buy_amount = Decimal(random.uniform(float(min_buy_amt), float(max_buy_amt))).quantize(Decimal("0.00000001"))
+                    self._place_order(user, "buy", crypto, quote_currency, buy_price, buy_amount)
+
+    def _available_balance(self, user, currency):
+        balance = user.wallet.balances.filter(currency=currency).values_list("amount", "locked").first()
+        return balance[0] - balance[1] if balance else Decimal("0")
+
+    def _place_order(self, user, side, base_currency, quote_currency, price, amount):
+        # 주문 API와 같이 잔고를 예약한 뒤 주문을 생성하고, 예약할 수 없는 주문은 건너뜀
+        order = Order(
+            user=user,
+            order_type="limit",
+            side=side,
+            base_currency=base_currency,
+            quote_currency=quote_currency,
+            price=price,
+            amount=amount,
+            locked=order_hold(side, "limit", price, amount),
+        )
+        with transaction.atomic():
+            if not hold_balance(user.id, funds_currency_id(order), order.locked):
+                return None
+            order.save()
+            push_new_orders([order])
+        return order
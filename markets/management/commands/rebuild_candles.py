@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from markets.models import Candle
+from markets.utils import clear_candle_cache, update_candles
+from orders.models import Trade
+
+
+# 캔들은 정산 시 점진적으로 갱신되므로 캔들 테이블이 추가되기 전의 체결이나 어긋난 캔들을 복구할 때 사용
+# python manage.py rebuild_candles
+class Command(BaseCommand):
+    batch_size = 10000
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING("Rebuilding candles from trades..."))
+
+        with transaction.atomic():
+            Candle.objects.all().delete()
+
+            # open/close가 올바르도록 체결 순서대로 읽고, iterator로 전체 체결을 메모리에 올리지 않음
+            batch = []
+            for trade in (
+                Trade.objects.order_by("created_at", "id").only("base_currency_id", "quote_currency_id", "price", "amount", "created_at").iterator(chunk_size=self.batch_size)
+            ):
+                batch.append(trade)
+                if len(batch) >= self.batch_size:
+                    update_candles(batch)
+                    batch = []
+            update_candles(batch)
+
+        # 캐시된 chunk는 이전 캔들을 가지고 있으므로 함께 제거
+        clear_candle_cache()
+
+        self.stdout.write(self.style.SUCCESS("Candle rebuild complete!"))
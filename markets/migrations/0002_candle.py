@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("markets", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Candle",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("interval", models.CharField(choices=[("1m", "1 Minute"), ("1h", "1 Hour"), ("1d", "1 Day")], max_length=3)),
+                ("open_time", models.DateTimeField()),
+                ("open", models.DecimalField(decimal_places=8, max_digits=20)),
+                ("high", models.DecimalField(decimal_places=8, max_digits=20)),
+                ("low", models.DecimalField(decimal_places=8, max_digits=20)),
+                ("close", models.DecimalField(decimal_places=8, max_digits=20)),
+                ("volume", models.DecimalField(decimal_places=8, max_digits=30)),
+                ("base_currency", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="base_currency_candles", to="markets.cryptocurrency")),
+                ("quote_currency", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="quote_currency_candles", to="markets.cryptocurrency")),
+            ],
+            options={
+                "db_table": "candles",
+                "unique_together": {("base_currency", "quote_currency", "interval", "open_time")},
+            },
+        ),
+    ]
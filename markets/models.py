@@ -36,3 +36,29 @@ class TradingPair(models.Model):
 
     def __str__(self):
         return f"{self.base_asset}/{self.quote_asset}"
+
+
+class Candle(models.Model):
+    INTERVAL_CHOICES = [
+        ("1m", "1 Minute"),
+        ("1h", "1 Hour"),
+        ("1d", "1 Day"),
+    ]
+
+    base_currency = models.ForeignKey(CryptoCurrency, on_delete=models.CASCADE, related_name="base_currency_candles")
+    quote_currency = models.ForeignKey(CryptoCurrency, on_delete=models.CASCADE, related_name="quote_currency_candles")
+    interval = models.CharField(max_length=3, choices=INTERVAL_CHOICES)
+    open_time = models.DateTimeField()
+    open = models.DecimalField(max_digits=20, decimal_places=8)
+    high = models.DecimalField(max_digits=20, decimal_places=8)
+    low = models.DecimalField(max_digits=20, decimal_places=8)
+    close = models.DecimalField(max_digits=20, decimal_places=8)
+    volume = models.DecimalField(max_digits=30, decimal_places=8)
+
+    class Meta:
+        # unique_together로 생성되는 인덱스가 거래쌍, 주기별 시간 범위 조회에도 사용됨
+        unique_together = ("base_currency", "quote_currency", "interval", "open_time")
+        db_table = "candles"
+
+    def __str__(self):
+        return f"{self.base_currency_id}/{self.quote_currency_id} {self.interval} {self.open_time.isoformat()}"
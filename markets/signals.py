@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CryptoCurrency, TradingPair
+from .utils import invalidate_reference_data
+
+
+# ViewSet, admin, management command 등 어디에서 변경하더라도 모든 프로세스의 통화, 거래쌍 캐시를 비움
+@receiver(post_save, sender=CryptoCurrency)
+@receiver(post_delete, sender=CryptoCurrency)
+@receiver(post_save, sender=TradingPair)
+@receiver(post_delete, sender=TradingPair)
+def invalidate_reference_data_cache(sender, **kwargs):
+    invalidate_reference_data()
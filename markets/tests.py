@@ -1,17 +1,39 @@
 import base64
+import io
+import json
 import random
+import statistics
 from datetime import datetime, timedelta
+from decimal import Decimal
 
 import pyotp
 import redis
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from django_redis import get_redis_connection
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 
-from .models import CryptoCurrency, TradingPair
+from .models import Candle, CryptoCurrency, TradingPair
+from .utils import (
+    IndicatorSeries,
+    IndicatorSet,
+    TickerWindow,
+    calculate_bollinger_bands,
+    calculate_indicators,
+    calculate_ma,
+    clear_candle_cache,
+    get_candle_data,
+    get_currency,
+    parse_indicator_spec,
+    serialize_candle,
+    update_live_indicators,
+)
 from orders.models import Order, Trade
-from users.models import CustomUserTOTPDevice
+from users.models import CustomUserTOTPDevice, WalletBalance
 
 # TODO: USER_DATA와 같이 다른 테스트에서도 중복으로 사용되는 데이터는 fixtures로 분리
 USER_DATA = {
@@ -123,6 +145,20 @@ class CryptoCurrencyAPITestCase(BaseAPITestCase):
         response = self.client.post(self.crypto_currency_url, self.new_crypto_currency_data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_create_crypto_currency_invalidates_reference_data(self):
+        self.assertIsNone(get_currency("ETH"))
+        pubsub = self.r.pubsub()
+        pubsub.subscribe("reference_data:invalidate")
+        self.assertEqual(pubsub.get_message(timeout=1)["type"], "subscribe")
+
+        # 현재 프로세스의 캐시는 바로 비우고, 다른 프로세스에는 commit 이후에 알림
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.crypto_currency_url, self.new_crypto_currency_data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(get_currency("ETH").id, response.data["id"])
+        self.assertEqual(pubsub.get_message(timeout=1)["type"], "message")
+        pubsub.close()
+
     def test_create_crypto_currency_unauthorized(self):
         self.client.credentials()
         response = self.client.post(self.crypto_currency_url, self.new_crypto_currency_data)
@@ -354,6 +390,22 @@ class ChartDataAPIViewTestCase(BaseAPITestCase):
         self.assertIn("middle_bands", indicators["bollinger_bands"])
         self.assertIn("lower_bands", indicators["bollinger_bands"])
 
+    def test_chart_data_parameterized_indicators(self):
+        response = self.client.get(
+            self.chart_data_url, {"symbol": "BTC/KRW", "start": self.start, "end": self.end, "interval": "1m", "indicators": "ma:1,ema:2,rsi:1,macd:1:2:1,vwap,atr:1"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        data = response.json()
+        indicators = data["indicators"]
+        self.assertEqual(set(indicators), {"ma:1", "ema:2", "rsi:1", "macd:1:2:1", "vwap", "atr:1"})
+        self.assertEqual(indicators["ma:1"], [float(candle["close"]) for candle in data["candles"]])
+        self.assertEqual(len(indicators["vwap"]), len(data["candles"]))
+
+        # 같은 캔들 목록에 대한 지표는 캐시된 결과를 사용
+        cached = self.client.get(self.chart_data_url, {"symbol": "BTC/KRW", "start": self.start, "end": self.end, "interval": "1m", "indicators": "vwap"})
+        self.assertEqual(cached.json()["indicators"]["vwap"], indicators["vwap"])
+
     def test_chart_data_invalid_indicator(self):
         response = self.client.get(self.chart_data_url, {"symbol": "BTC/KRW", "start": self.start, "end": self.end, "indicators": "unknown_indicator"})
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -375,3 +427,313 @@ class ChartDataAPIViewTestCase(BaseAPITestCase):
         end = (datetime.now() + timedelta(days=1)).strftime("%Y/%m/%d")
         response = self.client.get(self.chart_data_url, {"symbol": "BTC/KRW", "start": start, "end": end})
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CandleTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(**USER_DATA)
+        btc = CryptoCurrency.objects.create(symbol="BTC", name="Bitcoin")
+        krw = CryptoCurrency.objects.create(symbol="KRW", name="Korean Won")
+
+        order = Order.objects.create(user=user, side="buy", order_type="limit", price="10000", amount="3", base_currency=btc, quote_currency=krw)
+        for price in ["10000", "9000", "9500"]:
+            Trade.objects.create(buy_order=order, sell_order=order, price=price, amount="1")
+
+    def assertCandle(self, candle):
+        # open/close는 체결 순서의 처음과 마지막 가격이어야 함
+        self.assertEqual(candle.open, 10000)
+        self.assertEqual(candle.high, 10000)
+        self.assertEqual(candle.low, 9000)
+        self.assertEqual(candle.close, 9500)
+        self.assertEqual(candle.volume, 3)
+
+    def test_candles_updated_on_trade(self):
+        self.assertEqual(sorted(Candle.objects.values_list("interval", flat=True)), ["1d", "1h", "1m"])
+        for candle in Candle.objects.all():
+            self.assertCandle(candle)
+
+    def test_rebuild_candles(self):
+        Candle.objects.all().delete()
+        call_command("rebuild_candles", stdout=io.StringIO())
+        self.assertEqual(Candle.objects.count(), 3)
+        self.assertCandle(Candle.objects.get(interval="1d"))
+
+
+class InitializeDataTestCase(TestCase):
+    def test_seed_orders_hold_balance(self):
+        # 초기 주문도 주문 API와 같이 잔고를 예약하므로 사용 가능한 잔고를 넘어서 주문하지 않음
+        call_command("initialize_data", stdout=io.StringIO())
+        orders = Order.objects.filter(status="open")
+        self.assertTrue(orders.exists())
+        self.assertFalse(orders.filter(locked=0).exists())
+        for balance in WalletBalance.objects.all():
+            side_filter = (
+                {"side": "buy", "quote_currency_id": balance.currency_id} if balance.currency.symbol == "KRW" else {"side": "sell", "base_currency_id": balance.currency_id}
+            )
+            locked = sum(orders.filter(user__wallet=balance.wallet, **side_filter).values_list("locked", flat=True), Decimal("0"))
+            self.assertEqual(balance.locked, locked)
+            self.assertLessEqual(balance.locked, balance.amount)
+
+
+class CandleCacheTestCase(TestCase):
+    def setUp(self):
+        btc = CryptoCurrency.objects.create(symbol="BTC", name="Bitcoin")
+        krw = CryptoCurrency.objects.create(symbol="KRW", name="Korean Won")
+
+        # 이미 끝난 chunk에 속하는 과거 캔들
+        self.base_time = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=2)
+        for i in range(90):
+            Candle.objects.create(
+                base_currency=btc, quote_currency=krw, interval="1m", open_time=self.base_time + timedelta(minutes=i), open=100, high=110, low=90, close=105, volume=1
+            )
+
+    def tearDown(self):
+        clear_candle_cache()
+        return super().tearDown()
+
+    def test_overlapping_ranges_share_cache(self):
+        candles = get_candle_data("BTC/KRW", self.base_time + timedelta(seconds=13), self.base_time + timedelta(minutes=75, seconds=7), "1m")
+        self.assertEqual(len(candles), 76)
+        self.assertEqual(candles[0]["timestamp"], self.base_time.isoformat())
+
+        # 시작/종료 시간이 달라도 같은 chunk를 사용하고 통화 정보도 캐시되어 있으므로 DB를 다시 읽지 않음
+        with self.assertNumQueries(0):
+            candles = get_candle_data("BTC/KRW", self.base_time + timedelta(minutes=10, seconds=41), self.base_time + timedelta(minutes=80, seconds=59), "1m")
+        self.assertEqual(len(candles), 71)
+
+    def test_open_chunk_not_cached(self):
+        now = timezone.now()
+        Candle.objects.exclude(open_time=self.base_time).delete()
+        Candle.objects.update(open_time=now.replace(second=0, microsecond=0))
+        candles = get_candle_data("BTC/KRW", now - timedelta(minutes=1), now + timedelta(minutes=1), "1m")
+        self.assertEqual(len(candles), 1)
+
+        Candle.objects.update(close=200)
+        candles = get_candle_data("BTC/KRW", now - timedelta(minutes=1), now + timedelta(minutes=1), "1m")
+        self.assertEqual(candles[0]["close"], "200.00000000")
+
+
+class IndicatorTestCase(SimpleTestCase):
+    def setUp(self):
+        random.seed(0)
+        self.candle_list = []
+        for _ in range(200):
+            close = round(random.uniform(90_000_000, 110_000_000), 8)
+            self.candle_list.append({"high": str(close + 1_000_000), "low": str(close - 1_000_000), "close": str(close), "volume": str(round(random.uniform(0.1, 5), 8))})
+        self.closes = [float(candle["close"]) for candle in self.candle_list]
+
+    def test_ma_matches_naive_window(self):
+        mas = calculate_ma(self.candle_list, 20)
+        self.assertEqual(mas[:19], [None] * 19)
+        for i in range(19, len(self.closes)):
+            self.assertAlmostEqual(mas[i], sum(self.closes[i - 19 : i + 1]) / 20, delta=1e-4)
+
+    def test_bollinger_bands_match_naive_window(self):
+        bands = calculate_bollinger_bands(self.candle_list, 20, 2)
+        for i in range(19, len(self.closes)):
+            window = self.closes[i - 19 : i + 1]
+            self.assertAlmostEqual(bands["upper_bands"][i], statistics.mean(window) + 2 * statistics.pstdev(window), delta=1e-3)
+            self.assertAlmostEqual(bands["lower_bands"][i], statistics.mean(window) - 2 * statistics.pstdev(window), delta=1e-3)
+
+    def test_shared_series_computes_ma_once(self):
+        indicator_set = IndicatorSet(["ma:20", "bollinger_bands:20:2"])
+        self.assertEqual(list(indicator_set.accumulators), [("rolling_stats", 20)])
+
+        results = IndicatorSeries(self.candle_list).compute(["ma:20", "bollinger_bands:20:2"])
+        self.assertEqual(results["bollinger_bands:20:2"]["middle_bands"], results["ma:20"])
+
+    def test_uncommitted_update_does_not_change_state(self):
+        specs = ["ma:5", "bollinger_bands:5", "ema:5", "macd:3:6:2", "rsi:5", "vwap", "atr:5"]
+        indicator_set = IndicatorSet(specs)
+        for candle in self.candle_list[:-1]:
+            indicator_set.update_candle(candle)
+
+        # 진행 중인 캔들을 여러 번 반영해도 상태는 바뀌지 않고 처음부터 계산한 값과 같음
+        indicator_set.update_candle({**self.candle_list[-1], "close": "1"}, commit=False)
+        values = indicator_set.update_candle(self.candle_list[-1], commit=False)
+        results = IndicatorSeries(self.candle_list).compute(specs)
+        for spec in specs:
+            expected = results[spec]
+            if isinstance(expected, dict):
+                for field in expected:
+                    self.assertAlmostEqual(values[spec][field], expected[field][-1], delta=1e-4)
+            else:
+                self.assertAlmostEqual(values[spec], expected[-1], delta=1e-4)
+
+    def test_single_pass_indicators(self):
+        series = IndicatorSeries(self.candle_list)
+        results = series.compute(["ema:10", "macd", "rsi", "vwap", "atr:14", "ma:50"])
+
+        ema = self.closes[0:10]
+        expected_ema = sum(ema) / 10
+        for close in self.closes[10:]:
+            expected_ema += 2 / 11 * (close - expected_ema)
+        self.assertEqual(results["ema:10"][:9], [None] * 9)
+        self.assertAlmostEqual(results["ema:10"][-1], expected_ema, delta=1e-4)
+
+        # macd의 fast EMA는 ema 지표와 같은 누적기를 공유
+        self.assertEqual(len(results["macd"]["macd"]), len(self.closes))
+        self.assertIsNone(results["macd"]["signal"][25 + 7])
+        self.assertIsNotNone(results["macd"]["histogram"][25 + 8])
+
+        self.assertEqual(results["rsi"][:14], [None] * 14)
+        self.assertTrue(all(0 <= value <= 100 for value in results["rsi"][14:]))
+
+        volumes = [float(candle["volume"]) for candle in self.candle_list]
+        self.assertAlmostEqual(results["vwap"][-1], sum(close * volume for close, volume in zip(self.closes, volumes)) / sum(volumes), delta=1e-4)
+
+        self.assertEqual(results["atr:14"][:13], [None] * 13)
+        self.assertGreaterEqual(results["atr:14"][-1], 2_000_000)
+
+        self.assertEqual(results["ma:50"], calculate_ma(self.candle_list, 50))
+
+    def test_indicator_state_round_trip(self):
+        # JSON으로 저장한 상태에서 이어서 계산한 값은 처음부터 계산한 값과 같음
+        specs = ["bollinger_bands:20:2", "ema:10", "macd", "rsi", "vwap", "atr:14"]
+        indicator_set = IndicatorSet(specs)
+        for candle in self.candle_list[:40]:
+            indicator_set.update_candle(candle)
+
+        restored = IndicatorSet(specs)
+        restored.from_state(json.loads(json.dumps(indicator_set.to_state())))
+        for candle in self.candle_list[40:]:
+            values = restored.update_candle(candle)
+        results = IndicatorSeries(self.candle_list).compute(specs)
+        for spec in specs:
+            if isinstance(values[spec], dict):
+                for field in values[spec]:
+                    self.assertAlmostEqual(values[spec][field], results[spec][field][-1], delta=1e-6)
+            else:
+                self.assertAlmostEqual(values[spec], results[spec][-1], delta=1e-6)
+
+    def test_invalid_indicator_spec(self):
+        for spec in ["unknown", "ma:0", "ma:abc", "ma:20:2", "bollinger_bands:20:-1"]:
+            with self.assertRaises(ValueError):
+                parse_indicator_spec(spec)
+        self.assertEqual(parse_indicator_spec("bollinger_bands:50"), ("bollinger_bands", {"window_size": 50, "std": 2}))
+
+    def test_window_larger_than_series(self):
+        self.assertEqual(calculate_ma(self.candle_list[:5], 20), [None] * 5)
+
+
+class LiveIndicatorTestCase(TestCase):
+    def setUp(self):
+        self.btc = CryptoCurrency.objects.create(symbol="BTC", name="Bitcoin")
+        self.krw = CryptoCurrency.objects.create(symbol="KRW", name="Korean Won")
+
+        random.seed(0)
+        self.base_time = timezone.now().replace(second=0, microsecond=0) - timedelta(minutes=30)
+        for i in range(30):
+            self.create_candle(self.base_time + timedelta(minutes=i), random.randint(9000, 11000))
+
+    def tearDown(self):
+        clear_candle_cache()
+        return super().tearDown()
+
+    def create_candle(self, open_time, close):
+        return Candle.objects.create(
+            base_currency=self.btc, quote_currency=self.krw, interval="1m", open_time=open_time, open=close, high=close + 100, low=close - 100, close=close, volume=1
+        )
+
+    def assert_matches_full_series(self, values, specs):
+        candle_list = [serialize_candle(candle) for candle in Candle.objects.order_by("open_time")]
+        results = IndicatorSeries(candle_list).compute(specs)
+        for spec in specs:
+            self.assertAlmostEqual(values[spec], results[spec][-1], delta=1e-6)
+
+    def test_live_indicators_update_incrementally(self):
+        specs = ["ma:5", "ema:5", "rsi:5", "atr:5"]
+        latest = Candle.objects.order_by("-open_time").first()
+        self.assert_matches_full_series(update_live_indicators(latest, specs), specs)
+
+        # 같은 캔들이 갱신될 때는 저장된 상태만 사용
+        latest.close = latest.high = 12000
+        latest.save()
+        with self.assertNumQueries(0):
+            values = update_live_indicators(latest, specs)
+        self.assert_matches_full_series(values, specs)
+
+        # 새 캔들이 시작되면 마감된 캔들만 상태에 반영
+        new_candle = self.create_candle(latest.open_time + timedelta(minutes=1), 10500)
+        with self.assertNumQueries(1):
+            values = update_live_indicators(new_candle, specs)
+        self.assert_matches_full_series(values, specs)
+
+    def test_chart_indicators_resume_from_checkpoint(self):
+        specs = ["ma:5", "rsi:5"]
+        candle_list = [serialize_candle(candle) for candle in Candle.objects.order_by("open_time")]
+        calculate_indicators("BTC/KRW", "1m", candle_list[:-5], specs)
+
+        self.assertEqual(calculate_indicators("BTC/KRW", "1m", candle_list, specs), IndicatorSeries(candle_list).compute(specs))
+
+        # 시작 시간을 옮긴 구간도 같은 상태를 사용하며, 새로 마감된 캔들이 없으면 상태를 다시 기록하지 않음
+        redis_conn = get_redis_connection("default")
+        cache_key = "indicators:BTC/KRW:1m:ma:5,rsi:5"
+        redis_conn.persist(cache_key)
+        expected = IndicatorSeries(candle_list).compute(specs)
+        self.assertEqual(calculate_indicators("BTC/KRW", "1m", candle_list[3:], specs), {spec: values[3:] for spec, values in expected.items()})
+        self.assertEqual(redis_conn.ttl(cache_key), -1)
+
+        # 이미 상태에 반영한 구간은 저장된 값만 읽음
+        self.assertEqual(calculate_indicators("BTC/KRW", "1m", candle_list[:10], specs), {spec: values[:10] for spec, values in expected.items()})
+
+        # 상태의 시작보다 앞선 구간은 저장된 상태 없이 구간만 계산
+        calculate_indicators("BTC/KRW", "1m", candle_list[5:], ["ma:3"])
+        self.assertEqual(calculate_indicators("BTC/KRW", "1m", candle_list, ["ma:3"]), IndicatorSeries(candle_list).compute(["ma:3"]))
+
+
+class TickerWindowTestCase(SimpleTestCase):
+    def setUp(self):
+        self.now = timezone.now().replace(second=30, microsecond=0)
+        self.window = TickerWindow()
+
+    def test_rolling_window(self):
+        self.window.add_trade(self.now - timedelta(hours=25), "90", "1")
+        self.window.add_trade(self.now - timedelta(hours=23), "100", "1")
+        self.window.add_trade(self.now - timedelta(hours=2), "120", "2")
+        self.window.add_trade(self.now - timedelta(hours=2), "80", "1")
+        self.window.add_trade(self.now, "110", "1")
+
+        ticker = self.window.snapshot(self.now)
+        self.assertEqual((ticker["open"], ticker["high"], ticker["low"], ticker["last_price"]), ("100", "120", "80", "110"))
+        self.assertEqual(ticker["volume"], "5")
+        self.assertEqual(ticker["quote_volume"], "530")
+        self.assertEqual(ticker["change_percent"], "10.00")
+
+        # 고가와 저가를 가진 bucket이 빠지면 남은 bucket의 고가와 저가를 사용
+        ticker = self.window.snapshot(self.now + timedelta(hours=23))
+        self.assertEqual((ticker["open"], ticker["high"], ticker["low"]), ("110", "110", "110"))
+        self.assertEqual(ticker["volume"], "1")
+
+    def test_empty_window_keeps_last_price(self):
+        self.window.add_trade(self.now - timedelta(hours=30), "100", "1")
+        ticker = self.window.snapshot(self.now)
+        self.assertEqual((ticker["open"], ticker["last_price"], ticker["volume"]), ("100", "100", "0"))
+        self.assertEqual(ticker["change_percent"], "0.00")
+
+
+class TickerAPIViewTestCase(BaseAPITestCase):
+    ticker_url = "/markets/ticker/"
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate_user()
+        self.redis_conn = redis.StrictRedis.from_url(settings.CACHES["default"]["LOCATION"])
+        self.redis_conn.hset("tickers", "BTC/KRW", json.dumps({"symbol": "BTC/KRW", "last_price": "100"}))
+        self.redis_conn.hset("tickers", "ETH/KRW", json.dumps({"symbol": "ETH/KRW", "last_price": "10"}))
+
+    def tearDown(self):
+        self.redis_conn.delete("tickers")
+        return super().tearDown()
+
+    def test_tickers(self):
+        response = self.client.get(self.ticker_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([ticker["symbol"] for ticker in response.json()], ["BTC/KRW", "ETH/KRW"])
+
+    def test_ticker_by_symbol(self):
+        response = self.client.get(self.ticker_url, {"symbol": "ETH/KRW"})
+        self.assertEqual(response.json(), {"symbol": "ETH/KRW", "last_price": "10"})
+
+        response = self.client.get(self.ticker_url, {"symbol": "XRP/KRW"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -1,95 +1,914 @@
 import json
-import statistics
-from datetime import datetime
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
 
-from django.db.models import Min, Max, Sum
-from django.db.models.functions import TruncMinute, TruncHour, TruncDay
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
 from django_redis import get_redis_connection
 
+from .models import Candle, CryptoCurrency, TradingPair
 from orders.models import Trade
 
+logger = logging.getLogger(__name__)
 
-def get_candle_data(symbol: str, start: datetime, end: datetime, interval: str):
-    redis_conn = get_redis_connection("default")
-    cache_key = f"candles:{symbol}:{interval}:{start.isoformat()}:{end.isoformat()}"
-    cached_data = redis_conn.get(cache_key)
-    if cached_data:
-        return json.loads(cached_data)
 
-    base, quote = symbol.split("/")
-    # TODO: Trade가 존재할 때만 가격 정보를 가져오도록 하는 것 보다 가격 정보를 따로 기록하고 Trade가 발생 시 업데이트
-    queryset = Trade.objects.filter(
-        buy_order__base_currency__symbol=base,
-        buy_order__quote_currency__symbol=quote,
-        created_at__gte=start,
-        created_at__lt=end,
-    )
+CANDLE_INTERVALS = [interval for interval, _ in Candle.INTERVAL_CHOICES]
 
-    if interval == "1m":
-        grouped_qs = queryset.annotate(time_group=TruncMinute("created_at"))
-    elif interval == "1h":
-        grouped_qs = queryset.annotate(time_group=TruncHour("created_at"))
-    elif interval == "1d":
-        grouped_qs = queryset.annotate(time_group=TruncDay("created_at"))
-    else:
-        grouped_qs = queryset.annotate(time_group=TruncMinute("created_at"))
-
-    aggregated = (
-        grouped_qs.values("time_group")
-        .annotate(
-            open_price=Min("price"),
-            high_price=Max("price"),
-            low_price=Min("price"),
-            close_price=Max("price"),
-            volume=Sum("amount"),
+# 캔들 주기별 캐시 단위(chunk) 크기, 각 chunk는 주기에 따라 60, 24, 30개의 캔들을 가짐
+CANDLE_CHUNK_SIZES = {"1m": timedelta(hours=1), "1h": timedelta(days=1), "1d": timedelta(days=30)}
+CANDLE_CHUNK_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+CANDLE_CACHE_TIMEOUT = 60 * 60 * 24
+# chunk가 끝난 직후에 commit되는 정산이 있을 수 있으므로 약간의 여유를 두고 캐시
+CANDLE_CACHE_GRACE = timedelta(seconds=5)
+INDICATOR_CACHE_TIMEOUT = 60 * 10
+TICKER_WINDOW = timedelta(hours=24)
+# 모든 거래쌍의 ticker를 한 번에 읽을 수 있도록 하나의 Redis hash에 "BTC/KRW" 형태의 심볼로 저장
+TICKERS_KEY = "tickers"
+# 거래쌍별 마지막 체결가, field는 "{base_currency_id}:{quote_currency_id}"이며 체결이 없는 거래쌍은 빈 문자열
+LAST_PRICES_KEY = "last_prices"
+# 실시간 지표의 상태를 처음 만들 때 반영할 과거 캔들 수
+INDICATOR_WARMUP_CANDLES = 500
+# 통화, 거래쌍이 바뀌었을 때 모든 프로세스의 캐시를 비우도록 알리는 Redis pub/sub 채널
+REFERENCE_DATA_CHANNEL = "reference_data:invalidate"
+# 변경 알림을 놓친 경우에도 오래된 데이터를 계속 사용하지 않도록 일정 시간이 지나면 다시 읽음
+REFERENCE_DATA_TTL = 60 * 5
+# 가격, 수량 필드의 decimal_places, 주문 규칙은 이 자릿수만큼 곱한 정수로 검사
+ORDER_RULE_DECIMAL_PLACES = 8
+
+
+def to_units(value):
+    # Decimal을 최소 단위의 정수로 변환, 최소 단위보다 작은 자릿수가 남으면 None
+    units = value.scaleb(ORDER_RULE_DECIMAL_PLACES)
+    if units != units.to_integral_value():
+        return None
+    return int(units)
+
+
+class OrderRules:
+    # 거래쌍의 가격, 수량 규칙을 정수 단위로 미리 변환해 두어 주문마다 Decimal 나눗셈 없이 정수 연산으로 검사
+    __slots__ = ("symbol", "is_active", "min_price", "max_price", "tick_size", "min_quantity", "max_quantity", "step_size", "price_range", "tick", "quantity_range", "step")
+
+    def __init__(self, pair):
+        self.symbol = f"{pair.base_asset.symbol}/{pair.quote_asset.symbol}"
+        self.is_active = pair.is_active
+        self.min_price, self.max_price, self.tick_size = pair.min_price, pair.max_price, pair.tick_size
+        self.min_quantity, self.max_quantity, self.step_size = pair.min_quantity, pair.max_quantity, pair.step_size
+        self.price_range = (to_units(pair.min_price), to_units(pair.max_price))
+        self.tick = to_units(pair.tick_size)
+        self.quantity_range = (to_units(pair.min_quantity), to_units(pair.max_quantity))
+        self.step = to_units(pair.step_size)
+
+    def check_price(self, price):
+        # 규칙을 어긴 경우 오류 메시지를, 통과하면 None을 반환
+        units = to_units(price)
+        if units is None or not self.price_range[0] <= units <= self.price_range[1]:
+            return f"Price must be between {self.min_price} and {self.max_price}."
+        if self.tick and units % self.tick:
+            return f"Price must be a multiple of tick size {self.tick_size}."
+        return None
+
+    def check_amount(self, amount):
+        units = to_units(amount)
+        if units is None or not self.quantity_range[0] <= units <= self.quantity_range[1]:
+            return f"Amount must be between {self.min_quantity} and {self.max_quantity}."
+        if self.step and units % self.step:
+            return f"Amount must be a multiple of step size {self.step_size}."
+        return None
+
+
+class ReferenceDataCache:
+    # 거의 바뀌지 않는 통화, 거래쌍 정보를 프로세스 메모리에 저장해 주문마다 DB를 조회하지 않도록 함
+    # 전체를 두 번의 query로 한꺼번에 읽고, 변경되면 Redis pub/sub으로 모든 프로세스에 알려 비움
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = None
+        self.loaded_at = 0
+        # clear()가 호출될 때마다 증가, 읽는 도중 변경된 경우 읽은 데이터를 저장하지 않도록 함
+        self.generation = 0
+        self.listener_pid = None
+
+    def get(self):
+        self.ensure_listener()
+        data = self.data
+        if data is None or time.monotonic() - self.loaded_at > REFERENCE_DATA_TTL:
+            data = self.load()
+        return data
+
+    def load(self):
+        generation = self.generation
+        currencies = {}
+        currency_ids = {}
+        # symbol은 unique가 아니므로 기존 filter(symbol=...).first()와 같이 먼저 생성된 통화를 사용
+        for currency in CryptoCurrency.objects.order_by("id"):
+            currencies.setdefault(currency.symbol, currency)
+            currency_ids[currency.id] = currency
+        pairs = {(pair.base_asset_id, pair.quote_asset_id): pair for pair in TradingPair.objects.select_related("base_asset", "quote_asset")}
+
+        order_rules = {key: OrderRules(pair) for key, pair in pairs.items()}
+
+        data = {"currencies": currencies, "currency_ids": currency_ids, "pairs": pairs, "order_rules": order_rules}
+        with self.lock:
+            if self.generation == generation:
+                self.data = data
+                self.loaded_at = time.monotonic()
+        return data
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.data = None
+
+    def ensure_listener(self):
+        # fork된 worker 프로세스에는 thread가 복사되지 않으므로 프로세스마다 한 번 listener를 시작
+        pid = os.getpid()
+        if self.listener_pid == pid:
+            return
+        with self.lock:
+            if self.listener_pid == pid:
+                return
+            self.listener_pid = pid
+            # 부모 프로세스에서 복사된 데이터는 변경 알림을 받지 못했을 수 있으므로 버림
+            self.generation += 1
+            self.data = None
+        threading.Thread(target=self.listen, name="reference-data-listener", daemon=True).start()
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = get_redis_connection("default").pubsub()
+                pubsub.subscribe(REFERENCE_DATA_CHANNEL)
+                # 구독 확인 메시지를 받았을 때도 비워 연결이 끊긴 동안 놓친 변경을 반영
+                for _ in pubsub.listen():
+                    self.clear()
+            except Exception:
+                logger.exception("Reference data listener disconnected.")
+                self.clear()
+                time.sleep(1)
+
+
+reference_data = ReferenceDataCache()
+
+
+def get_currency(symbol):
+    return reference_data.get()["currencies"].get(symbol)
+
+
+def get_currency_by_id(currency_id):
+    return reference_data.get()["currency_ids"].get(currency_id)
+
+
+def get_trading_pair(base_currency_id, quote_currency_id):
+    return reference_data.get()["pairs"].get((base_currency_id, quote_currency_id))
+
+
+def get_order_rules(base_currency_id, quote_currency_id):
+    return reference_data.get()["order_rules"].get((base_currency_id, quote_currency_id))
+
+
+def invalidate_reference_data():
+    # 현재 프로세스는 바로 비우고, 다른 프로세스에는 commit 이후 알려 변경 전 데이터를 다시 읽지 않도록 함
+    reference_data.clear()
+    transaction.on_commit(lambda: get_redis_connection("default").publish(REFERENCE_DATA_CHANNEL, 1))
+
+
+def truncate_time(timestamp: datetime, interval: str):
+    # 체결 시간을 캔들 주기의 시작 시간으로 내림
+    if interval == "1d":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "1h":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def update_candles(trades):
+    # 체결이 정산될 때마다 1m 캔들과 이를 묶은 1h, 1d 캔들을 점진적으로 갱신
+    # trades는 체결 순서대로 전달되어야 open은 첫 체결가, close는 마지막 체결가가 됨
+    merged = {}
+    for trade in trades:
+        # 직접 생성된 Trade는 문자열 값을 가지고 있을 수 있으므로 Decimal로 변환
+        price, amount = Decimal(trade.price), Decimal(trade.amount)
+        for interval in CANDLE_INTERVALS:
+            key = (trade.base_currency_id, trade.quote_currency_id, interval, truncate_time(trade.created_at, interval))
+            candle = merged.get(key)
+            if candle is None:
+                merged[key] = Candle(
+                    base_currency_id=trade.base_currency_id,
+                    quote_currency_id=trade.quote_currency_id,
+                    interval=interval,
+                    open_time=key[3],
+                    open=price,
+                    high=price,
+                    low=price,
+                    close=price,
+                    volume=amount,
+                )
+            else:
+                candle.high = max(candle.high, price)
+                candle.low = min(candle.low, price)
+                candle.close = price
+                candle.volume += amount
+
+    if not merged:
+        return []
+
+    with transaction.atomic():
+        existing = Candle.objects.select_for_update().filter(
+            base_currency_id__in={key[0] for key in merged},
+            quote_currency_id__in={key[1] for key in merged},
+            interval__in={key[2] for key in merged},
+            open_time__in={key[3] for key in merged},
         )
-        .order_by("time_group")
+        updated = []
+        for candle in existing:
+            key = (candle.base_currency_id, candle.quote_currency_id, candle.interval, candle.open_time)
+            new_candle = merged.pop(key, None)
+            if new_candle is None:
+                continue
+            # 이미 존재하는 캔들은 open을 유지하고 이번 체결들이 더 최근이므로 close를 덮어씀
+            candle.high = max(candle.high, new_candle.high)
+            candle.low = min(candle.low, new_candle.low)
+            candle.close = new_candle.close
+            candle.volume += new_candle.volume
+            updated.append(candle)
+
+        Candle.objects.bulk_update(updated, ["high", "low", "close", "volume"])
+        created = Candle.objects.bulk_create(list(merged.values()))
+    return updated + created
+
+
+class TickerWindow:
+    # 최근 24시간 체결을 1분 단위 bucket으로 유지하며 시가, 고가, 저가, 거래량을 점진적으로 갱신
+    # 고가와 저가는 단조 deque로 관리해 오래된 bucket이 빠져도 전체 bucket을 다시 훑지 않음
+    # bucket: [시작 시간, 시가, 고가, 저가, 종가, 거래량, 거래대금]
+    def __init__(self, window=TICKER_WINDOW):
+        self.window = window
+        self.buckets = deque()
+        self.highs = deque()
+        self.lows = deque()
+        self.volume = Decimal("0")
+        self.quote_volume = Decimal("0")
+        self.last_price = None
+
+    def add_bucket(self, start, open, high, low, close, volume, quote_volume):
+        bucket = [start, open, high, low, close, volume, quote_volume]
+        self.buckets.append(bucket)
+        self.volume += volume
+        self.quote_volume += quote_volume
+        self.last_price = close
+        self._push_extremes(bucket)
+
+    def add_trade(self, timestamp, price, amount):
+        price, amount = Decimal(price), Decimal(amount)
+        start = truncate_time(timestamp, "1m")
+        if not self.buckets or self.buckets[-1][0] < start:
+            self.add_bucket(start, price, price, price, price, amount, price * amount)
+            return
+
+        bucket = self.buckets[-1]
+        if bucket[0] != start:
+            # 정산 순서 때문에 이전 bucket의 체결이 늦게 들어온 경우, 드물기 때문에 단조 deque를 다시 만듦
+            bucket = next((bucket for bucket in reversed(self.buckets) if bucket[0] <= start), None)
+            if bucket is None or bucket[0] != start:
+                return
+        bucket[2], bucket[3] = max(bucket[2], price), min(bucket[3], price)
+        if bucket is self.buckets[-1]:
+            bucket[4] = self.last_price = price
+            self._push_extremes(bucket)
+        else:
+            self.highs, self.lows = deque(), deque()
+            for existing in self.buckets:
+                self._push_extremes(existing)
+        bucket[5] += amount
+        bucket[6] += price * amount
+        self.volume += amount
+        self.quote_volume += price * amount
+
+    def _push_extremes(self, bucket):
+        # 새로 추가되거나 갱신된 bucket은 항상 가장 최근 bucket
+        while self.highs and self.highs[-1][2] <= bucket[2]:
+            self.highs.pop()
+        self.highs.append(bucket)
+        while self.lows and self.lows[-1][3] >= bucket[3]:
+            self.lows.pop()
+        self.lows.append(bucket)
+
+    def evict(self, now):
+        while self.buckets and self.buckets[0][0] <= now - self.window:
+            bucket = self.buckets.popleft()
+            self.volume -= bucket[5]
+            self.quote_volume -= bucket[6]
+            if self.highs and self.highs[0] is bucket:
+                self.highs.popleft()
+            if self.lows and self.lows[0] is bucket:
+                self.lows.popleft()
+
+    def snapshot(self, now):
+        self.evict(now)
+        if self.buckets:
+            open_price, high, low = self.buckets[0][1], self.highs[0][2], self.lows[0][3]
+        else:
+            # 24시간 동안 체결이 없다면 마지막 체결가를 유지
+            open_price = high = low = self.last_price
+        change_percent = None
+        if open_price:
+            change_percent = str(((self.last_price - open_price) / open_price * 100).quantize(Decimal("0.01")))
+        return {
+            "last_price": decimal_to_str(self.last_price),
+            "open": decimal_to_str(open_price),
+            "high": decimal_to_str(high),
+            "low": decimal_to_str(low),
+            "volume": str(self.volume),
+            "quote_volume": str(self.quote_volume),
+            "change_percent": change_percent,
+        }
+
+
+def decimal_to_str(value):
+    return None if value is None else str(value)
+
+
+def set_last_prices(prices):
+    # 체결이 commit된 이후 거래쌍별 마지막 체결가를 기록, prices는 {(base_currency_id, quote_currency_id): price}
+    if prices:
+        get_redis_connection("default").hset(LAST_PRICES_KEY, mapping={f"{base_id}:{quote_id}": str(price) for (base_id, quote_id), price in prices.items()})
+
+
+def get_last_price(base_currency_id, quote_currency_id):
+    # 마지막 체결가를 Redis에서 O(1)로 조회, Redis에 없는 경우(cold start)에만 DB에서 읽어 기록
+    redis_conn = get_redis_connection("default")
+    field = f"{base_currency_id}:{quote_currency_id}"
+    cached_price = redis_conn.hget(LAST_PRICES_KEY, field)
+    if cached_price is not None:
+        return Decimal(cached_price.decode()) if cached_price else None
+
+    # trade_pair_created_at_idx 인덱스를 역순으로 읽어 가장 최근 체결 하나만 조회
+    price = Trade.objects.filter(base_currency_id=base_currency_id, quote_currency_id=quote_currency_id).order_by("-created_at", "-id").values_list("price", flat=True).first()
+    # DB를 읽는 사이에 매칭 worker가 더 최근 체결가를 기록했을 수 있으므로 없는 경우에만 기록
+    redis_conn.hsetnx(LAST_PRICES_KEY, field, "" if price is None else str(price))
+    return price
+
+
+def get_tickers(symbol=None):
+    # 매칭 worker가 기록한 ticker를 한 번의 Redis 조회로 읽음
+    redis_conn = get_redis_connection("default")
+    if symbol is not None:
+        ticker = redis_conn.hget(TICKERS_KEY, symbol)
+        return [] if ticker is None else [json.loads(ticker)]
+    return sorted((json.loads(ticker) for ticker in redis_conn.hgetall(TICKERS_KEY).values()), key=lambda ticker: ticker["symbol"])
+
+
+def load_ticker_window(base_currency_id, quote_currency_id, now):
+    # 매칭 worker가 거래쌍을 처음 맡을 때 1분 캔들과 체결 대금 합계로 최근 24시간 bucket을 만듦
+    window = TickerWindow()
+    since = truncate_time(now - window.window, "1m")
+    quote_volumes = dict(
+        Trade.objects.filter(base_currency_id=base_currency_id, quote_currency_id=quote_currency_id, created_at__gte=since)
+        .annotate(minute=TruncMinute("created_at"))
+        .values("minute")
+        .annotate(quote_volume=Sum(F("price") * F("amount")))
+        .values_list("minute", "quote_volume")
     )
+    candles = Candle.objects.filter(base_currency_id=base_currency_id, quote_currency_id=quote_currency_id, interval="1m", open_time__gte=since).order_by("open_time")
+    for candle in candles:
+        window.add_bucket(candle.open_time, candle.open, candle.high, candle.low, candle.close, candle.volume, quote_volumes.get(candle.open_time, Decimal("0")))
 
-    candle_list = []
-    for item in aggregated:
-        candle_list.append(
-            {
-                "timestamp": item["time_group"].isoformat(),
-                "open": str(item["open_price"]),
-                "high": str(item["high_price"]),
-                "low": str(item["low_price"]),
-                "close": str(item["close_price"]),
-                "volume": str(item["volume"]),
-            }
-        )
+    if window.last_price is None:
+        window.last_price = get_last_price(base_currency_id, quote_currency_id)
+    window.evict(now)
+    return window
 
-    redis_conn.set(cache_key, json.dumps(candle_list), ex=60)
 
+def truncate_chunk(timestamp: datetime, chunk_size: timedelta):
+    # epoch 기준으로 chunk 크기에 맞춰 내림, 요청 범위와 관계없이 항상 같은 경계를 가지므로 캐시를 공유할 수 있음
+    return CANDLE_CHUNK_EPOCH + (timestamp - CANDLE_CHUNK_EPOCH) // chunk_size * chunk_size
+
+
+def serialize_candle(candle):
+    return {
+        "timestamp": candle.open_time.isoformat(),
+        "open": str(candle.open),
+        "high": str(candle.high),
+        "low": str(candle.low),
+        "close": str(candle.close),
+        "volume": str(candle.volume),
+    }
+
+
+def get_candle_data(symbol: str, start: datetime, end: datetime, interval: str):
+    if interval not in CANDLE_INTERVALS:
+        interval = "1m"
+
+    # query parameter로 전달된 시간은 timezone 정보가 없을 수 있으므로 기본 timezone(UTC)으로 간주
+    start = start if timezone.is_aware(start) else timezone.make_aware(start)
+    end = end if timezone.is_aware(end) else timezone.make_aware(end)
+
+    base, quote = symbol.split("/")
+    base_currency, quote_currency = get_currency(base), get_currency(quote)
+    base_currency_id, quote_currency_id = base_currency and base_currency.id, quote_currency and quote_currency.id
+
+    # 요청 범위를 고정된 크기의 chunk로 나누어 chunk 단위로 캐시
+    # 이미 끝난 chunk의 캔들은 더 이상 변경되지 않으므로 오래 캐시하고, 아직 진행 중인 chunk만 DB에서 읽음
+    chunk_size = CANDLE_CHUNK_SIZES[interval]
+    range_start = truncate_time(start, interval)
+    chunk_starts = []
+    chunk_start = truncate_chunk(range_start, chunk_size)
+    while chunk_start < end:
+        chunk_starts.append(chunk_start)
+        chunk_start += chunk_size
+
+    closed_before = timezone.now() - CANDLE_CACHE_GRACE
+    closed_chunk_starts = [chunk_start for chunk_start in chunk_starts if chunk_start + chunk_size <= closed_before]
+    cache_keys = {chunk_start: f"candles:{base_currency_id}:{quote_currency_id}:{interval}:{chunk_start.isoformat()}" for chunk_start in closed_chunk_starts}
+
+    redis_conn = get_redis_connection("default")
+    chunks = {}
+    if cache_keys:
+        for chunk_start, cached_data in zip(cache_keys, redis_conn.mget(cache_keys.values())):
+            if cached_data is not None:
+                chunks[chunk_start] = json.loads(cached_data)
+
+    missing_chunk_starts = [chunk_start for chunk_start in chunk_starts if chunk_start not in chunks]
+    if missing_chunk_starts:
+        # 캐시되지 않은 chunk는 한 번의 범위 조회로 읽은 뒤 chunk별로 나누어 저장
+        candles = Candle.objects.filter(
+            base_currency_id=base_currency_id,
+            quote_currency_id=quote_currency_id,
+            interval=interval,
+            open_time__gte=missing_chunk_starts[0],
+            open_time__lt=missing_chunk_starts[-1] + chunk_size,
+        ).order_by("open_time")
+
+        grouped = defaultdict(list)
+        for candle in candles:
+            grouped[truncate_chunk(candle.open_time, chunk_size)].append(serialize_candle(candle))
+
+        pipeline = redis_conn.pipeline()
+        for chunk_start in missing_chunk_starts:
+            chunks[chunk_start] = grouped.get(chunk_start, [])
+            if chunk_start in cache_keys:
+                pipeline.set(cache_keys[chunk_start], json.dumps(chunks[chunk_start]), ex=CANDLE_CACHE_TIMEOUT)
+        pipeline.execute()
+
+    # 시작 시간이 포함된 캔들부터 종료 시간 이전의 캔들까지 반환
+    candle_list = []
+    for chunk_start in chunk_starts:
+        for candle in chunks[chunk_start]:
+            if range_start <= datetime.fromisoformat(candle["timestamp"]) < end:
+                candle_list.append(candle)
     return candle_list
 
 
+def clear_candle_cache():
+    # 캔들을 다시 만들면 캔들로 계산한 지표 상태도 함께 삭제
+    redis_conn = get_redis_connection("default")
+    for pattern in ["candles:*", "indicators:*", "indicator_state:*"]:
+        for key in redis_conn.scan_iter(pattern):
+            redis_conn.delete(key)
+
+
+class RollingStats:
+    # 윈도우를 한 칸씩 밀면서 빠지는 값과 들어오는 값만 반영해 평균과 편차 제곱합을 O(1)로 갱신
+    # 제곱합에서 평균의 제곱을 빼는 방식은 가격이 클 때 오차가 커지므로 Welford 방식으로 갱신
+    # commit=False면 상태를 바꾸지 않고 값만 계산하므로 아직 진행 중인 캔들을 반복해서 반영할 수 있음
+    def __init__(self, window_size):
+        self.window_size = window_size
+        self.window = deque()
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def push(self, value, commit=True):
+        if len(self.window) < self.window_size:
+            delta = value - self.mean
+            mean = self.mean + delta / (len(self.window) + 1)
+            m2 = self.m2 + delta * (value - mean)
+        else:
+            old_value = self.window[0]
+            mean = self.mean + (value - old_value) / self.window_size
+            m2 = self.m2 + (value - old_value) * (value - mean + old_value - self.mean)
+
+        count = min(len(self.window) + 1, self.window_size)
+        if commit:
+            self.window.append(value)
+            if len(self.window) > self.window_size:
+                self.window.popleft()
+            self.mean, self.m2 = mean, m2
+
+        if count < self.window_size:
+            return None
+        return mean, math.sqrt(max(m2, 0) / self.window_size)
+
+    def to_state(self):
+        return {"window": list(self.window), "mean": self.mean, "m2": self.m2}
+
+    def from_state(self, state):
+        self.window, self.mean, self.m2 = deque(state["window"]), state["mean"], state["m2"]
+
+
+class ExponentialAverage:
+    # 처음 period개 값의 단순 평균으로 시작해 이후 값마다 지수 가중 평균을 갱신
+    def __init__(self, period):
+        self.period = period
+        self.alpha = 2 / (period + 1)
+        self.count = 0
+        self.total = 0.0
+        self.value = None
+
+    def push(self, value, commit=True):
+        if value is None:
+            return None
+
+        count, total, ema = self.count + 1, self.total, self.value
+        if count < self.period:
+            total += value
+        elif count == self.period:
+            ema = (total + value) / self.period
+        else:
+            ema += self.alpha * (value - ema)
+
+        if commit:
+            self.count, self.total, self.value = count, total, ema
+        return ema
+
+    def to_state(self):
+        return {"count": self.count, "total": self.total, "value": self.value}
+
+    def from_state(self, state):
+        self.count, self.total, self.value = state["count"], state["total"], state["value"]
+
+
+class IndicatorSet:
+    # 여러 지표를 캔들 하나씩 함께 갱신, 여러 지표가 공유하는 누적기(이동 평균, 지수 이동 평균)는 캔들마다 한 번만 갱신
+    # to_state로 누적기와 지표의 상태를 JSON으로 저장해 두면 같은 spec으로 만든 IndicatorSet에서 다음 캔들부터 이어서 계산할 수 있음
+    def __init__(self, specs):
+        self.accumulators = {}
+        self.indicators = {}
+        for spec in specs:
+            name, params = parse_indicator_spec(spec)
+            self.indicators[spec] = INDICATORS[name](self, **params)
+
+    def shared(self, key, factory):
+        # 종가를 입력으로 하는 누적기를 지표끼리 공유, 지표는 key로 이번 캔들의 누적기 값을 조회
+        if key not in self.accumulators:
+            self.accumulators[key] = factory()
+        return key
+
+    def update(self, high, low, close, volume, commit=True):
+        shared = {key: accumulator.push(close, commit) for key, accumulator in self.accumulators.items()}
+        return {spec: indicator.update(high, low, close, volume, shared, commit) for spec, indicator in self.indicators.items()}
+
+    def update_candle(self, candle, commit=True):
+        return self.update(float(candle["high"]), float(candle["low"]), float(candle["close"]), float(candle["volume"]), commit)
+
+    def to_state(self):
+        # 누적기의 key는 ("rolling_stats", 20)과 같은 tuple이므로 "rolling_stats:20" 형태의 문자열로 저장
+        # 누적기 값만 읽는 지표(ma, bollinger_bands, ema)는 자체 상태가 없음
+        return {
+            "accumulators": {":".join(map(str, key)): accumulator.to_state() for key, accumulator in self.accumulators.items()},
+            "indicators": {spec: indicator.to_state() for spec, indicator in self.indicators.items() if hasattr(indicator, "to_state")},
+        }
+
+    def from_state(self, state):
+        for key, accumulator in self.accumulators.items():
+            accumulator.from_state(state["accumulators"][":".join(map(str, key))])
+        for spec, indicator_state in state["indicators"].items():
+            self.indicators[spec].from_state(indicator_state)
+
+
+def collect_indicator_values(values):
+    # 캔들별 지표 값을 지표별 목록으로 변환, 값이 dict인 지표(bollinger_bands, macd)는 항목별 목록으로 변환
+    if values and isinstance(values[0], dict):
+        return {field: [value[field] for value in values] for field in values[0]}
+    return values
+
+
+class IndicatorSeries:
+    # 캔들 목록을 한 번만 순회하며 요청된 지표들을 함께 계산하고 계산한 지표는 spec별로 저장
+    def __init__(self, candle_list):
+        self.candle_list = candle_list
+        self.results = {}
+
+    def __len__(self):
+        return len(self.candle_list)
+
+    def compute(self, specs):
+        missing_specs = list(dict.fromkeys(spec for spec in specs if spec not in self.results))
+        if missing_specs:
+            indicator_set = IndicatorSet(missing_specs)
+            values = {spec: [] for spec in missing_specs}
+            for candle in self.candle_list:
+                for spec, value in indicator_set.update_candle(candle).items():
+                    values[spec].append(value)
+            for spec in missing_specs:
+                self.results[spec] = collect_indicator_values(values[spec])
+        return {spec: self.results[spec] for spec in specs}
+
+
+INDICATORS = {}
+
+
+def register_indicator(name):
+    # 지표 클래스를 이름으로 등록, params는 (이름, 타입, 기본값) 목록으로 spec의 ":" 뒤 값과 순서대로 대응
+    def decorator(indicator_class):
+        indicator_class.name = name
+        INDICATORS[name] = indicator_class
+        return indicator_class
+
+    return decorator
+
+
+def parse_indicator_spec(spec):
+    # "ma", "ma:50", "bollinger_bands:20:2"와 같은 spec을 지표 이름과 파라미터로 변환
+    name, *values = spec.strip().lower().split(":")
+    indicator_class = INDICATORS.get(name)
+    if indicator_class is None or len(values) > len(indicator_class.params):
+        raise ValueError(f"Invalid indicator: {spec}")
+
+    params = {}
+    for i, (param, param_type, default) in enumerate(indicator_class.params):
+        try:
+            params[param] = param_type(values[i]) if i < len(values) else default
+        except ValueError:
+            raise ValueError(f"Invalid indicator: {spec}")
+        if params[param] <= 0:
+            raise ValueError(f"Invalid indicator: {spec}")
+    return name, params
+
+
+# 지표는 update에서 캔들 하나를 반영한 값을 반환하며, commit=False면 상태를 바꾸지 않음
+@register_indicator("ma")
+class MovingAverage:
+    params = [("window_size", int, 20)]
+
+    def __init__(self, indicator_set, window_size):
+        self.stats = indicator_set.shared(("rolling_stats", window_size), lambda: RollingStats(window_size))
+
+    def update(self, high, low, close, volume, shared, commit=True):
+        stats = shared[self.stats]
+        return None if stats is None else stats[0]
+
+
+@register_indicator("bollinger_bands")
+class BollingerBands:
+    params = [("window_size", int, 20), ("std", float, 2)]
+
+    def __init__(self, indicator_set, window_size, std):
+        self.std = std
+        self.stats = indicator_set.shared(("rolling_stats", window_size), lambda: RollingStats(window_size))
+
+    def update(self, high, low, close, volume, shared, commit=True):
+        stats = shared[self.stats]
+        if stats is None:
+            return {"upper_bands": None, "middle_bands": None, "lower_bands": None}
+        ma, pstdev = stats
+        return {"upper_bands": ma + self.std * pstdev, "middle_bands": ma, "lower_bands": ma - self.std * pstdev}
+
+
+@register_indicator("ema")
+class EMA:
+    params = [("period", int, 20)]
+
+    def __init__(self, indicator_set, period):
+        self.ema = indicator_set.shared(("ema", period), lambda: ExponentialAverage(period))
+
+    def update(self, high, low, close, volume, shared, commit=True):
+        return shared[self.ema]
+
+
+@register_indicator("macd")
+class MACD:
+    params = [("fast_period", int, 12), ("slow_period", int, 26), ("signal_period", int, 9)]
+
+    def __init__(self, indicator_set, fast_period, slow_period, signal_period):
+        self.fast = indicator_set.shared(("ema", fast_period), lambda: ExponentialAverage(fast_period))
+        self.slow = indicator_set.shared(("ema", slow_period), lambda: ExponentialAverage(slow_period))
+        self.signal = ExponentialAverage(signal_period)
+
+    def update(self, high, low, close, volume, shared, commit=True):
+        fast, slow = shared[self.fast], shared[self.slow]
+        macd = None if fast is None or slow is None else fast - slow
+        signal = self.signal.push(macd, commit)
+        histogram = None if macd is None or signal is None else macd - signal
+        return {"macd": macd, "signal": signal, "histogram": histogram}
+
+    def to_state(self):
+        return {"signal": self.signal.to_state()}
+
+    def from_state(self, state):
+        self.signal.from_state(state["signal"])
+
+
+@register_indicator("rsi")
+class RSI:
+    params = [("period", int, 14)]
+
+    def __init__(self, indicator_set, period):
+        self.period = period
+        self.prev_close = None
+        self.count = 0
+        self.avg_gain = self.avg_loss = 0.0
+
+    def update(self, high, low, close, volume, shared, commit=True):
+        # 처음 period개 변화량의 평균으로 시작해 이후에는 Wilder 방식으로 평활
+        if self.prev_close is None:
+            if commit:
+                self.prev_close = close
+            return None
+
+        change = close - self.prev_close
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        count = self.count + 1
+        if count <= self.period:
+            avg_gain, avg_loss = self.avg_gain + gain / self.period, self.avg_loss + loss / self.period
+        else:
+            avg_gain = (self.avg_gain * (self.period - 1) + gain) / self.period
+            avg_loss = (self.avg_loss * (self.period - 1) + loss) / self.period
+
+        if commit:
+            self.prev_close, self.count, self.avg_gain, self.avg_loss = close, count, avg_gain, avg_loss
+
+        if count < self.period:
+            return None
+        if avg_loss == 0:
+            return 50.0 if avg_gain == 0 else 100.0
+        return 100 - 100 / (1 + avg_gain / avg_loss)
+
+    def to_state(self):
+        return {"prev_close": self.prev_close, "count": self.count, "avg_gain": self.avg_gain, "avg_loss": self.avg_loss}
+
+    def from_state(self, state):
+        self.prev_close, self.count, self.avg_gain, self.avg_loss = state["prev_close"], state["count"], state["avg_gain"], state["avg_loss"]
+
+
+@register_indicator("vwap")
+class VWAP:
+    params = []
+
+    def __init__(self, indicator_set):
+        self.price_volume = self.volume = 0.0
+
+    def update(self, high, low, close, volume, shared, commit=True):
+        # 계산 시작부터 누적한 (고가 + 저가 + 종가) / 3의 거래량 가중 평균
+        price_volume = self.price_volume + (high + low + close) / 3 * volume
+        total_volume = self.volume + volume
+        if commit:
+            self.price_volume, self.volume = price_volume, total_volume
+        return price_volume / total_volume if total_volume else None
+
+    def to_state(self):
+        return {"price_volume": self.price_volume, "volume": self.volume}
+
+    def from_state(self, state):
+        self.price_volume, self.volume = state["price_volume"], state["volume"]
+
+
+@register_indicator("atr")
+class ATR:
+    params = [("period", int, 14)]
+
+    def __init__(self, indicator_set, period):
+        self.period = period
+        self.prev_close = None
+        self.count = 0
+        self.value = 0.0
+
+    def update(self, high, low, close, volume, shared, commit=True):
+        if self.prev_close is None:
+            true_range = high - low
+        else:
+            true_range = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+
+        count = self.count + 1
+        if count <= self.period:
+            value = self.value + true_range / self.period
+        else:
+            value = (self.value * (self.period - 1) + true_range) / self.period
+
+        if commit:
+            self.prev_close, self.count, self.value = close, count, value
+        return value if count >= self.period else None
+
+    def to_state(self):
+        return {"prev_close": self.prev_close, "count": self.count, "value": self.value}
+
+    def from_state(self, state):
+        self.prev_close, self.count, self.value = state["prev_close"], state["count"], state["value"]
+
+
+def as_indicator_series(candle_list):
+    return candle_list if isinstance(candle_list, IndicatorSeries) else IndicatorSeries(candle_list)
+
+
 def calculate_ma(candle_list, window_size=20):
-    mas = []
-    for i in range(len(candle_list)):
-        if i < window_size - 1:
-            mas.append(None)
-            continue
-        window = candle_list[i - window_size + 1 : i + 1]
-        closes = [float(candle["close"]) for candle in window]
-        ma = sum(closes) / window_size
-        mas.append(ma)
-    return mas
+    return as_indicator_series(candle_list).compute([f"ma:{window_size}"])[f"ma:{window_size}"]
 
 
 def calculate_bollinger_bands(candle_list, window_size=20, std=2):
-    mas = calculate_ma(candle_list, window_size)
-    upper_bands, lower_bands = [], []
-    for i in range(len(candle_list)):
-        if i < window_size - 1:
-            upper_bands.append(None)
-            lower_bands.append(None)
-            continue
-        window = candle_list[i - window_size + 1 : i + 1]
-        closes = [float(c["close"]) for c in window]
-        pstdev = statistics.pstdev(closes)
-        mb = mas[i]
-        ub, lb = mb + std * pstdev, mb - std * pstdev
-        upper_bands.append(ub)
-        lower_bands.append(lb)
-    return {"upper_bands": upper_bands, "middle_bands": mas, "lower_bands": lower_bands}
+    spec = f"bollinger_bands:{window_size}:{std}"
+    return as_indicator_series(candle_list).compute([spec])[spec]
+
+
+def load_indicator_state(cached_data):
+    # JSON으로 읽을 수 없는 상태(이전 형식으로 저장된 값 등)는 없는 것으로 보고 처음부터 다시 계산
+    if cached_data is None:
+        return None
+    try:
+        return json.loads(cached_data)
+    except ValueError:
+        return None
+
+
+def calculate_indicators(symbol, interval, candle_list, specs):
+    # 종목, 주기, 지표 조합별로 누적기 상태와 마감된 캔들의 지표 값을 저장해 두고, 요청마다 새로 마감된 캔들만 상태에 반영
+    # 상태는 처음 계산한 구간의 시작부터 이어지므로 시작 시간을 옮겨 가며 조회해도 같은 상태를 사용하며, 새로 마감된 캔들이 있을 때만 기록
+    # 마지막 캔들은 아직 진행 중일 수 있으므로 상태에 반영하지 않고 값만 계산
+    if not candle_list:
+        return IndicatorSeries(candle_list).compute(specs)
+
+    specs = list(dict.fromkeys(specs))
+    cache_key = f"indicators:{symbol}:{interval}:{','.join(specs)}"
+    values_key = f"{cache_key}:values"
+    redis_conn = get_redis_connection("default")
+
+    checkpoint = load_indicator_state(redis_conn.get(cache_key))
+    indicator_set = IndicatorSet(specs)
+    values = []
+    if checkpoint is not None:
+        # 요청 구간이 상태의 시작보다 앞서거나 마지막으로 반영한 캔들 이후에 시작하면 이어서 계산할 수 없으므로 구간만 계산
+        start, committed_until = datetime.fromisoformat(checkpoint["start"]), datetime.fromisoformat(checkpoint["timestamp"])
+        if datetime.fromisoformat(candle_list[0]["timestamp"]) < start or datetime.fromisoformat(candle_list[0]["timestamp"]) > committed_until:
+            return IndicatorSeries(candle_list).compute(specs)
+        timestamps = [candle["timestamp"] for candle in candle_list if datetime.fromisoformat(candle["timestamp"]) <= committed_until]
+        cached_values = redis_conn.hmget(values_key, timestamps)
+        # 캔들을 다시 만들어 저장된 값이 없는 캔들이 있다면 구간만 계산
+        if None in cached_values:
+            return IndicatorSeries(candle_list).compute(specs)
+        values = [json.loads(value) for value in cached_values]
+        if len(values) == len(candle_list):
+            return {spec: collect_indicator_values([value[spec] for value in values]) for spec in specs}
+        indicator_set.from_state(checkpoint["state"])
+    else:
+        checkpoint = {"start": candle_list[0]["timestamp"]}
+
+    new_candles = candle_list[len(values) : -1]
+    if new_candles:
+        new_values = [indicator_set.update_candle(candle) for candle in new_candles]
+        values += new_values
+        checkpoint = {**checkpoint, "state": indicator_set.to_state(), "timestamp": new_candles[-1]["timestamp"]}
+        pipeline = redis_conn.pipeline()
+        pipeline.hset(values_key, mapping={candle["timestamp"]: json.dumps(value) for candle, value in zip(new_candles, new_values)})
+        pipeline.expire(values_key, INDICATOR_CACHE_TIMEOUT)
+        pipeline.set(cache_key, json.dumps(checkpoint), ex=INDICATOR_CACHE_TIMEOUT)
+        pipeline.execute()
+
+    values = values + [indicator_set.update_candle(candle_list[-1], commit=False)]
+    return {spec: collect_indicator_values([value[spec] for value in values]) for spec in specs}
+
+
+def update_live_indicators(candle, specs):
+    # 체결로 갱신된 최신 캔들에 대한 지표 값을 계산, 이전 캔들까지의 상태는 지표별로 저장해 두고 최신 캔들은 상태에 반영하지 않음
+    # 새 캔들이 시작되면 이전 캔들들을 한 번 읽어 상태에 반영하므로 체결마다 드는 비용은 O(1)
+    base_currency_id, quote_currency_id, interval = candle.base_currency_id, candle.quote_currency_id, candle.interval
+    cache_keys = [f"indicator_state:{base_currency_id}:{quote_currency_id}:{interval}:{spec}" for spec in specs]
+    redis_conn = get_redis_connection("default")
+
+    # 지표별 상태가 같은 시점까지 반영되어 있다면 마감된 캔들 조회를 공유
+    closed_candles = {}
+
+    def get_closed_candles(committed_until):
+        if committed_until not in closed_candles:
+            candles = Candle.objects.filter(base_currency_id=base_currency_id, quote_currency_id=quote_currency_id, interval=interval, open_time__lt=candle.open_time)
+            if committed_until is None:
+                candles = candles.order_by("-open_time")[:INDICATOR_WARMUP_CANDLES]
+                closed_candles[committed_until] = [serialize_candle(closed_candle) for closed_candle in reversed(candles)]
+            else:
+                candles = candles.filter(open_time__gte=committed_until).order_by("open_time")
+                closed_candles[committed_until] = [serialize_candle(closed_candle) for closed_candle in candles]
+        return closed_candles[committed_until]
+
+    results, changed_states = {}, {}
+    for spec, cache_key, cached_data in zip(specs, cache_keys, redis_conn.mget(cache_keys)):
+        state = load_indicator_state(cached_data)
+        indicator_set = IndicatorSet([spec])
+        committed_until = None
+        if state is not None and datetime.fromisoformat(state["committed_until"]) <= candle.open_time:
+            indicator_set.from_state(state["state"])
+            committed_until = datetime.fromisoformat(state["committed_until"])
+        # 상태가 없다면 최근 캔들들로 상태를 초기화하고, 새 캔들이 시작되었다면 그 사이에 마감된 캔들을 상태에 반영
+        if committed_until != candle.open_time:
+            for closed_candle in get_closed_candles(committed_until):
+                indicator_set.update_candle(closed_candle)
+            changed_states[cache_key] = {"state": indicator_set.to_state(), "committed_until": candle.open_time.isoformat()}
+
+        results[spec] = indicator_set.update_candle(serialize_candle(candle), commit=False)[spec]
+
+    if changed_states:
+        redis_conn.mset({cache_key: json.dumps(state) for cache_key, state in changed_states.items()})
+    return results
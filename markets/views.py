@@ -7,7 +7,7 @@ from rest_framework.views import APIView
 
 from .models import CryptoCurrency, TradingPair
 from .serializers import CryptoCurrencySerializer, TradingPairSerializer
-from .utils import get_candle_data, calculate_ma, calculate_bollinger_bands
+from .utils import calculate_indicators, get_candle_data, get_currency, get_tickers, parse_indicator_spec
 
 
 # ModelViewSet은 Django의 View와 유사하며 Model을 기반으로 CRUD(Create, Read, Update, Delete) API를 자동으로 생성해준다.
@@ -31,7 +31,6 @@ class TradingPairViewSet(viewsets.ModelViewSet):
 
 class ChartDataView(APIView):
     permission_classes = [IsAuthenticated]
-    valid_indicators = {"ma": calculate_ma, "bollinger_bands": calculate_bollinger_bands}
 
     def get(self, request):
         symbol = request.query_params.get("symbol")
@@ -39,7 +38,7 @@ class ChartDataView(APIView):
             return Response({"error": "Missing required query parameters"}, status=status.HTTP_400_BAD_REQUEST)
 
         base, quote = symbol.split("/")
-        if not CryptoCurrency.objects.filter(symbol=base).exists() or not CryptoCurrency.objects.filter(symbol=quote).exists():
+        if get_currency(base) is None or get_currency(quote) is None:
             return Response({"error": "Invalid symbol"}, status=status.HTTP_400_BAD_REQUEST)
 
         start = request.query_params.get("start")
@@ -61,11 +60,25 @@ class ChartDataView(APIView):
 
         indicators = request.query_params.get("indicators")
         if indicators:
+            # indicators=ma:50,bollinger_bands:20:2,rsi와 같이 지표별 파라미터를 ":"로 구분해 전달
             indicators_list = [indicator.strip().lower() for indicator in indicators.split(",") if indicator.strip()]
             for indicator in indicators_list:
-                if indicator in self.valid_indicators:
-                    result["indicators"][indicator] = self.valid_indicators[indicator](candle_data)
-                else:
-                    return Response({"error": f"Invalid indicator: {indicator}"}, status=status.HTTP_400_BAD_REQUEST)
+                try:
+                    parse_indicator_spec(indicator)
+                except ValueError as e:
+                    return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            result["indicators"] = calculate_indicators(symbol, interval, candle_data, indicators_list)
 
         return Response(result, status=status.HTTP_200_OK)
+
+
+class TickerView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        # symbol이 없다면 모든 거래쌍의 ticker를 반환
+        symbol = request.query_params.get("symbol")
+        tickers = get_tickers(symbol)
+        if symbol is not None and not tickers:
+            return Response({"error": "Invalid symbol"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(tickers[0] if symbol is not None else tickers, status=status.HTTP_200_OK)
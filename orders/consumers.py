@@ -1,23 +1,338 @@
+import asyncio
 import json
+import re
+from decimal import Decimal
+from urllib.parse import parse_qs
 
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django_redis import get_redis_connection
+
+from markets.utils import CANDLE_INTERVALS, parse_indicator_spec
+
+
+# 하나의 연결에서 구독할 수 있는 최대 stream 수
+STREAM_MAX_SUBSCRIPTIONS = 100
+STREAM_CHANNELS = ["trades", "depth", "ticker", "candles", "indicators"]
+SYMBOL_PATTERN = re.compile(r"^\w{1,32}$")
+
+
+def get_depth_snapshot(symbol):
+    # 매칭 worker가 Redis에 기록한 호가 snapshot과 순번(seq)을 한 번에 읽음
+    pipeline = get_redis_connection("default").pipeline()
+    pipeline.hgetall(f"depth:{symbol}:bids")
+    pipeline.hgetall(f"depth:{symbol}:asks")
+    pipeline.get(f"depth:{symbol}:seq")
+    bids, asks, seq = pipeline.execute()
+
+    def sort_levels(levels, reverse):
+        return sorted(([price.decode(), size.decode()] for price, size in levels.items()), key=lambda level: Decimal(level[0]), reverse=reverse)
+
+    return {"type": "snapshot", "seq": int(seq or 0), "bids": sort_levels(bids, True), "asks": sort_levels(asks, False)}
+
+
+def merge_depth(old, new):
+    # 아직 전송하지 않은 호가 변경에 새 변경을 합침, 가격별로 마지막 수량만 남김
+    if old["type"] == "snapshot":
+        merged = {"type": "snapshot", "seq": new["seq"]}
+        for side in ["bids", "asks"]:
+            levels = {price: size for price, size in old[side]}
+            levels.update(new[side])
+            levels = [[price, size] for price, size in levels.items() if Decimal(size) != 0]
+            merged[side] = sorted(levels, key=lambda level: Decimal(level[0]), reverse=side == "bids")
+        return merged
+    return {"type": "delta", "prev_seq": old["prev_seq"], "seq": new["seq"], "bids": {**old["bids"], **new["bids"]}, "asks": {**old["asks"], **new["asks"]}}
+
+
+def indicator_subscriptions_key(symbol, interval):
+    return f"indicators:subscriptions:{symbol}:{interval}"
+
+
+def subscribe_indicators(symbol, interval, specs):
+    # 지표별 구독자 수를 기록해 매칭 worker가 구독 중인 지표만 계산하도록 함
+    pipeline = get_redis_connection("default").pipeline()
+    for spec in specs:
+        pipeline.hincrby(indicator_subscriptions_key(symbol, interval), spec, 1)
+    pipeline.execute()
+
+
+def unsubscribe_indicators(symbol, interval, specs):
+    redis_conn = get_redis_connection("default")
+    key = indicator_subscriptions_key(symbol, interval)
+    for spec in specs:
+        if redis_conn.hincrby(key, spec, -1) <= 0:
+            redis_conn.hdel(key, spec)
+
+
+def wrap_envelope(envelope, text):
+    # 이미 직렬화된 메시지를 다시 직렬화하지 않고 envelope의 data로 감쌈
+    if envelope is None:
+        return text
+    return json.dumps(envelope)[:-1] + ', "data": ' + text + "}"
+
+
+class BufferedWebsocketConsumer(AsyncWebsocketConsumer):
+    # 연결마다 전송할 메시지를 stream(key)별로 모아 두었다가 send_interval마다 한 번에 전송
+    # 느린 client가 있어도 stream별로 아래 방식에 따라 합쳐지므로 버퍼가 일정 크기 이상 커지지 않음
+    # latest: 마지막 메시지만 유지, append: 메시지를 이어 붙이되 max_buffered_frames개를 넘으면 오래된 것부터 버림
+    # merge: merge 함수로 이전 메시지와 합침
+    # 메시지는 보내는 쪽에서 한 번만 직렬화한 text로 받아 합칠 필요가 없다면 그대로 전송
+    send_interval = 0.05
+    max_buffered_frames = 100
+
+    async def websocket_connect(self, message):
+        self.send_buffer = {}
+        self.flush_task = None
+        await super().websocket_connect(message)
+
+    async def websocket_disconnect(self, message):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        await super().websocket_disconnect(message)
+
+    def buffer_send(self, key, text=None, policy="latest", data=None, merge=None, envelope=None):
+        # envelope가 있다면 전송할 때 {**envelope, "data": 메시지} 형태로 감싸서 전송
+        entry = self.send_buffer.get(key)
+        if policy == "append":
+            if entry is None:
+                entry = self.send_buffer[key] = {"policy": policy, "texts": [], "envelope": envelope}
+            entry["texts"].append(text)
+            del entry["texts"][: -self.max_buffered_frames]
+        elif policy == "merge" and entry is not None:
+            entry["data"] = merge(entry["data"], data)
+            entry["texts"] = []
+        else:
+            self.send_buffer[key] = {"policy": policy, "texts": [text] if text is not None else [], "data": data, "envelope": envelope}
+
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_send_buffer())
+
+    def discard_buffered(self, key):
+        self.send_buffer.pop(key, None)
+
+    async def flush_send_buffer(self):
+        await asyncio.sleep(self.send_interval)
+        entries, self.send_buffer, self.flush_task = self.send_buffer, {}, None
+        for entry in entries.values():
+            texts = entry["texts"]
+            if entry["policy"] == "append":
+                # 같은 stream의 JSON 배열 메시지는 다시 직렬화하지 않고 문자열로 이어 붙임
+                text = texts[0] if len(texts) == 1 else "[" + ",".join(text[1:-1] for text in texts if text != "[]") + "]"
+            else:
+                text = texts[0] if texts else json.dumps(entry["data"])
+            await self.send(text_data=wrap_envelope(entry["envelope"], text))
 
 
 # AsyncWebsocketConsumer는 WebSocket 연결을 처리하는 클래스
 # connect, disconnect, receive 메서드를 오버라이드하여 WebSocket 연결을 처리
-class TradeConsumer(AsyncWebsocketConsumer):
+# BufferedWebsocketConsumer는 AsyncWebsocketConsumer에 연결별 전송 버퍼를 추가
+class TradeConsumer(BufferedWebsocketConsumer):
     async def connect(self):
         self.symbol = self.scope["url_route"]["kwargs"]["symbol"]
         self.group_name = f"orders_{self.symbol}"
         await self.channel_layer.group_add(self.group_name, self.channel_name)
+
+        # ws/orders/BTCKRW/?interval=1m&indicators=rsi:14,ma:20와 같이 연결하면 체결과 함께 최신 캔들의 지표 값을 받음
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        self.interval = query.get("interval", ["1m"])[0]
+        self.indicators = [indicator.strip().lower() for indicator in query.get("indicators", [""])[0].split(",") if indicator.strip()]
+        try:
+            for indicator in self.indicators:
+                parse_indicator_spec(indicator)
+        except ValueError:
+            self.indicators = []
+        if self.interval not in CANDLE_INTERVALS:
+            self.indicators = []
+
+        if self.indicators:
+            self.indicator_group_name = f"indicators_{self.symbol}_{self.interval}"
+            await self.channel_layer.group_add(self.indicator_group_name, self.channel_name)
+            await sync_to_async(subscribe_indicators)(self.symbol, self.interval, self.indicators)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if self.indicators:
+            await self.channel_layer.group_discard(self.indicator_group_name, self.channel_name)
+            await sync_to_async(unsubscribe_indicators)(self.symbol, self.interval, self.indicators)
+
+    async def receive(self, text_data):
+        pass
+
+    async def send_trade_data(self, event):
+        # 체결 목록은 빠짐없이 전송해야 하므로 이어 붙여서 하나의 frame으로 전송
+        self.buffer_send("trades", event["text"], policy="append")
+
+    async def send_indicator_data(self, event):
+        # 같은 그룹에 다른 지표를 구독한 연결이 있으므로 자신이 구독한 지표만 전송, 최신 값만 의미가 있으므로 마지막 값만 유지
+        indicator_data = event["data"]
+        values = {indicator: indicator_data["indicators"][indicator] for indicator in self.indicators if indicator in indicator_data["indicators"]}
+        if values:
+            self.buffer_send("indicators", data={**indicator_data, "indicators": values})
+
+
+class DepthConsumer(BufferedWebsocketConsumer):
+    # 연결하면 호가 snapshot을 보내고 이후에는 순번(seq)이 붙은 가격별 수량 변경을 전송
+    # 변경은 send_interval 동안 모아 가격별로 합치므로 느린 client에도 변경이 무한히 쌓이지 않음
+    send_interval = 0.1
+
+    async def connect(self):
+        self.symbol = self.scope["url_route"]["kwargs"]["symbol"]
+        self.group_name = f"depth_{self.symbol}"
+        # snapshot을 읽기 전에 group에 참여해야 그 사이의 변경을 놓치지 않음, snapshot 이전 seq의 변경은 무시
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
 
+        snapshot = await sync_to_async(get_depth_snapshot)(self.symbol)
+        self.seq = snapshot["seq"]
+        await self.send(text_data=json.dumps(snapshot))
+
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
     async def receive(self, text_data):
         pass
 
+    async def send_depth_data(self, event):
+        depth_data = event["data"]
+        if depth_data["seq"] <= self.seq:
+            return
+
+        if depth_data["type"] == "snapshot":
+            # 매칭 worker가 호가창을 새로 만든 경우이므로 쌓여 있던 변경을 버리고 snapshot으로 교체
+            self.discard_buffered("depth")
+        self.seq = depth_data["seq"]
+        # 합쳐진 변경도 첫 변경의 prev_seq를 유지하므로 client는 변경이 빠짐없이 이어지는지 확인할 수 있음
+        self.buffer_send("depth", event["text"], policy="merge", data=depth_data, merge=merge_depth)
+
+
+class StreamConsumer(BufferedWebsocketConsumer):
+    # 하나의 연결에서 여러 거래쌍의 체결, 호가, ticker, 캔들, 지표를 구독
+    # client는 {"action": "subscribe" | "unsubscribe", "channel": ..., "symbol": "BTCKRW", "interval": "1m", "indicators": [...]}를 전송
+    # 모든 메시지는 {"channel": ..., "symbol": ..., "data": ...} 형태로 전송
+    async def connect(self):
+        # subscriptions: (channel, symbol[, interval]) -> 구독한 지표 목록(indicators 외에는 None)
+        self.subscriptions = {}
+        self.depth_seqs = {}
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        for key in list(self.subscriptions):
+            await self.unsubscribe(key)
+
+    async def receive(self, text_data):
+        try:
+            message = json.loads(text_data)
+            action = message.get("action")
+            key = self.subscription_key(message)
+            if action == "subscribe":
+                await self.subscribe(key, message)
+            elif action == "unsubscribe":
+                if key in self.subscriptions:
+                    await self.unsubscribe(key)
+                await self.send(text_data=json.dumps({"type": "unsubscribed", **self.describe(key)}))
+            else:
+                raise ValueError("Invalid action")
+        except (ValueError, AttributeError) as e:
+            await self.send(text_data=json.dumps({"type": "error", "message": str(e)}))
+
+    def subscription_key(self, message):
+        channel, symbol = message.get("channel"), message.get("symbol")
+        if channel not in STREAM_CHANNELS:
+            raise ValueError("Invalid channel")
+        if not isinstance(symbol, str) or not SYMBOL_PATTERN.match(symbol):
+            raise ValueError("Invalid symbol")
+        if channel in ["candles", "indicators"]:
+            interval = message.get("interval", "1m")
+            if interval not in CANDLE_INTERVALS:
+                raise ValueError("Invalid interval")
+            return (channel, symbol, interval)
+        return (channel, symbol)
+
+    @staticmethod
+    def describe(key):
+        return dict(zip(["channel", "symbol", "interval"], key))
+
+    @staticmethod
+    def group_name(key):
+        channel, symbol, *interval = key
+        if channel == "trades":
+            return f"orders_{symbol}"
+        if channel in ["depth", "ticker"]:
+            return f"{channel}_{symbol}"
+        return f"{channel}_{symbol}_{interval[0]}"
+
+    async def subscribe(self, key, message):
+        channel, symbol, *interval = key
+        specs = None
+        if channel == "indicators":
+            specs = message.get("indicators")
+            if not isinstance(specs, list) or not specs:
+                raise ValueError("Invalid indicators")
+            specs = list(dict.fromkeys(str(spec).strip().lower() for spec in specs))
+            for spec in specs:
+                parse_indicator_spec(spec)
+            # 같은 거래쌍과 주기의 지표를 다시 구독하면 이전 구독을 교체
+            if key in self.subscriptions:
+                await self.unsubscribe(key)
+        elif key in self.subscriptions:
+            await self.send(text_data=json.dumps({"type": "subscribed", **self.describe(key)}))
+            return
+
+        if len(self.subscriptions) >= STREAM_MAX_SUBSCRIPTIONS:
+            raise ValueError("Too many subscriptions")
+
+        await self.channel_layer.group_add(self.group_name(key), self.channel_name)
+        self.subscriptions[key] = specs
+        if specs:
+            await sync_to_async(subscribe_indicators)(symbol, interval[0], specs)
+        await self.send(text_data=json.dumps({"type": "subscribed", **self.describe(key)}))
+
+        if channel == "depth":
+            # 호가는 구독 직후 snapshot을 보내고 이후에는 snapshot보다 큰 seq의 변경만 전송
+            snapshot = await sync_to_async(get_depth_snapshot)(symbol)
+            self.depth_seqs[symbol] = snapshot["seq"]
+            await self.send(text_data=wrap_envelope(self.describe(key), json.dumps(snapshot)))
+
+    async def unsubscribe(self, key):
+        specs = self.subscriptions.pop(key)
+        await self.channel_layer.group_discard(self.group_name(key), self.channel_name)
+        self.discard_buffered(key)
+        if key[0] == "depth":
+            self.depth_seqs.pop(key[1], None)
+        if specs:
+            await sync_to_async(unsubscribe_indicators)(key[1], key[2], specs)
+
     async def send_trade_data(self, event):
-        trade_data = event["data"]
-        await self.send(text_data=json.dumps(trade_data))
+        key = ("trades", event["symbol"])
+        if key in self.subscriptions:
+            self.buffer_send(key, event["text"], policy="append", envelope=self.describe(key))
+
+    async def send_depth_data(self, event):
+        key = ("depth", event["symbol"])
+        depth_data = event["data"]
+        if key not in self.subscriptions or depth_data["seq"] <= self.depth_seqs[event["symbol"]]:
+            return
+        if depth_data["type"] == "snapshot":
+            self.discard_buffered(key)
+        self.depth_seqs[event["symbol"]] = depth_data["seq"]
+        self.buffer_send(key, event["text"], policy="merge", data=depth_data, merge=merge_depth, envelope=self.describe(key))
+
+    async def send_ticker_data(self, event):
+        key = ("ticker", event["symbol"])
+        if key in self.subscriptions:
+            self.buffer_send(key, event["text"], envelope=self.describe(key))
+
+    async def send_candle_data(self, event):
+        key = ("candles", event["symbol"], event["interval"])
+        if key in self.subscriptions:
+            self.buffer_send(key, event["text"], envelope=self.describe(key))
+
+    async def send_indicator_data(self, event):
+        indicator_data = event["data"]
+        key = ("indicators", event["symbol"], indicator_data["interval"])
+        specs = self.subscriptions.get(key)
+        if specs:
+            values = {spec: indicator_data["indicators"][spec] for spec in specs if spec in indicator_data["indicators"]}
+            if values:
+                self.buffer_send(key, data={**indicator_data, "indicators": values}, envelope=self.describe(key))
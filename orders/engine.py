@@ -0,0 +1,244 @@
+import bisect
+from collections import OrderedDict, namedtuple
+from decimal import Decimal, ROUND_DOWN
+
+# Order.amount의 decimal_places와 동일한 최소 수량 단위
+AMOUNT_QUANTUM = Decimal("0.00000001")
+
+# 매칭 결과 하나를 나타내는 값 객체, side는 taker(새로 들어온 주문)의 방향
+Fill = namedtuple("Fill", ["taker_id", "maker_id", "side", "price", "amount"])
+
+
+class BookOrder:
+    # 호가창에 올라가는 주문은 수가 많으므로 __slots__로 인스턴스 메모리를 줄임
+    __slots__ = ("id", "side", "price", "amount")
+
+    def __init__(self, order_id, side, price, amount):
+        self.id = order_id
+        self.side = side
+        self.price = price
+        self.amount = amount
+
+
+class BookSide:
+    # 한쪽(매수 혹은 매도) 호가를 관리
+    # prices: 오름차순으로 정렬된 가격 목록, bisect로 O(log n) 탐색
+    # levels: 가격별 주문 큐, OrderedDict를 사용해 FIFO 순서를 유지하면서 주문 id로 O(1) 삭제 가능
+    # sizes: 가격별 남은 수량의 합, 호가 depth를 전송할 때 가격대의 주문을 다시 더하지 않도록 함께 관리
+    # changed: 마지막으로 depth를 전송한 이후 수량이 바뀐 가격 목록
+    def __init__(self, descending=False):
+        self.descending = descending
+        self.prices = []
+        self.levels = {}
+        self.sizes = {}
+        self.changed = set()
+
+    def __len__(self):
+        return len(self.prices)
+
+    def best_price(self):
+        if not self.prices:
+            return None
+        return self.prices[-1] if self.descending else self.prices[0]
+
+    def add(self, entry):
+        level = self.levels.get(entry.price)
+        if level is None:
+            level = self.levels[entry.price] = OrderedDict()
+            bisect.insort(self.prices, entry.price)
+            self.sizes[entry.price] = 0
+        level[entry.id] = entry
+        self.sizes[entry.price] += entry.amount
+        self.changed.add(entry.price)
+
+    def remove(self, entry):
+        level = self.levels[entry.price]
+        del level[entry.id]
+        self.sizes[entry.price] -= entry.amount
+        self.changed.add(entry.price)
+        if not level:
+            del self.levels[entry.price]
+            del self.sizes[entry.price]
+            del self.prices[bisect.bisect_left(self.prices, entry.price)]
+
+    def reduce(self, entry, amount):
+        # 일부 체결된 주문의 남은 수량을 줄임, 모두 체결되면 호가에서 제거
+        if amount == entry.amount:
+            self.remove(entry)
+            entry.amount = 0
+            return
+        entry.amount -= amount
+        self.sizes[entry.price] -= amount
+        self.changed.add(entry.price)
+
+    def depth(self):
+        # 가격 우선순위 순서의 (가격, 수량) 목록
+        prices = reversed(self.prices) if self.descending else self.prices
+        return [(price, self.sizes[price]) for price in prices]
+
+    def pop_changes(self):
+        # 바뀐 가격별 현재 수량, 호가에서 사라진 가격은 0
+        changes = {price: self.sizes.get(price, 0) for price in self.changed}
+        self.changed = set()
+        return changes
+
+    def head(self, price):
+        # 해당 가격대에서 가장 먼저 들어온 주문
+        return next(iter(self.levels[price].values()))
+
+
+class TimeWheel:
+    # 만료 시간이 있는 주문을 초 단위 slot으로 나누어 저장하는 hashed time wheel
+    # 매 tick마다 지난 slot만 확인하므로 만료된 주문을 찾기 위해 전체 주문을 확인하지 않음
+    # size보다 먼 만료 시간은 같은 slot에 저장되며, slot을 확인할 때 만료 시간이 지난 주문만 꺼냄
+    def __init__(self, size=3600):
+        self.size = size
+        self.slots = [{} for _ in range(size)]
+        self.current = None
+
+    def add(self, order_id, expires_at):
+        # expires_at: epoch 초
+        tick = int(expires_at)
+        if self.current is not None and tick <= self.current:
+            # 이미 지난 slot에 넣으면 한 바퀴를 돌 때까지 확인하지 않으므로 다음 tick에 만료
+            tick = self.current + 1
+        self.slots[tick % self.size][order_id] = tick
+
+    def advance(self, now):
+        # now까지 만료된 주문 id 목록, 처음 호출하거나 size 이상 지났다면 모든 slot을 한 번씩 확인
+        tick = int(now)
+        start = tick - self.size + 1 if self.current is None else max(self.current + 1, tick - self.size + 1)
+        expired = []
+        for current in range(start, tick + 1):
+            slot = self.slots[current % self.size]
+            for order_id, expires_at in list(slot.items()):
+                if expires_at <= tick:
+                    expired.append(order_id)
+                    del slot[order_id]
+        self.current = tick
+        return expired
+
+
+class OrderBook:
+    # 거래쌍 하나에 대한 가격-시간 우선순위 호가창
+    # DB는 영속성 계층으로만 사용하고 매칭은 메모리 위에서 주문이 들어올 때마다 점진적으로 수행
+    def __init__(self, key):
+        self.key = key
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide()
+        self.orders = {}
+        # DB의 미체결 주문 전체를 읽었는지 여부, 이후에는 commit된 새 주문만 읽음
+        self.loaded = False
+        # 새로 만든 호가창은 이전에 전송한 depth와 이어지지 않으므로 다음 전송 시 전체 snapshot을 다시 보냄
+        self.depth_reset = True
+        # GTD 주문의 만료 시간, 체결되거나 취소된 주문은 지우지 않고 만료 시 호가창에 없으면 무시
+        self.expiries = TimeWheel()
+
+    def __contains__(self, order_id):
+        return order_id in self.orders
+
+    def side_of(self, side):
+        return self.bids if side == "buy" else self.asks
+
+    def best_bid(self):
+        return self.bids.best_price()
+
+    def best_ask(self):
+        return self.asks.best_price()
+
+    @staticmethod
+    def crosses(side, limit_price, best_price):
+        if side == "buy":
+            return limit_price >= best_price
+        return limit_price <= best_price
+
+    def submit(self, order_id, side, price, amount, time_in_force="GTC", post_only=False, expires_at=None):
+        # 새 지정가 주문을 반대편 호가와 매칭하고 남은 수량은 호가창에 올림
+        # IOC, FOK 주문과 교차하는 post-only 주문은 호가창에 올리지 않으므로 남은 수량은 호출한 쪽에서 취소
+        opposite = self.asks if side == "buy" else self.bids
+        best_price = opposite.best_price()
+        crosses = best_price is not None and self.crosses(side, price, best_price)
+        if post_only and crosses:
+            return []
+        if time_in_force == "FOK" and self.fillable(side, price, amount) < amount:
+            return []
+
+        fills, amount = self.match(order_id, side, price, amount)
+        if amount > 0 and time_in_force in ("GTC", "GTD"):
+            entry = BookOrder(order_id, side, price, amount)
+            self.side_of(side).add(entry)
+            self.orders[order_id] = entry
+            if expires_at is not None:
+                self.expiries.add(order_id, expires_at)
+        return fills
+
+    def fillable(self, side, price, amount):
+        # 지정가 안에서 바로 체결할 수 있는 수량, amount를 넘으면 더 이상 가격대를 확인하지 않음
+        opposite = self.asks if side == "buy" else self.bids
+        prices = opposite.prices if side == "buy" else reversed(opposite.prices)
+        available = 0
+        for level_price in prices:
+            if available >= amount or not self.crosses(side, price, level_price):
+                break
+            available += opposite.sizes[level_price]
+        return available
+
+    def expire(self, now):
+        # now(epoch 초)까지 만료된 GTD 주문을 호가창에서 제거하고 id 목록을 반환
+        return [order_id for order_id in self.expiries.advance(now) if self.cancel(order_id) is not None]
+
+    def submit_market(self, order_id, side, amount, slippage, budget=None):
+        # 시장가 주문은 최우선 호가 기준으로 slippage 범위 안의 호가를 순서대로 소진하며, 남은 수량은 호가창에 올리지 않음
+        # budget: 시장가 매수 시 사용할 수 있는 최대 quote 수량
+        opposite = self.asks if side == "buy" else self.bids
+        best_price = opposite.best_price()
+        if best_price is None:
+            return [], amount
+        limit_price = best_price * (1 + slippage) if side == "buy" else best_price * (1 - slippage)
+        return self.match(order_id, side, limit_price, amount, budget)
+
+    def match(self, order_id, side, price, amount, budget=None):
+        # 반대편 호가를 가격-시간 우선순위로 소진, 체결 가격은 maker(기존 주문)의 가격
+        opposite = self.asks if side == "buy" else self.bids
+        fills = []
+        while amount > 0:
+            best_price = opposite.best_price()
+            if best_price is None or not self.crosses(side, price, best_price):
+                break
+            maker = opposite.head(best_price)
+            trade_amount = min(amount, maker.amount)
+            if budget is not None:
+                trade_amount = min(trade_amount, (budget / best_price).quantize(AMOUNT_QUANTUM, rounding=ROUND_DOWN))
+                if trade_amount <= 0:
+                    break
+                budget -= trade_amount * best_price
+            fills.append(Fill(order_id, maker.id, side, best_price, trade_amount))
+
+            amount -= trade_amount
+            opposite.reduce(maker, trade_amount)
+            if maker.amount == 0:
+                del self.orders[maker.id]
+        return fills, amount
+
+    def depth_changes(self):
+        # 마지막으로 호출한 이후 바뀐 호가, 한 번의 매칭에서 같은 가격이 여러 번 바뀌어도 최종 수량만 반환
+        return {"bids": self.bids.pop_changes(), "asks": self.asks.pop_changes()}
+
+    def reduce_to(self, order_id, amount):
+        # 주문의 남은 수량을 amount 이하로 줄이며 같은 가격대에서의 시간 우선순위는 유지, 남은 수량이 없으면 호가창에서 제거
+        # 이미 amount 이하라면 바꾸지 않으므로 같은 변경을 여러 번 반영하거나 DB에서 다시 읽은 주문에 반영해도 결과가 같음
+        entry = self.orders.get(order_id)
+        if entry is None:
+            return None
+        if amount <= 0:
+            return self.cancel(order_id)
+        if amount < entry.amount:
+            self.side_of(entry.side).reduce(entry, entry.amount - amount)
+        return entry
+
+    def cancel(self, order_id):
+        entry = self.orders.pop(order_id, None)
+        if entry is None:
+            return None
+        self.side_of(entry.side).remove(entry)
+        return entry
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("markets", "0001_initial"),
+        ("orders", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(condition=models.Q(("status", "open")), fields=["base_currency", "quote_currency", "id"], name="order_open_sync_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(condition=models.Q(("status", "open")), fields=["base_currency", "quote_currency", "side", "price", "created_at"], name="order_open_book_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="trade",
+            index=models.Index(fields=["created_at"], name="trade_created_at_idx"),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("markets", "0001_initial"),
+        ("orders", "0002_order_open_indexes_trade_created_at_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trade",
+            name="base_currency",
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name="base_currency_trades", to="markets.cryptocurrency"),
+        ),
+        migrations.AddField(
+            model_name="trade",
+            name="quote_currency",
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name="quote_currency_trades", to="markets.cryptocurrency"),
+        ),
+        migrations.AddField(
+            model_name="trade",
+            name="taker_side",
+            field=models.CharField(choices=[("buy", "Buy"), ("sell", "Sell")], max_length=10, null=True),
+        ),
+    ]
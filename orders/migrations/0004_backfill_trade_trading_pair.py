@@ -0,0 +1,27 @@
+from django.db import migrations
+from django.db.models import Case, F, OuterRef, Subquery, Value, When
+
+
+# 기존 Trade의 거래쌍은 매수 주문에서 가져오고, taker는 나중에 들어온(id가 더 큰) 주문으로 간주
+# Subquery를 사용해 row마다 저장하지 않고 하나의 UPDATE 문으로 처리
+def backfill_trade_trading_pair(apps, schema_editor):
+    Order = apps.get_model("orders", "Order")
+    Trade = apps.get_model("orders", "Trade")
+
+    buy_orders = Order.objects.filter(id=OuterRef("buy_order_id"))
+    Trade.objects.filter(base_currency__isnull=True).update(
+        base_currency_id=Subquery(buy_orders.values("base_currency_id")[:1]),
+        quote_currency_id=Subquery(buy_orders.values("quote_currency_id")[:1]),
+        taker_side=Case(When(buy_order_id__gt=F("sell_order_id"), then=Value("buy")), default=Value("sell")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0003_trade_base_currency_trade_quote_currency_trade_taker_side"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_trade_trading_pair, migrations.RunPython.noop),
+    ]
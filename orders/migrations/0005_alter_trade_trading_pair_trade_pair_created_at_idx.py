@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("markets", "0001_initial"),
+        ("orders", "0004_backfill_trade_trading_pair"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="trade",
+            name="base_currency",
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="base_currency_trades", to="markets.cryptocurrency"),
+        ),
+        migrations.AlterField(
+            model_name="trade",
+            name="quote_currency",
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="quote_currency_trades", to="markets.cryptocurrency"),
+        ),
+        migrations.AlterField(
+            model_name="trade",
+            name="taker_side",
+            field=models.CharField(choices=[("buy", "Buy"), ("sell", "Sell")], max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name="trade",
+            index=models.Index(fields=["base_currency", "quote_currency", "created_at"], name="trade_pair_created_at_idx"),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0005_alter_trade_trading_pair_trade_pair_created_at_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="locked",
+            field=models.DecimalField(decimal_places=8, default=0, max_digits=20),
+        ),
+    ]
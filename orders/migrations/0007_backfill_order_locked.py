@@ -0,0 +1,53 @@
+from collections import defaultdict
+from decimal import ROUND_UP, Decimal
+
+from django.conf import settings
+from django.db import migrations
+
+
+# 예약 기능 이전에 접수된 미체결 주문의 잔고를 예약, 매도는 남은 수량
+# 지정가 매수는 남은 수량 * 가격, 시장가 매수는 주문 API와 같이 마지막 체결가에 slippage 한도를 더한 가격으로 예약하며 이 예약이 매칭 예산이 됨
+# 체결 이력이 없어 예산을 정할 수 없는 거래쌍의 시장가 매수는 체결될 수 없으므로 취소
+def backfill_order_locked(apps, schema_editor):
+    Order = apps.get_model("orders", "Order")
+    Trade = apps.get_model("orders", "Trade")
+    WalletBalance = apps.get_model("users", "WalletBalance")
+
+    orders = list(Order.objects.filter(status="open").select_related("user__wallet"))
+    last_prices = {}
+    locked = defaultdict(Decimal)
+    for order in orders:
+        if order.side == "sell":
+            order.locked = order.amount
+            locked[(order.user.wallet.id, order.base_currency_id)] += order.locked
+            continue
+
+        price = order.price
+        if order.order_type == "market":
+            pair = (order.base_currency_id, order.quote_currency_id)
+            if pair not in last_prices:
+                last_prices[pair] = Trade.objects.filter(base_currency_id=pair[0], quote_currency_id=pair[1]).order_by("-created_at", "-id").values_list("price", flat=True).first()
+            if last_prices[pair] is None:
+                order.status = "canceled"
+                continue
+            price = last_prices[pair] * (1 + settings.MARKET_ORDER_SLIPPAGE)
+        order.locked = (order.amount * price).quantize(Decimal("0.00000001"), rounding=ROUND_UP)
+        locked[(order.user.wallet.id, order.quote_currency_id)] += order.locked
+    Order.objects.bulk_update(orders, ["locked", "status"], batch_size=1000)
+
+    for (wallet_id, currency_id), amount in locked.items():
+        balance, _ = WalletBalance.objects.get_or_create(wallet_id=wallet_id, currency_id=currency_id)
+        balance.locked = amount
+        balance.save(update_fields=["locked"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0006_order_locked"),
+        ("users", "0008_walletbalance_locked"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order_locked, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0007_backfill_order_locked"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="post_only",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="time_in_force",
+            field=models.CharField(
+                choices=[("GTC", "Good Till Canceled"), ("IOC", "Immediate Or Cancel"), ("FOK", "Fill Or Kill"), ("GTD", "Good Till Date")], default="GTC", max_length=3
+            ),
+        ),
+    ]
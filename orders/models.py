@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.db import models
+from django.db.models import Q
 
 from markets.models import CryptoCurrency
 
@@ -13,6 +14,13 @@ class Order(models.Model):
         ("buy", "Buy"),
         ("sell", "Sell"),
     ]
+    # GTC: 취소할 때까지 유지, IOC: 즉시 체결되지 않은 수량은 취소, FOK: 전체 수량이 즉시 체결되지 않으면 취소, GTD: expires_at까지 유지
+    TIME_IN_FORCE_CHOICES = [
+        ("GTC", "Good Till Canceled"),
+        ("IOC", "Immediate Or Cancel"),
+        ("FOK", "Fill Or Kill"),
+        ("GTD", "Good Till Date"),
+    ]
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     order_type = models.CharField(max_length=10, choices=ORDER_TYPE_CHOICES)
@@ -21,13 +29,49 @@ class Order(models.Model):
     side = models.CharField(max_length=10, choices=SIDE_CHOICES)
     price = models.DecimalField(max_digits=20, decimal_places=8, null=True, blank=True)
     amount = models.DecimalField(max_digits=20, decimal_places=8)
+    # 주문에 예약되어 아직 사용되지 않은 잔고, 매수는 quote, 매도는 base 수량
+    locked = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    time_in_force = models.CharField(max_length=3, choices=TIME_IN_FORCE_CHOICES, default="GTC")
+    expires_at = models.DateTimeField(null=True, blank=True)
+    # 반대편 호가와 교차하면 체결하지 않고 거절되어 항상 maker로만 호가창에 올라감
+    post_only = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, default="open")
 
+    class Meta:
+        # 체결 및 취소된 주문은 계속 쌓이므로 매칭에 사용되는 open 주문만 부분 인덱스(partial index)로 관리
+        indexes = [
+            # 매칭 엔진이 마지막으로 반영한 주문 이후의 open 주문을 거래쌍별로 읽을 때 사용
+            models.Index(fields=["base_currency", "quote_currency", "id"], condition=Q(status="open"), name="order_open_sync_idx"),
+            # 거래쌍의 한쪽 호가를 가격-시간 순으로 읽을 때 사용
+            models.Index(fields=["base_currency", "quote_currency", "side", "price", "created_at"], condition=Q(status="open"), name="order_open_book_idx"),
+        ]
+
 
 class Trade(models.Model):
     buy_order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="buy_trades")
     sell_order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="sell_trades")
+    # 시세 조회 시 주문 테이블과 join하지 않도록 거래쌍과 taker 방향을 Trade에 함께 저장
+    base_currency = models.ForeignKey(CryptoCurrency, on_delete=models.CASCADE, related_name="base_currency_trades")
+    quote_currency = models.ForeignKey(CryptoCurrency, on_delete=models.CASCADE, related_name="quote_currency_trades")
+    taker_side = models.CharField(max_length=10, choices=Order.SIDE_CHOICES)
     price = models.DecimalField(max_digits=20, decimal_places=8)
     amount = models.DecimalField(max_digits=20, decimal_places=8)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # 차트 데이터를 시간 범위로 조회할 때 사용
+            models.Index(fields=["created_at"], name="trade_created_at_idx"),
+            # 거래쌍별 차트 데이터와 최근 체결가를 조회할 때 사용
+            models.Index(fields=["base_currency", "quote_currency", "created_at"], name="trade_pair_created_at_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # 매칭 엔진은 거래쌍을 직접 채워서 bulk_create하므로 이 분기는 직접 생성된 Trade에만 해당
+        # taker는 나중에 들어온 주문이므로 id가 더 큰 주문의 방향을 사용
+        if self.base_currency_id is None or self.quote_currency_id is None:
+            self.base_currency_id, self.quote_currency_id = self.buy_order.base_currency_id, self.buy_order.quote_currency_id
+        if not self.taker_side:
+            self.taker_side = "buy" if self.buy_order_id > self.sell_order_id else "sell"
+        return super().save(*args, **kwargs)
@@ -1,7 +1,10 @@
 from django.urls import re_path
 
-from .consumers import TradeConsumer
+from .consumers import DepthConsumer, StreamConsumer, TradeConsumer
 
 websocket_urlpatterns = [
+    # 여러 거래쌍의 stream을 하나의 연결에서 구독
+    re_path(r"ws/stream/$", StreamConsumer.as_asgi()),
     re_path(r"ws/orders/(?P<symbol>\w+)/$", TradeConsumer.as_asgi()),
+    re_path(r"ws/orders/(?P<symbol>\w+)/depth/$", DepthConsumer.as_asgi()),
 ]
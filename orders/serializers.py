@@ -1,8 +1,15 @@
-from django.db.models import Q
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 
-from .models import Order, Trade
-from markets.models import CryptoCurrency
+from .models import Order
+from .services import funds_currency_id, hold_balance, order_hold, push_new_orders
+from markets.utils import get_currency, get_last_price, get_order_rules, get_tickers
+
+# 한 번의 batch 요청으로 접수할 수 있는 최대 주문 수
+MAX_BATCH_ORDERS = 50
 
 
 # TODO: fee 계산 과정 추가
@@ -12,20 +19,28 @@ class OrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ["id", "order_type", "base_currency", "quote_currency", "side", "price", "amount", "created_at", "status"]
+        fields = ["id", "order_type", "base_currency", "quote_currency", "side", "price", "amount", "time_in_force", "expires_at", "post_only", "created_at", "status"]
 
     def validate(self, data):
         base_currency, quote_currency = data.get("base_currency"), data.get("quote_currency")
         if base_currency == quote_currency:
             raise serializers.ValidationError("Base currency and quote currency must be different.")
 
-        base_currency_instance = CryptoCurrency.objects.filter(symbol=base_currency).first()
-        quote_currency_instance = CryptoCurrency.objects.filter(symbol=quote_currency).first()
+        # 통화 정보는 프로세스 메모리에 캐시된 값을 사용해 주문마다 DB를 조회하지 않음
+        base_currency_instance = get_currency(base_currency)
+        quote_currency_instance = get_currency(quote_currency)
         if not base_currency_instance:
             raise serializers.ValidationError(f"Base currency '{base_currency}' does not exist.")
         if not quote_currency_instance:
             raise serializers.ValidationError(f"Quote currency '{quote_currency}' does not exist.")
 
+        # 거래쌍의 주문 규칙도 통화 정보와 함께 캐시되어 있으며, 정수 단위로 미리 변환되어 있음
+        order_rules = get_order_rules(base_currency_instance.id, quote_currency_instance.id)
+        if order_rules is None:
+            raise serializers.ValidationError(f"Trading pair '{base_currency}/{quote_currency}' does not exist.")
+        if not order_rules.is_active:
+            raise serializers.ValidationError(f"Trading pair '{base_currency}/{quote_currency}' is not active.")
+
         order_type = data.get("order_type")
         if order_type not in dict(Order.ORDER_TYPE_CHOICES):
             raise serializers.ValidationError(f"Order type must be one of {Order.ORDER_TYPE_CHOICES}.")
@@ -35,45 +50,84 @@ class OrderSerializer(serializers.ModelSerializer):
         if order_type == "limit" and not data.get("price"):
             raise serializers.ValidationError("Limit orders must include a price.")
 
-        # TODO: 가격을 Trade가 아닌 따로 기록된 시계열 데이터에서 가져오도록 수정
-        price = None
-        if order_type == "market":
-            last_trade = Trade.objects.filter(
-                Q(buy_order__base_currency=base_currency_instance, buy_order__quote_currency=quote_currency_instance)
-                & Q(sell_order__base_currency=base_currency_instance, sell_order__quote_currency=quote_currency_instance)
-            ).last()
-            if last_trade:
-                price = last_trade.price
-            else:
-                price = 0
-        elif order_type == "limit":
-            price = float(data.get("price"))
-
-        if price is None or (order_type == "limit" and price <= 0):
-            raise serializers.ValidationError("Price must be greater than zero.")
+        price = data.get("price")
+        if order_type == "limit":
+            if price <= 0:
+                raise serializers.ValidationError("Price must be greater than zero.")
+            error = order_rules.check_price(price)
+            if error:
+                raise serializers.ValidationError(error)
 
         side = data.get("side")
         if side not in dict(Order.SIDE_CHOICES):
             raise serializers.ValidationError(f"Side must be one of {Order.SIDE_CHOICES}.")
 
-        amount = float(data.get("amount"))
-        user = self.context.get("request").user
-        wallet = user.wallet
-        if side == "buy":
-            wallet_balance = wallet.balances.filter(currency__symbol=quote_currency).first()
-            required_quote = amount
-            if order_type == "limit":
-                required_quote *= price
-            if not wallet_balance or wallet_balance.amount < required_quote:
-                raise serializers.ValidationError("Not enough balance to buy.")
-        elif side == "sell":
-            wallet_balance = wallet.balances.filter(currency__symbol=base_currency).first()
-            if not wallet_balance or wallet_balance.amount < amount:
-                raise serializers.ValidationError("Not enough balance to sell.")
+        amount = data.get("amount")
+        error = order_rules.check_amount(amount)
+        if error:
+            raise serializers.ValidationError(error)
 
+        time_in_force, expires_at, post_only = data.get("time_in_force", "GTC"), data.get("expires_at"), data.get("post_only", False)
+        if order_type == "market" and (time_in_force != "GTC" or post_only):
+            raise serializers.ValidationError("Time in force and post-only options are only available for limit orders.")
+        if time_in_force == "GTD" and (expires_at is None or expires_at <= timezone.now()):
+            raise serializers.ValidationError("GTD orders must include a future expires_at.")
+        if time_in_force != "GTD" and expires_at is not None:
+            raise serializers.ValidationError("Only GTD orders can include expires_at.")
+        if post_only and time_in_force in ("IOC", "FOK"):
+            raise serializers.ValidationError("Post-only orders cannot be IOC or FOK.")
+        if post_only:
+            # 매칭 worker가 기록한 최우선 호가와 교차하는 post-only 주문은 잔고를 예약하기 전에 거절, 최종 판단은 매칭 엔진이 함
+            ticker = get_tickers(f"{base_currency}/{quote_currency}")
+            best_price = ticker and ticker[0]["best_ask" if side == "buy" else "best_bid"]
+            if best_price and (price >= Decimal(best_price) if side == "buy" else price <= Decimal(best_price)):
+                raise serializers.ValidationError("Post-only order would cross the order book.")
+
+        reference_price = None
+        if order_type == "market" and side == "buy":
+            # 시장가 매수는 매칭 worker가 정산마다 기록하는 마지막 체결가를 기준으로 잔고를 예약
+            reference_price = get_last_price(base_currency_instance.id, quote_currency_instance.id)
+            if reference_price is None:
+                raise serializers.ValidationError("Market buy orders are not available before the first trade.")
+
+        # 잔고는 여기서 읽지 않고 create에서 예약하면서 한 번에 검사
+        data["locked"] = order_hold(side, order_type, price, amount, reference_price)
         return data
 
     def create(self, validated_data):
-        base_currency_symbol, quote_currency_symbol = validated_data.pop("base_currency"), validated_data.pop("quote_currency")
-        base_currency, quote_currency = CryptoCurrency.objects.get(symbol=base_currency_symbol), CryptoCurrency.objects.get(symbol=quote_currency_symbol)
-        return Order.objects.create(base_currency=base_currency, quote_currency=quote_currency, **validated_data)
+        order = self.build_order(validated_data)
+
+        # 잔고 예약과 주문 생성을 하나의 트랜잭션으로 묶어 예약만 남거나 예약 없는 주문이 생기지 않도록 함
+        with transaction.atomic():
+            if not hold_balance(order.user_id, funds_currency_id(order), order.locked):
+                raise serializers.ValidationError(f"Not enough balance to {order.side}.")
+            order.save()
+            push_new_orders([order])
+        return order
+
+    def build_order(self, validated_data):
+        # 저장하지 않은 Order를 생성, 통화 정보는 캐시에서 가져오므로 DB를 조회하지 않음
+        validated_data = dict(validated_data)
+        base_currency, quote_currency = get_currency(validated_data.pop("base_currency")), get_currency(validated_data.pop("quote_currency"))
+        return Order(base_currency=base_currency, quote_currency=quote_currency, **validated_data)
+
+
+class OrderBatchSerializer(serializers.Serializer):
+    orders = serializers.ListField(child=serializers.DictField(), min_length=1, max_length=MAX_BATCH_ORDERS)
+    # atomic이 true면 모든 주문이 생성되거나 모두 거절되고, false면 가능한 주문만 생성
+    atomic = serializers.BooleanField(default=True)
+
+
+class OrderAmendSerializer(serializers.Serializer):
+    price = serializers.DecimalField(max_digits=20, decimal_places=8, required=False)
+    amount = serializers.DecimalField(max_digits=20, decimal_places=8, required=False)
+
+    def validate(self, data):
+        if "price" not in data and "amount" not in data:
+            raise serializers.ValidationError("Either price or amount must be provided.")
+        # 거래쌍 규칙의 최솟값이 0이더라도 가격이나 수량을 0으로 바꿀 수 없음, 수량을 0으로 바꾸려면 주문을 취소
+        if data.get("price") is not None and data["price"] <= 0:
+            raise serializers.ValidationError("Price must be greater than zero.")
+        if data.get("amount") is not None and data["amount"] <= 0:
+            raise serializers.ValidationError("Amount must be greater than zero.")
+        return data
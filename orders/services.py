@@ -1,67 +1,559 @@
+import json
 import logging
+import statistics
+from collections import defaultdict
+from decimal import ROUND_UP, Decimal
 
+from django.conf import settings
 from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django_redis import get_redis_connection
 
+from .engine import AMOUNT_QUANTUM, OrderBook
 from .models import Order, Trade
+from .signals import send_candle_data, send_depth_data, send_indicator_data, send_ticker_data, send_trade_data, serialize_trade
+from markets.utils import TICKERS_KEY, get_currency_by_id, get_order_rules, load_ticker_window, serialize_candle, set_last_prices, update_candles, update_live_indicators
 from users.models import WalletBalance
 
 logger = logging.getLogger(__name__)
 
+# 프로세스 내에서 유지되는 거래쌍별 호가창, key는 (base_currency_id, quote_currency_id)
+_order_books = {}
+# 거래쌍별 최근 24시간 ticker, 호가창과 마찬가지로 거래쌍을 맡은 매칭 worker만 갱신
+_tickers = {}
 
-def match_orders():
-    buy_orders = Order.objects.filter(order_type="limit", side="buy", status="open").order_by("-price", "created_at")
-    sell_orders = Order.objects.filter(order_type="limit", side="sell", status="open").order_by("price", "created_at")
 
-    if not buy_orders.exists() or not sell_orders.exists():
-        logger.info("No orders available for matching.")
+# 호가창 변경 목록에서 새로 commit된 주문을 나타내는 값
+NEW_ORDER = "new"
+
+
+class StaleOrderBookError(Exception):
+    pass
+
+
+class OrderAmendError(Exception):
+    pass
+
+
+def get_order_book(base_currency_id, quote_currency_id):
+    key = (base_currency_id, quote_currency_id)
+    book = _order_books.get(key)
+    if book is None:
+        book = _order_books[key] = OrderBook(key)
+    return book
+
+
+def drop_order_book(base_currency_id, quote_currency_id):
+    # 호가창과 DB가 어긋났을 때 호가창을 버리면 다음 매칭 시 DB에서 다시 생성됨
+    # 다른 worker가 거래쌍을 맡았던 경우에도 호출되므로 ticker도 함께 버림
+    _order_books.pop((base_currency_id, quote_currency_id), None)
+    _tickers.pop((base_currency_id, quote_currency_id), None)
+
+
+def get_pair_symbols(base_currency_id, quote_currency_id):
+    return get_currency_by_id(base_currency_id).symbol, get_currency_by_id(quote_currency_id).symbol
+
+
+def get_symbol(base_currency_id, quote_currency_id):
+    # WebSocket group에 사용하는 심볼(BTCKRW)
+    return "".join(get_pair_symbols(base_currency_id, quote_currency_id))
+
+
+def open_orders(base_currency_id, quote_currency_id, order_ids=None):
+    # order_open_sync_idx 부분 인덱스를 사용하도록 조건과 정렬을 인덱스 컬럼 순서에 맞춤
+    orders = Order.objects.filter(base_currency_id=base_currency_id, quote_currency_id=quote_currency_id, status="open")
+    if order_ids is not None:
+        orders = orders.filter(id__in=order_ids)
+    return orders.order_by("id").only("id", "order_type", "side", "price", "amount", "locked", "time_in_force", "expires_at", "post_only")
+
+
+def sync_order_book(book):
+    # 호가창을 처음 만들 때만 미체결 주문 전체를 읽고, 이후에는 commit 이후 변경 목록에 추가된 새 주문만 commit된 순서대로 호가창에 제출
+    # id는 INSERT 시점에 정해지고 주문은 commit 시점에 보이므로 id 순서로 읽으면 늦게 commit된 작은 id의 주문을 놓칠 수 있음
+    # 시장가 주문은 호가창을 바로 소진하고 체결되지 않은 수량은 취소되므로 취소할 주문 id를 함께 반환
+    base_currency_id, quote_currency_id = book.key
+
+    # 취소되거나 수량이 줄어든 주문은 DB를 다시 읽지 않고 id로 호가창에 바로 반영, 이미 체결되었거나 아직 호가창에 없는 주문은 무시
+    new_order_ids = []
+    updates, resync = pop_book_updates(base_currency_id, quote_currency_id)
+    for order_id, change in updates:
+        if change is None:
+            book.cancel(order_id)
+        elif change == NEW_ORDER:
+            new_order_ids.append(order_id)
+        else:
+            book.reduce_to(order_id, change)
+
+    if not book.loaded:
+        new_orders = list(open_orders(base_currency_id, quote_currency_id))
+        book.loaded = True
+    else:
+        if resync:
+            new_order_ids.extend(reconcile_order_book(book))
+        # 이미 호가창에 있는 주문은 다시 제출하지 않고, 그 사이 체결되거나 취소된 주문은 status 조건으로 제외
+        new_order_ids = list(dict.fromkeys(order_id for order_id in new_order_ids if order_id not in book))
+        orders = {order.id: order for order in open_orders(base_currency_id, quote_currency_id, new_order_ids)} if new_order_ids else {}
+        new_orders = [orders[order_id] for order_id in new_order_ids if order_id in orders]
+
+    # 만료된 GTD 주문은 테이블을 확인하지 않고 호가창의 time wheel에서 꺼내 취소
+    now = timezone.now()
+    canceled_order_ids = book.expire(now.timestamp())
+
+    fills = []
+    for order in new_orders:
+        if order.order_type == "market":
+            # 시장가 매수는 주문 접수 시 예약한 quote 잔고를 넘어서 체결되지 않도록 예산으로 사용
+            budget = order.locked if order.side == "buy" else None
+            order_fills, remaining = book.submit_market(order.id, order.side, order.amount, settings.MARKET_ORDER_SLIPPAGE, budget)
+            if remaining > 0:
+                canceled_order_ids.append(order.id)
+        elif order.time_in_force == "GTD" and order.expires_at <= now:
+            order_fills = []
+            canceled_order_ids.append(order.id)
+        else:
+            expires_at = order.expires_at.timestamp() if order.expires_at else None
+            order_fills = book.submit(order.id, order.side, order.price, order.amount, order.time_in_force, order.post_only, expires_at)
+            # IOC, FOK 주문의 남은 수량과 교차해 거절된 post-only 주문은 호가창에 올라가지 않으므로 취소
+            if order.id not in book and sum(fill.amount for fill in order_fills) < order.amount:
+                canceled_order_ids.append(order.id)
+        fills.extend(order_fills)
+    return fills, canceled_order_ids
+
+
+def reconcile_order_book(book):
+    # 변경 목록 추가가 유실되었을 때를 대비해 beat가 요청하면 DB의 미체결 주문 id와 호가창을 비교
+    # DB에서 더 이상 미체결이 아닌 주문은 호가창에서 제거하고, 호가창에 없는 미체결 주문 id는 id 순서로 반환
+    open_order_ids = set(open_orders(*book.key).values_list("id", flat=True))
+    for order_id in [order_id for order_id in book.orders if order_id not in open_order_ids]:
+        book.cancel(order_id)
+    return sorted(open_order_ids - book.orders.keys())
+
+
+def match_orders(base_currency_id=None, quote_currency_id=None):
+    if base_currency_id is None or quote_currency_id is None:
+        pairs = Order.objects.filter(status="open").values_list("base_currency_id", "quote_currency_id").distinct()
+    else:
+        pairs = [(base_currency_id, quote_currency_id)]
+
+    for pair in pairs:
+        match_trading_pair(*pair)
+
+
+def match_trading_pair(base_currency_id, quote_currency_id):
+    book = get_order_book(base_currency_id, quote_currency_id)
+    try:
+        fills, canceled_order_ids = sync_order_book(book)
+        trades = []
+        if not fills and not canceled_order_ids:
+            logger.info("No orders available for matching.")
+        else:
+            trades = settle_fills(fills, canceled_order_ids)
+    except Exception:
+        drop_order_book(base_currency_id, quote_currency_id)
+        raise
+
+    # 체결이 없더라도 새로 호가창에 올라간 주문이 있을 수 있으므로 바뀐 호가를 전송
+    # ticker는 체결이 없더라도 24시간이 지난 체결을 제외하고 최우선 호가를 반영하기 위해 매번 갱신
+    transaction.on_commit(lambda: publish_depth(book))
+    transaction.on_commit(lambda: publish_ticker(book, trades))
+    return fills
+
+
+def settle_fills(fills, canceled_order_ids=()):
+    # 한 번의 매칭에서 나온 체결을 모아 하나의 트랜잭션에서 일괄로 기록
+    # 주문 -> 잔고 순서로, 각각 id 순으로 lock을 잡아 동시에 실행되는 매칭끼리 deadlock이 발생하지 않도록 함
+    order_ids = sorted({fill.taker_id for fill in fills} | {fill.maker_id for fill in fills} | set(canceled_order_ids))
+
+    with transaction.atomic():
+        # of=("self",)로 지정하지 않으면 select_related로 join한 user, wallet 테이블의 row까지 lock이 걸림
+        orders = {
+            order.id: order
+            for order in Order.objects.select_for_update(of=("self",)).select_related("user__wallet", "base_currency", "quote_currency").filter(id__in=order_ids).order_by("id")
+        }
+        if len(orders) != len(order_ids):
+            raise StaleOrderBookError(f"Orders {set(order_ids) - set(orders)} no longer exist.")
+
+        trades = []
+        balance_deltas = defaultdict(Decimal)
+        locked_deltas = defaultdict(Decimal)
+        for fill in fills:
+            if fill.side == "buy":
+                buy_order, sell_order = orders[fill.taker_id], orders[fill.maker_id]
+            else:
+                buy_order, sell_order = orders[fill.maker_id], orders[fill.taker_id]
+
+            if buy_order.status != "open" or sell_order.status != "open" or buy_order.amount < fill.amount or sell_order.amount < fill.amount:
+                raise StaleOrderBookError(f"Order book is out of sync with orders {buy_order.id}, {sell_order.id}.")
+
+            trades.append(
+                Trade(
+                    buy_order=buy_order,
+                    sell_order=sell_order,
+                    base_currency_id=buy_order.base_currency_id,
+                    quote_currency_id=buy_order.quote_currency_id,
+                    taker_side=fill.side,
+                    price=fill.price,
+                    amount=fill.amount,
+                )
+            )
+
+            required_quote = fill.amount * fill.price
+            buyer_wallet_id, seller_wallet_id = buy_order.user.wallet.id, sell_order.user.wallet.id
+            balance_deltas[(buyer_wallet_id, buy_order.quote_currency_id)] -= required_quote
+            balance_deltas[(buyer_wallet_id, buy_order.base_currency_id)] += fill.amount
+            balance_deltas[(seller_wallet_id, sell_order.quote_currency_id)] += required_quote
+            balance_deltas[(seller_wallet_id, sell_order.base_currency_id)] -= fill.amount
+            # 체결에 사용한 잔고는 주문에 예약된 잔고에서 차감
+            for order, used in ((buy_order, required_quote), (sell_order, fill.amount)):
+                used = min(order.locked, used.quantize(AMOUNT_QUANTUM, rounding=ROUND_UP))
+                order.locked -= used
+                locked_deltas[locked_balance_key(order)] -= used
+
+            buy_order.amount -= fill.amount
+            sell_order.amount -= fill.amount
+            if buy_order.amount == 0:
+                buy_order.status = "completed"
+            if sell_order.amount == 0:
+                sell_order.status = "completed"
+
+        # 체결되지 않고 남은 시장가 주문 수량은 취소
+        for order_id in canceled_order_ids:
+            if orders[order_id].status != "open":
+                raise StaleOrderBookError(f"Order book is out of sync with order {order_id}.")
+            orders[order_id].status = "canceled"
+
+        # 완료되거나 취소된 주문에 남은 예약(지정가 매수의 가격 개선분, 시장가 주문의 미사용분)은 해제
+        for order in orders.values():
+            if order.status != "open" and order.locked:
+                locked_deltas[locked_balance_key(order)] -= order.locked
+                order.locked = 0
+
+        balances = lock_wallet_balances(balance_deltas.keys() | locked_deltas.keys())
+        for key, delta in balance_deltas.items():
+            balances[key].amount += delta
+        for key, delta in locked_deltas.items():
+            balances[key].locked += delta
+
+        Trade.objects.bulk_create(trades)
+        candles = update_candles(trades)
+        Order.objects.bulk_update(orders.values(), ["amount", "status", "locked"])
+        WalletBalance.objects.bulk_update(balances.values(), ["amount", "locked"])
+
+        # 체결 데이터는 거래쌍별로 모아 두었다가 commit된 이후에만 WebSocket으로 전송
+        # 거래쌍의 심볼은 이미 select_related로 읽은 주문에서 가져오므로 추가 조회가 없음
+        symbols = {(order.base_currency_id, order.quote_currency_id): f"{order.base_currency.symbol}{order.quote_currency.symbol}" for order in orders.values()}
+        trade_data = defaultdict(list)
+        for trade in trades:
+            trade_data[symbols[(trade.base_currency_id, trade.quote_currency_id)]].append(serialize_trade(trade))
+        # trades는 체결 순서대로 정렬되어 있으므로 거래쌍별 마지막 체결가가 남음
+        last_prices = {(trade.base_currency_id, trade.quote_currency_id): trade.price for trade in trades}
+        transaction.on_commit(lambda: set_last_prices(last_prices))
+        transaction.on_commit(lambda: publish_trades(trade_data))
+        transaction.on_commit(lambda: publish_candles(candles, symbols))
+
+    if not fills:
+        return trades
+
+    # 주문 접수부터 체결까지 걸린 시간, 이벤트 기반 매칭의 지연을 모니터링하기 위해 기록
+    now = timezone.now()
+    latencies = [(now - orders[fill.taker_id].created_at).total_seconds() * 1000 for fill in fills]
+    logger.info("Settled %d fills, median order-to-trade latency %.1fms.", len(fills), statistics.median(latencies))
+    return trades
+
+
+def publish_trades(trade_data):
+    # 거래쌍마다 한 번만 channel layer로 전송
+    for symbol, trades in trade_data.items():
+        send_trade_data(symbol, trades)
+
+
+def publish_depth(book):
+    # 바뀐 가격별 수량을 Redis의 호가 snapshot에 반영하고 순번(seq)을 붙여 전송
+    # 새로 연결한 client는 snapshot과 seq를 읽은 뒤 그보다 큰 seq의 변경만 적용하면 됨
+    symbol = get_symbol(*book.key)
+    seq_key, side_keys = f"depth:{symbol}:seq", {"bids": f"depth:{symbol}:bids", "asks": f"depth:{symbol}:asks"}
+    pipeline = get_redis_connection("default").pipeline()
+
+    if book.depth_reset:
+        # 호가창을 새로 만들었다면 snapshot 전체를 다시 기록하고 client도 snapshot으로 교체하도록 함
+        book.depth_changes()
+        depth = {"bids": book.bids.depth(), "asks": book.asks.depth()}
+        pipeline.delete(*side_keys.values())
+        for side, levels in depth.items():
+            if levels:
+                pipeline.hset(side_keys[side], mapping={str(price): str(size) for price, size in levels})
+        pipeline.incr(seq_key)
+        seq = pipeline.execute()[-1]
+        book.depth_reset = False
+        send_depth_data(symbol, {"type": "snapshot", "seq": seq, **{side: [[str(price), str(size)] for price, size in levels] for side, levels in depth.items()}})
+        return
+
+    changes = book.depth_changes()
+    if not changes["bids"] and not changes["asks"]:
         return
+    for side, levels in changes.items():
+        removed = [str(price) for price, size in levels.items() if size == 0]
+        updated = {str(price): str(size) for price, size in levels.items() if size != 0}
+        if removed:
+            pipeline.hdel(side_keys[side], *removed)
+        if updated:
+            pipeline.hset(side_keys[side], mapping=updated)
+    pipeline.incr(seq_key)
+    seq = pipeline.execute()[-1]
+    send_depth_data(
+        symbol, {"type": "delta", "prev_seq": seq - 1, "seq": seq, **{side: {str(price): str(size) for price, size in levels.items()} for side, levels in changes.items()}}
+    )
+
+
+def publish_ticker(book, trades):
+    # 이번 매칭의 체결을 24시간 bucket에 반영하고 모든 client가 한 번에 읽을 수 있도록 Redis에 기록
+    now = timezone.now()
+    ticker = _tickers.get(book.key)
+    if ticker is None:
+        # 처음 맡은 거래쌍이라면 DB에서 bucket을 만들며 이미 commit된 이번 체결도 포함됨
+        ticker = _tickers[book.key] = load_ticker_window(*book.key, now)
+    else:
+        for trade in trades:
+            ticker.add_trade(trade.created_at, trade.price, trade.amount)
+
+    base_symbol, quote_symbol = get_pair_symbols(*book.key)
+    best_bid, best_ask = book.best_bid(), book.best_ask()
+    ticker_data = {
+        "symbol": f"{base_symbol}/{quote_symbol}",
+        **ticker.snapshot(now),
+        "best_bid": None if best_bid is None else str(best_bid),
+        "best_ask": None if best_ask is None else str(best_ask),
+        "timestamp": now.isoformat(),
+    }
+    text = json.dumps(ticker_data)
+    get_redis_connection("default").hset(TICKERS_KEY, ticker_data["symbol"], text)
+    send_ticker_data(f"{base_symbol}{quote_symbol}", text)
+
+
+def publish_candles(candles, symbols):
+    # 거래쌍과 주기별로 이번 매칭에서 갱신된 가장 최근 캔들과 이 캔들에 대해 구독 중인 지표만 계산해 전송
+    latest_candles = {}
+    for candle in candles:
+        key = (candle.base_currency_id, candle.quote_currency_id, candle.interval)
+        if key not in latest_candles or latest_candles[key].open_time < candle.open_time:
+            latest_candles[key] = candle
+    if not latest_candles:
+        return
+
+    for (base_currency_id, quote_currency_id, interval), candle in latest_candles.items():
+        send_candle_data(symbols[(base_currency_id, quote_currency_id)], interval, serialize_candle(candle))
+
+    pipeline = get_redis_connection("default").pipeline()
+    for base_currency_id, quote_currency_id, interval in latest_candles:
+        pipeline.hkeys(f"indicators:subscriptions:{symbols[(base_currency_id, quote_currency_id)]}:{interval}")
+
+    for (base_currency_id, quote_currency_id, interval), specs in zip(latest_candles, pipeline.execute()):
+        if not specs:
+            continue
+        candle = latest_candles[(base_currency_id, quote_currency_id, interval)]
+        indicators = update_live_indicators(candle, [spec.decode() for spec in specs])
+        send_indicator_data(symbols[(base_currency_id, quote_currency_id)], interval, candle, indicators)
+
+
+def lock_wallet_balances(keys):
+    # 체결에 필요한 잔고 row를 id 순으로 한 번에 lock, 처음 받는 자산이라 row가 없다면 먼저 생성
+    keys = set(keys)
+    wallet_ids = {wallet_id for wallet_id, _ in keys}
+    currency_ids = {currency_id for _, currency_id in keys}
+    WalletBalance.objects.bulk_create([WalletBalance(wallet_id=wallet_id, currency_id=currency_id) for wallet_id, currency_id in keys], ignore_conflicts=True)
+
+    balances = WalletBalance.objects.select_for_update().filter(wallet_id__in=wallet_ids, currency_id__in=currency_ids).order_by("id")
+    return {(balance.wallet_id, balance.currency_id): balance for balance in balances if (balance.wallet_id, balance.currency_id) in keys}
+
+
+def funds_currency_id(order):
+    # 주문이 잔고를 예약하는 통화, 매수는 quote, 매도는 base
+    return order.quote_currency_id if order.side == "buy" else order.base_currency_id
+
+
+def locked_balance_key(order):
+    # 주문이 예약한 잔고의 (wallet_id, currency_id)
+    return order.user.wallet.id, funds_currency_id(order)
+
+
+def order_hold(side, order_type, price, amount, reference_price=None):
+    # 주문 접수 시 예약할 잔고, 시장가 매수는 체결 가격을 알 수 없으므로 기준 가격에 slippage 한도를 더한 가격으로 예약
+    if side == "sell":
+        return amount
+    if order_type == "market":
+        price = reference_price * (1 + settings.MARKET_ORDER_SLIPPAGE)
+    return (amount * price).quantize(AMOUNT_QUANTUM, rounding=ROUND_UP)
+
+
+def hold_balance(user_id, currency_id, amount):
+    # 사용 가능한 잔고(amount - locked) 검사와 예약을 하나의 조건부 UPDATE로 처리
+    # 잔고를 먼저 읽고 검사하면 동시에 들어온 주문이 같은 잔고로 모두 통과할 수 있으며, SELECT FOR UPDATE 없이 한 번의 왕복으로 끝남
+    updated = WalletBalance.objects.filter(wallet__user_id=user_id, currency_id=currency_id, amount__gte=F("locked") + amount).update(locked=F("locked") + amount)
+    return updated == 1
+
+
+def place_orders(user, orders, atomic=True):
+    # 검증을 통과한 여러 주문을 잔고 snapshot 한 번으로 예약 가능한지 확인하고, 통화별로 한 번씩 예약한 뒤 한 번의 INSERT로 생성
+    # atomic이면 하나라도 예약할 수 없을 때 모두 거절하고, 아니면 예약할 수 있는 주문만 순서대로 생성
+    # (생성된 주문 목록, 잔고가 부족해 거절된 주문 목록)을 반환
+    currency_ids = {funds_currency_id(order) for order in orders}
+    with transaction.atomic():
+        available = {
+            currency_id: amount - locked
+            for currency_id, amount, locked in WalletBalance.objects.filter(wallet__user=user, currency_id__in=currency_ids).values_list("currency_id", "amount", "locked")
+        }
+
+        holds = defaultdict(Decimal)
+        accepted, rejected = [], []
+        for order in orders:
+            currency_id = funds_currency_id(order)
+            if holds[currency_id] + order.locked <= available.get(currency_id, 0):
+                holds[currency_id] += order.locked
+                accepted.append(order)
+            else:
+                rejected.append(order)
+        if atomic and rejected:
+            return [], orders
+
+        # snapshot 이후 다른 요청이 잔고를 사용했다면 조건부 UPDATE가 실패하므로 해당 통화의 주문은 거절
+        for currency_id, amount in sorted(holds.items()):
+            if hold_balance(user.id, currency_id, amount):
+                continue
+            if atomic:
+                transaction.set_rollback(True)
+                return [], orders
+            rejected.extend(order for order in accepted if funds_currency_id(order) == currency_id)
+            accepted = [order for order in accepted if funds_currency_id(order) != currency_id]
+
+        Order.objects.bulk_create(accepted)
+        push_new_orders(accepted)
+    return accepted, rejected
+
+
+def cancel_orders(user, **filters):
+    # 사용자의 미체결 주문을 하나의 UPDATE로 취소하고 예약된 잔고를 해제
+    # 매칭과 같이 주문 -> 잔고 순서로 lock을 잡아 동시에 정산 중인 주문과 deadlock이 발생하지 않도록 함
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update()
+            .filter(user=user, status="open", **filters)
+            .order_by("id")
+            .values_list("id", "side", "base_currency_id", "quote_currency_id", "locked")
+        )
+        if not orders:
+            return {}
+
+        order_ids = [order_id for order_id, *_ in orders]
+        Order.objects.filter(id__in=order_ids).update(status="canceled", locked=0)
+
+        released = defaultdict(Decimal)
+        canceled = defaultdict(list)
+        for order_id, side, base_currency_id, quote_currency_id, locked in orders:
+            released[quote_currency_id if side == "buy" else base_currency_id] += locked
+            canceled[(base_currency_id, quote_currency_id)].append(order_id)
+        for currency_id, amount in sorted(released.items()):
+            if amount:
+                WalletBalance.objects.filter(wallet__user=user, currency_id=currency_id).update(locked=F("locked") - amount)
+
+        # 매칭 worker가 다음 동기화 때 호가창에서 제거하도록 commit 이후 거래쌍별 변경 목록에 추가
+        updates = {pair: [(order_id, None) for order_id in order_ids] for pair, order_ids in canceled.items()}
+        transaction.on_commit(lambda: push_book_updates(updates))
+    return canceled
 
-    # TODO: market 주문 처리 로직 추가
-    for buy_order in buy_orders:
-        for sell_order in sell_orders:
-            buy_order_trading_pair = f"{buy_order.base_currency.symbol}/{buy_order.quote_currency.symbol}"
-            sell_order_trading_pair = f"{sell_order.base_currency.symbol}/{sell_order.quote_currency.symbol}"
-            if buy_order_trading_pair == sell_order_trading_pair:
-                if buy_order.price >= sell_order.price:
-                    trade_amount = min(buy_order.amount, sell_order.amount)
-                    match_price = sell_order.price
 
-                    # atomic으로 처리하지 않으면 동시에 여러 거래가 발생할 때 문제가 발생할 수 있음
-                    with transaction.atomic():
-                        Trade.objects.create(buy_order=buy_order, sell_order=sell_order, price=match_price, amount=trade_amount)
+def amend_order(user, order_id, price=None, amount=None):
+    # 가격은 그대로이고 수량만 줄어들면 같은 주문을 수정해 시간 우선순위를 유지
+    # 가격이 바뀌거나 수량이 늘어나면 기존 주문을 취소하고 새 주문으로 다시 접수해 우선순위를 잃고, 반대편 호가와 교차하면 바로 체결
+    with transaction.atomic():
+        order = Order.objects.select_for_update().filter(id=order_id, user=user, status="open", order_type="limit").first()
+        if order is None:
+            return None
+        price = order.price if price is None else price
+        amount = order.amount if amount is None else amount
+        if price == order.price and amount == order.amount:
+            return order
 
-                        buyer_wallet = buy_order.user.wallet
-                        buyer_quote_balance = WalletBalance.objects.select_for_update().get(wallet=buyer_wallet, currency=buy_order.quote_currency)
-                        buyer_base_balance = WalletBalance.objects.select_for_update().get(wallet=buyer_wallet, currency=buy_order.base_currency)
+        order_rules = get_order_rules(order.base_currency_id, order.quote_currency_id)
+        if order_rules is None:
+            raise OrderAmendError("Trading pair does not exist.")
+        error = order_rules.check_price(price) or order_rules.check_amount(amount)
+        if error:
+            raise OrderAmendError(error)
 
-                        required_quote = trade_amount * match_price
+        pair, currency_id = (order.base_currency_id, order.quote_currency_id), funds_currency_id(order)
+        if price == order.price and amount < order.amount:
+            # 남은 수량에 필요한 만큼만 예약을 남기고 해제
+            # 호가창에는 줄어든 양이 아니라 남은 수량을 보내, 변경이 전달되기 전에 DB에서 호가창을 다시 만들어도 두 번 차감되지 않도록 함
+            locked = min(order.locked, order_hold(order.side, "limit", price, amount))
+            released = order.locked - locked
+            order.amount, order.locked = amount, locked
+            order.save(update_fields=["amount", "locked"])
+            updates = [(order.id, amount)]
+        else:
+            locked = order_hold(order.side, "limit", price, amount)
+            released = order.locked - locked
+            if released < 0 and not hold_balance(user.id, currency_id, -released):
+                raise OrderAmendError("Not enough balance.")
+            Order.objects.filter(id=order.id).update(status="canceled", locked=0)
+            order = Order.objects.create(
+                user=user,
+                order_type="limit",
+                side=order.side,
+                base_currency_id=pair[0],
+                quote_currency_id=pair[1],
+                price=price,
+                amount=amount,
+                locked=locked,
+                time_in_force=order.time_in_force,
+                expires_at=order.expires_at,
+                post_only=order.post_only,
+            )
+            updates = [(order_id, None), (order.id, NEW_ORDER)]
 
-                        buyer_quote_balance.amount -= required_quote
-                        buyer_base_balance.amount += trade_amount
+        if released > 0:
+            WalletBalance.objects.filter(wallet__user=user, currency_id=currency_id).update(locked=F("locked") - released)
+        transaction.on_commit(lambda: push_book_updates({pair: updates}))
+    return order
 
-                        buyer_quote_balance.save()
-                        buyer_base_balance.save()
 
-                        seller_wallet = sell_order.user.wallet
-                        seller_quote_balance = WalletBalance.objects.select_for_update().get(wallet=seller_wallet, currency=sell_order.quote_currency)
-                        seller_base_balance = WalletBalance.objects.select_for_update().get(wallet=seller_wallet, currency=sell_order.base_currency)
+def push_new_orders(orders):
+    # 새 주문은 commit 이후 거래쌍별 변경 목록에 추가해 매칭 worker가 commit된 순서대로 호가창에 반영하도록 함
+    updates = defaultdict(list)
+    for order in orders:
+        updates[(order.base_currency_id, order.quote_currency_id)].append((order.id, NEW_ORDER))
+    if updates:
+        transaction.on_commit(lambda: push_book_updates(updates))
 
-                        seller_quote_balance.amount += required_quote
-                        seller_base_balance.amount -= trade_amount
 
-                        seller_quote_balance.save()
-                        seller_base_balance.save()
+def push_book_updates(updates):
+    # updates: {(base_currency_id, quote_currency_id): [(order_id, 줄어든 뒤 남은 수량, 취소 시 None 혹은 새 주문이면 NEW_ORDER)]}
+    pipeline = get_redis_connection("default").pipeline(transaction=False)
+    for (base_currency_id, quote_currency_id), entries in updates.items():
+        values = [str(order_id) if change is None else f"{order_id}:{change}" for order_id, change in entries]
+        pipeline.rpush(f"matching:updates:{base_currency_id}:{quote_currency_id}", *values)
+    pipeline.execute()
 
-                        buy_order.amount -= trade_amount
-                        sell_order.amount -= trade_amount
 
-                        if buy_order.amount == 0:
-                            buy_order.status = "completed"
-                        if sell_order.amount == 0:
-                            sell_order.status = "completed"
+def request_order_book_resync(base_currency_id, quote_currency_id):
+    # 다음 매칭 때 호가창을 DB의 미체결 주문과 비교하도록 표시
+    get_redis_connection("default").set(f"matching:resync:{base_currency_id}:{quote_currency_id}", 1)
 
-                        buy_order.save()
-                        sell_order.save()
 
-                    if buy_order.amount == 0:
-                        break
+def pop_book_updates(base_currency_id, quote_currency_id):
+    # 읽기와 삭제를 하나의 트랜잭션으로 실행해 그 사이에 추가된 변경이 유실되지 않도록 함
+    # (변경 목록, 호가창을 DB와 비교해야 하는지)를 반환
+    key, resync_key = f"matching:updates:{base_currency_id}:{quote_currency_id}", f"matching:resync:{base_currency_id}:{quote_currency_id}"
+    pipeline = get_redis_connection("default").pipeline()
+    pipeline.lrange(key, 0, -1)
+    pipeline.delete(key)
+    pipeline.delete(resync_key)
+    values, _, resync = pipeline.execute()
+    updates = []
+    for value in values:
+        order_id, _, change = value.decode().partition(":")
+        if not change:
+            updates.append((int(order_id), None))
+        else:
+            updates.append((int(order_id), change if change == NEW_ORDER else Decimal(change)))
+    return updates, bool(resync)
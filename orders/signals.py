@@ -1,22 +1,80 @@
+import json
+
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
+from django.db import transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
 from .models import Trade
+from markets.utils import set_last_prices, update_candles
+
+
+def serialize_trade(trade):
+    return {
+        "price": str(trade.price),
+        "amount": str(trade.amount),
+        "side": trade.taker_side,
+        "timestamp": trade.created_at.isoformat(),
+    }
+
+
+def send_trade_data(symbol, trade_data):
+    # 같은 거래쌍의 체결 목록을 하나의 메시지로 WebSocket에 전송, 내용은 consumers.py의 send_trade_data 함수 참고
+    channel_layer = get_channel_layer()
+    group_name = f"orders_{symbol}"
+    # 구독자마다 다시 직렬화하지 않도록 보내기 전에 한 번만 직렬화
+    async_to_sync(channel_layer.group_send)(group_name, {"type": "send_trade_data", "symbol": symbol, "text": json.dumps(trade_data)})
+
+
+def send_depth_data(symbol, depth_data):
+    # 호가 snapshot 혹은 변경을 WebSocket으로 전송, 내용은 consumers.py의 DepthConsumer 참고
+    channel_layer = get_channel_layer()
+    group_name = f"depth_{symbol}"
+    async_to_sync(channel_layer.group_send)(group_name, {"type": "send_depth_data", "symbol": symbol, "data": depth_data, "text": json.dumps(depth_data)})
+
+
+def send_ticker_data(symbol, text):
+    # 24시간 ticker를 WebSocket으로 전송, 이미 직렬화된 text를 그대로 전송
+    channel_layer = get_channel_layer()
+    group_name = f"ticker_{symbol}"
+    async_to_sync(channel_layer.group_send)(group_name, {"type": "send_ticker_data", "symbol": symbol, "text": text})
+
+
+def send_candle_data(symbol, interval, candle_data):
+    # 체결로 갱신된 최신 캔들을 WebSocket으로 전송, 내용은 consumers.py의 StreamConsumer 참고
+    channel_layer = get_channel_layer()
+    group_name = f"candles_{symbol}_{interval}"
+    text = json.dumps({"interval": interval, **candle_data})
+    async_to_sync(channel_layer.group_send)(group_name, {"type": "send_candle_data", "symbol": symbol, "interval": interval, "text": text})
+
+
+def send_indicator_data(symbol, interval, candle, indicators):
+    # 최신 캔들의 지표 값을 WebSocket으로 전송, 내용은 consumers.py의 send_indicator_data 함수 참고
+    channel_layer = get_channel_layer()
+    group_name = f"indicators_{symbol}_{interval}"
+
+    indicator_data = {
+        "interval": interval,
+        "timestamp": candle.open_time.isoformat(),
+        "indicators": indicators,
+    }
+    async_to_sync(channel_layer.group_send)(group_name, {"type": "send_indicator_data", "symbol": symbol, "data": indicator_data})
+
+
+# 매칭 엔진은 bulk_create로 체결을 기록하므로 post_save가 호출되지 않으며, 아래 signal은 직접 생성된 Trade에만 동작
+@receiver(post_save, sender=Trade)
+def update_trade_candles(sender, instance, created, **kwargs):
+    if created:
+        update_candles([instance])
+        last_prices = {(instance.base_currency_id, instance.quote_currency_id): instance.price}
+        transaction.on_commit(lambda: set_last_prices(last_prices))
 
 
 @receiver(post_save, sender=Trade)
 def send_trade_to_websocket(sender, instance, created, **kwargs):
-    # 거래가 생성되면 생성된 거래 데이터를 WebSocket으로 전송, 내용은 consumers.py의 send_trade_data 함수 참고
     if created:
-        channel_layer = get_channel_layer()
-        symbol = f"{instance.buy_order.base_currency.symbol}{instance.buy_order.quote_currency.symbol}"
-        group_name = f"orders_{symbol}"
-
-        trade_data = {
-            "price": str(instance.price),
-            "amount": str(instance.amount),
-            "timestamp": instance.created_at.isoformat(),
-        }
-        async_to_sync(channel_layer.group_send)(group_name, {"type": "send_trade_data", "data": trade_data})
+        # 체결이 commit된 이후에만 전송
+        trade_data = [serialize_trade(instance)]
+        symbol = f"{instance.base_currency.symbol}{instance.quote_currency.symbol}"
+        transaction.on_commit(lambda: send_trade_data(symbol, trade_data))
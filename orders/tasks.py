@@ -1,9 +1,95 @@
+import logging
+import os
+import socket
+import time
+import zlib
+from datetime import datetime, timezone as dt_timezone
+
 from celery import shared_task
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import LockNotOwnedError
+
+from .services import StaleOrderBookError, drop_order_book, match_trading_pair, request_order_book_resync
+from markets.models import TradingPair
+
+logger = logging.getLogger(__name__)
+
+# 한 번의 매칭이 이 시간보다 오래 걸리면 lock이 풀려 다른 worker가 거래쌍을 가져갈 수 있음
+MATCHING_LOCK_TIMEOUT = 60
+MATCHING_PENDING_TIMEOUT = 10
+# Redis broker는 visibility_timeout(기본 1시간)보다 먼 ETA task를 매시간 다시 전달하고 worker 메모리에 계속 들고 있으므로
+# 이보다 늦게 만료되는 GTD 주문은 ETA task 없이 beat의 주기적인 매칭에서 time wheel로 만료
+ORDER_EXPIRY_SCHEDULE_LIMIT = 60 * 50
+
+
+def matching_queue(base_currency_id, quote_currency_id):
+    # 거래쌍을 항상 같은 파티션 큐로 보내 거래쌍마다 하나의 worker만 매칭하도록 함
+    partition = zlib.crc32(f"{base_currency_id}:{quote_currency_id}".encode()) % settings.MATCHING_PARTITIONS
+    return f"matching-{partition}"
+
+
+def dispatch_trading_pair_matching(base_currency_id, quote_currency_id):
+    # 이미 대기 중인 매칭 task가 있다면 새로 보내지 않고 합쳐서 주문이 몰려도 거래쌍마다 한 번만 매칭
+    # task가 유실되더라도 MATCHING_PENDING_TIMEOUT 이후에는 다시 요청할 수 있음
+    redis_conn = get_redis_connection("default")
+    if redis_conn.set(f"matching:pending:{base_currency_id}:{quote_currency_id}", 1, nx=True, ex=MATCHING_PENDING_TIMEOUT):
+        run_trading_pair_matching_engine.apply_async(args=[base_currency_id, quote_currency_id], queue=matching_queue(base_currency_id, quote_currency_id))
 
-from .services import match_orders
+
+def schedule_order_expiry(base_currency_id, quote_currency_id, expires_at):
+    # GTD 주문이 만료되는 시점에 매칭을 요청해 worker가 time wheel에서 만료된 주문을 꺼내도록 함
+    # 같은 거래쌍에서 같은 초에 만료되는 주문끼리는 하나의 요청으로 합침
+    tick = int(expires_at.timestamp())
+    if tick - time.time() > ORDER_EXPIRY_SCHEDULE_LIMIT:
+        return
+    redis_conn = get_redis_connection("default")
+    if redis_conn.set(f"matching:expiry:{base_currency_id}:{quote_currency_id}:{tick}", 1, nx=True, ex=max(tick - int(time.time()), 0) + MATCHING_PENDING_TIMEOUT):
+        eta = datetime.fromtimestamp(tick + 1, tz=dt_timezone.utc)
+        run_trading_pair_matching_engine.apply_async(args=[base_currency_id, quote_currency_id], queue=matching_queue(base_currency_id, quote_currency_id), eta=eta)
 
 
 # shared_task는 celery가 해당 함수를 task로 인식
 @shared_task
 def run_matching_engine():
-    match_orders()
+    # 매칭은 주문 접수 시 거래쌍 단위로 요청되며, beat는 유실된 요청을 복구하기 위해 활성화된 거래쌍 전체에 매칭을 요청
+    # 유실된 호가창 변경도 복구하도록 다음 매칭에서 호가창을 DB의 미체결 주문과 비교
+    for base_currency_id, quote_currency_id in TradingPair.objects.filter(is_active=True).values_list("base_asset_id", "quote_asset_id"):
+        request_order_book_resync(base_currency_id, quote_currency_id)
+        dispatch_trading_pair_matching(base_currency_id, quote_currency_id)
+
+
+# bind=True로 설정하면 task 인스턴스가 첫 번째 인자로 전달되어 retry를 호출할 수 있음
+@shared_task(bind=True, max_retries=None)
+def run_trading_pair_matching_engine(self, base_currency_id, quote_currency_id):
+    redis_conn = get_redis_connection("default")
+
+    # 파티션 큐 설정이 잘못되어 같은 거래쌍이 동시에 실행되더라도 lock으로 하나의 프로세스만 매칭하도록 보장
+    # 대기 중 표시는 이미 이 task를 가리키므로 그냥 종료하면 요청이 유실될 수 있어 잠시 후 다시 시도
+    lock = redis_conn.lock(f"matching:lock:{base_currency_id}:{quote_currency_id}", timeout=MATCHING_LOCK_TIMEOUT, blocking=False)
+    if not lock.acquire():
+        logger.info("Trading pair %s/%s is being matched by another worker.", base_currency_id, quote_currency_id)
+        raise self.retry(countdown=0.05)
+
+    try:
+        # DB를 읽기 전에 대기 중 표시를 지워야 매칭 도중 들어온 주문이 다음 task를 요청할 수 있음
+        redis_conn.delete(f"matching:pending:{base_currency_id}:{quote_currency_id}")
+
+        # 마지막으로 이 거래쌍을 매칭한 프로세스가 자신이 아니라면 메모리의 호가창은 오래된 상태이므로 DB에서 다시 생성
+        owner_key = f"matching:owner:{base_currency_id}:{quote_currency_id}"
+        owner = f"{socket.gethostname()}:{os.getpid()}"
+        if redis_conn.set(owner_key, owner, get=True) != owner.encode():
+            drop_order_book(base_currency_id, quote_currency_id)
+
+        try:
+            match_trading_pair(base_currency_id, quote_currency_id)
+        except StaleOrderBookError:
+            # 호가창은 이미 버려졌고 이번에 꺼낸 새 주문은 다음 매칭에서 DB로부터 다시 읽으므로 바로 다시 매칭을 요청
+            logger.warning("Order book for trading pair %s/%s is stale, rebuilding.", base_currency_id, quote_currency_id)
+            dispatch_trading_pair_matching(base_currency_id, quote_currency_id)
+    finally:
+        # 매칭이 lock timeout보다 오래 걸렸다면 lock은 이미 만료되었지만 매칭 결과는 commit되었으므로 task를 실패시키지 않음
+        try:
+            lock.release()
+        except LockNotOwnedError:
+            logger.warning("Matching lock for trading pair %s/%s expired before release.", base_currency_id, quote_currency_id)
@@ -1,18 +1,46 @@
 import base64
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
 import pyotp
 import redis
 from django.conf import settings
 from asgiref.sync import async_to_sync, sync_to_async
+from celery.exceptions import Retry
+from channels.layers import get_channel_layer
 from channels.testing import WebsocketCommunicator
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django_redis import get_redis_connection
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 
+from .consumers import TradeConsumer
+from .engine import OrderBook
 from .models import Order, Trade
-from .tasks import match_orders
-from markets.models import CryptoCurrency
+from .services import (
+    NEW_ORDER,
+    StaleOrderBookError,
+    amend_order,
+    cancel_orders,
+    drop_order_book,
+    get_order_book,
+    hold_balance,
+    match_orders,
+    open_orders,
+    order_hold,
+    publish_candles,
+    push_book_updates,
+    request_order_book_resync,
+)
+from .tasks import ORDER_EXPIRY_SCHEDULE_LIMIT, dispatch_trading_pair_matching, matching_queue, run_trading_pair_matching_engine, schedule_order_expiry
+from markets.models import Candle, CryptoCurrency, TradingPair
+from markets.utils import clear_candle_cache, get_last_price, set_last_prices
 from users.models import CustomUserTOTPDevice
 from tradehive.asgi import application
 
@@ -26,6 +54,13 @@ USER_DATA = {
 User = get_user_model()
 
 
+def create_open_order(**fields):
+    # 주문 API와 같이 commit 이후 새 주문을 거래쌍별 변경 목록에 추가
+    order = Order.objects.create(**fields)
+    push_book_updates({(order.base_currency_id, order.quote_currency_id): [(order.id, NEW_ORDER)]})
+    return order
+
+
 class SecureClient(APIClient):
     def get(self, *args, **kwargs):
         kwargs["secure"] = True
@@ -86,9 +121,14 @@ class OrderAPITestCase(BaseAPITestCase):
 
         self.krw = CryptoCurrency.objects.create(symbol="KRW", name="Korean Won")
         self.btc = CryptoCurrency.objects.create(symbol="BTC", name="Bitcoin")
+        self.trading_pair = TradingPair.objects.create(
+            base_asset=self.btc, quote_asset=self.krw, min_price=1, max_price=1000000, tick_size="0.5", min_quantity="0.001", max_quantity=100, step_size="0.001"
+        )
 
         self.user.wallet.balances.create(currency=self.krw, amount=100000)
         self.user.wallet.balances.create(currency=self.btc, amount=10)
+        # 시장가 매수는 마지막 체결가를 기준으로 잔고를 예약
+        set_last_prices({(self.btc.id, self.krw.id): Decimal("100")})
 
         self.valid_limit_order_data = {"order_type": "limit", "price": "100.00", "amount": "1.5", "base_currency": "BTC", "quote_currency": "KRW"}
         self.valid_market_order_data = {"order_type": "market", "amount": "1.5", "base_currency": "BTC", "quote_currency": "KRW"}
@@ -102,6 +142,268 @@ class OrderAPITestCase(BaseAPITestCase):
         self.assertEqual(Order.objects.count(), 1)
         self.assertEqual(Order.objects.first().user, self.user)
 
+    def test_order_requests_matching_on_commit(self):
+        with mock.patch("orders.tasks.run_trading_pair_matching_engine.apply_async") as apply_async:
+            # 주문이 몰려도 대기 중인 매칭 요청은 거래쌍마다 하나로 합쳐짐
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post("/orders/order/", {**self.valid_limit_order_data, "side": "buy"})
+                self.client.post("/orders/order/", {**self.valid_limit_order_data, "side": "sell"})
+        self.assertEqual(apply_async.call_count, 1)
+        self.assertEqual(apply_async.call_args.kwargs["args"], [self.btc.id, self.krw.id])
+        self.assertEqual(apply_async.call_args.kwargs["queue"], matching_queue(self.btc.id, self.krw.id))
+
+    def test_order_skips_reference_data_queries(self):
+        self.client.post("/orders/order/", {**self.valid_limit_order_data, "side": "buy"})
+
+        # 통화 정보는 프로세스 메모리에 캐시되어 있으므로 이후 주문에서는 통화 테이블을 읽지 않음
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/orders/order/", {**self.valid_limit_order_data, "side": "buy"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse([query["sql"] for query in queries if 'FROM "cryptocurrencies"' in query["sql"] or 'FROM "trading_pairs"' in query["sql"]])
+
+    def tearDown(self):
+        get_redis_connection("default").hdel("last_prices", f"{self.btc.id}:{self.krw.id}")
+        return super().tearDown()
+
+    def test_order_holds_balance(self):
+        self.user.wallet.balances.filter(currency=self.krw).update(amount=200)
+
+        # 이미 예약된 잔고는 다음 주문에 사용할 수 없음
+        response = self.client.post("/orders/order/", {**self.valid_limit_order_data, "side": "buy"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post("/orders/order/", {**self.valid_limit_order_data, "side": "buy"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertEqual(Order.objects.get().locked, Decimal("150"))
+        krw_balance = self.user.wallet.balances.get(currency=self.krw)
+        self.assertEqual((krw_balance.amount, krw_balance.locked), (Decimal("200"), Decimal("150")))
+
+    def test_order_market_buy_holds_slippage(self):
+        response = self.client.post("/orders/order/", {**self.valid_market_order_data, "side": "buy"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # 마지막 체결가 100에 slippage 한도(5%)를 더한 가격으로 예약
+        self.assertEqual(self.user.wallet.balances.get(currency=self.krw).locked, Decimal("157.5"))
+
+    def test_order_market_buy_without_last_price(self):
+        get_redis_connection("default").hset("last_prices", f"{self.btc.id}:{self.krw.id}", "")
+        response = self.client.post("/orders/order/", {**self.valid_market_order_data, "side": "buy"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_batch_orders(self):
+        self.user.wallet.balances.filter(currency=self.krw).update(amount=400)
+        orders = [{**self.valid_limit_order_data, "side": "buy"} for _ in range(3)] + [{**self.valid_limit_order_data, "side": "sell"}]
+
+        # atomic이면 잔고가 부족한 주문이 하나라도 있을 때 모두 거절
+        response = self.client.post("/orders/order/batch/", {"orders": orders}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([result["status"] for result in response.data["results"]], ["rejected"] * 4)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.user.wallet.balances.get(currency=self.krw).locked, 0)
+
+        # 예약할 수 있는 주문만 한 번의 INSERT로 생성
+        with mock.patch("orders.tasks.run_trading_pair_matching_engine.apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.post("/orders/order/batch/", {"orders": orders, "atomic": False}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([result["status"] for result in response.data["results"]], ["created", "created", "rejected", "created"])
+        self.assertEqual(len([query for query in queries if query["sql"].startswith('INSERT INTO "orders_order"')]), 1)
+        apply_async.assert_called_once()
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(self.user.wallet.balances.get(currency=self.krw).locked, Decimal("300"))
+        self.assertEqual(self.user.wallet.balances.get(currency=self.btc).locked, Decimal("1.5"))
+
+    def test_batch_orders_invalid_order(self):
+        orders = [{**self.valid_limit_order_data, "side": "buy"}, {**self.valid_limit_order_data, "price": "100.25", "side": "buy"}]
+
+        response = self.client.post("/orders/order/batch/", {"orders": orders}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+        response = self.client.post("/orders/order/batch/", {"orders": orders, "atomic": False}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["results"][0]["order"]["id"], Order.objects.get().id)
+        self.assertEqual(response.data["results"][1]["status"], "rejected")
+
+        response = self.client.post("/orders/order/batch/", {"orders": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cancel_order(self):
+        order_id = self.client.post("/orders/order/", {**self.valid_limit_order_data, "side": "buy"}).data["id"]
+        redis_conn = get_redis_connection("default")
+        redis_conn.delete(f"matching:updates:{self.btc.id}:{self.krw.id}")
+
+        with mock.patch("orders.tasks.run_trading_pair_matching_engine.apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete(f"/orders/order/{order_id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["canceled"], [order_id])
+        apply_async.assert_called_once()
+
+        # 예약된 잔고를 해제하고 매칭 worker가 호가창에서 제거하도록 취소 목록에 추가
+        order = Order.objects.get(id=order_id)
+        self.assertEqual((order.status, order.locked), ("canceled", 0))
+        self.assertEqual(self.user.wallet.balances.get(currency=self.krw).locked, 0)
+        self.assertEqual(redis_conn.lrange(f"matching:updates:{self.btc.id}:{self.krw.id}", 0, -1), [str(order_id).encode()])
+        redis_conn.delete(f"matching:updates:{self.btc.id}:{self.krw.id}")
+
+        response = self.client.delete(f"/orders/order/{order_id}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_amend_order_reduce(self):
+        order_id = self.client.post("/orders/order/", {**self.valid_limit_order_data, "side": "sell"}).data["id"]
+        redis_conn = get_redis_connection("default")
+        key = f"matching:updates:{self.btc.id}:{self.krw.id}"
+
+        # 수량만 줄이면 같은 주문을 수정해 우선순위를 유지하고 줄어든 만큼 예약을 해제
+        with mock.patch("orders.tasks.run_trading_pair_matching_engine.apply_async"):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(f"/orders/order/{order_id}/", {"amount": "1.0"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["id"], order_id)
+        order = Order.objects.get(id=order_id)
+        self.assertEqual((order.amount, order.locked), (Decimal("1"), Decimal("1")))
+        self.assertEqual(self.user.wallet.balances.get(currency=self.btc).locked, Decimal("1"))
+        self.assertEqual(redis_conn.lrange(key, 0, -1), [f"{order_id}:1.00000000".encode()])
+        redis_conn.delete(key)
+
+    def test_amend_order_price(self):
+        order_id = self.client.post("/orders/order/", {**self.valid_limit_order_data, "side": "buy"}).data["id"]
+        redis_conn = get_redis_connection("default")
+        key = f"matching:updates:{self.btc.id}:{self.krw.id}"
+
+        # 가격을 바꾸면 기존 주문을 취소하고 새 주문으로 다시 접수하며, 예약은 새 가격에 맞춰 조정
+        with mock.patch("orders.tasks.run_trading_pair_matching_engine.apply_async"):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(f"/orders/order/{order_id}/", {"price": "110"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.data["id"], order_id)
+        self.assertEqual(Order.objects.get(id=order_id).status, "canceled")
+        new_order = Order.objects.get(id=response.data["id"])
+        self.assertEqual((new_order.status, new_order.price, new_order.amount, new_order.locked), ("open", Decimal("110"), Decimal("1.5"), Decimal("165")))
+        self.assertEqual(self.user.wallet.balances.get(currency=self.krw).locked, Decimal("165"))
+        self.assertEqual(redis_conn.lrange(key, 0, -1), [str(order_id).encode(), f"{new_order.id}:new".encode()])
+        redis_conn.delete(key)
+
+    def test_amend_order_invalid(self):
+        order_id = self.client.post("/orders/order/", {**self.valid_limit_order_data, "side": "buy"}).data["id"]
+        for data in [{}, {"price": "100.25"}, {"amount": "1.0005"}, {"price": "100000"}, {"price": "0"}, {"amount": "0"}, {"amount": "-1"}]:
+            with self.subTest(**data):
+                response = self.client.patch(f"/orders/order/{order_id}/", data)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        order = Order.objects.get(id=order_id)
+        self.assertEqual((order.status, order.price), ("open", Decimal("100")))
+
+        response = self.client.patch(f"/orders/order/{order_id + 1}/", {"price": "110"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_order_time_in_force_validation(self):
+        expires_at = (timezone.now() + timedelta(minutes=5)).isoformat()
+        invalid_orders = [
+            {**self.valid_limit_order_data, "time_in_force": "GTD"},
+            {**self.valid_limit_order_data, "time_in_force": "GTD", "expires_at": (timezone.now() - timedelta(minutes=5)).isoformat()},
+            {**self.valid_limit_order_data, "expires_at": expires_at},
+            {**self.valid_limit_order_data, "time_in_force": "IOC", "post_only": True},
+            {**self.valid_market_order_data, "time_in_force": "FOK"},
+            {**self.valid_limit_order_data, "time_in_force": "DAY"},
+        ]
+        for invalid_order in invalid_orders:
+            with self.subTest(**invalid_order):
+                response = self.client.post("/orders/order/", {**invalid_order, "side": "buy"})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+        # GTD 주문은 만료 시점에 매칭이 실행되도록 예약
+        with mock.patch("orders.tasks.run_trading_pair_matching_engine.apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post("/orders/order/", {**self.valid_limit_order_data, "time_in_force": "GTD", "expires_at": expires_at, "side": "buy"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["time_in_force"], "GTD")
+        self.assertEqual(apply_async.call_count, 2)
+        self.assertGreater(apply_async.call_args_list[1].kwargs["eta"], timezone.now() + timedelta(minutes=4))
+
+    def test_order_post_only_crossing(self):
+        redis_conn = get_redis_connection("default")
+        redis_conn.hset("tickers", "BTC/KRW", json.dumps({"symbol": "BTC/KRW", "best_bid": "99", "best_ask": "100"}))
+
+        # 최우선 호가와 교차하는 post-only 주문은 잔고를 예약하기 전에 거절
+        response = self.client.post("/orders/order/", {**self.valid_limit_order_data, "post_only": True, "side": "buy"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.user.wallet.balances.get(currency=self.krw).locked, 0)
+
+        response = self.client.post("/orders/order/", {**self.valid_limit_order_data, "price": "99.5", "post_only": True, "side": "buy"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        redis_conn.hdel("tickers", "BTC/KRW")
+
+    def test_cancel_order_other_user(self):
+        other_user = User.objects.create_user(**{**USER_DATA, "email": "anothertest@example.com", "username": "anothertestuser"})
+        order = Order.objects.create(user=other_user, side="sell", order_type="limit", price=100, amount=1, base_currency=self.btc, quote_currency=self.krw)
+        response = self.client.delete(f"/orders/order/{order.id}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Order.objects.get(id=order.id).status, "open")
+
+    def test_cancel_all_orders(self):
+        eth = CryptoCurrency.objects.create(symbol="ETH", name="Ethereum")
+        Order.objects.create(user=self.user, side="sell", order_type="limit", price=100, amount=1, base_currency=eth, quote_currency=self.krw)
+        order_ids = [self.client.post("/orders/order/", {**self.valid_limit_order_data, "side": side}).data["id"] for side in ["buy", "sell"]]
+
+        response = self.client.delete("/orders/order/", QUERY_STRING="symbol=DOGE/KRW")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # 거래쌍을 지정하면 해당 거래쌍의 주문만 하나의 UPDATE로 취소
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete("/orders/order/", QUERY_STRING="symbol=BTC/KRW")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["canceled"], order_ids)
+        self.assertEqual(len([query for query in queries if query["sql"].startswith('UPDATE "orders_order"')]), 1)
+        self.assertEqual(Order.objects.filter(status="open").count(), 1)
+        for currency in [self.krw, self.btc]:
+            self.assertEqual(self.user.wallet.balances.get(currency=currency).locked, 0)
+
+        response = self.client.delete("/orders/order/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["canceled"]), 1)
+        self.assertFalse(Order.objects.filter(status="open").exists())
+
+    def test_order_requires_trading_pair(self):
+        self.trading_pair.delete()
+        response = self.client.post("/orders/order/", {**self.valid_limit_order_data, "side": "buy"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_order_inactive_trading_pair(self):
+        self.trading_pair.is_active = False
+        self.trading_pair.save()
+        response = self.client.post("/orders/order/", {**self.valid_limit_order_data, "side": "buy"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_order_trading_pair_rules(self):
+        invalid_orders = [
+            # tick size(0.5)의 배수가 아닌 가격
+            {"price": "100.25"},
+            # 가격 범위를 벗어난 주문
+            {"price": "0.5"},
+            {"price": "1000000.5"},
+            # step size(0.001)의 배수가 아닌 수량
+            {"amount": "1.0005"},
+            # 수량 범위를 벗어난 주문
+            {"amount": "0.0005"},
+            {"amount": "100.001"},
+        ]
+        for invalid_order in invalid_orders:
+            with self.subTest(**invalid_order):
+                response = self.client.post("/orders/order/", {**self.valid_limit_order_data, **invalid_order, "side": "sell"})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.count(), 0)
+
+        response = self.client.post("/orders/order/", {**self.valid_limit_order_data, "price": "100.5", "amount": "1.001", "side": "sell"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # 시장가 주문은 가격 없이 수량 규칙만 검사
+        response = self.client.post("/orders/order/", {**self.valid_market_order_data, "amount": "1.0005", "side": "sell"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_order_buy_limit_missing_price(self):
         response = self.client.post("/orders/order/", {**self.invalid_limit_order_data, "side": "buy"})
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -182,8 +484,9 @@ class TradeAPITestCase(BaseAPITestCase):
         super().setUp()
         self.authenticate_user()
 
-        krw = CryptoCurrency.objects.create(symbol="KRW", name="Korean Won")
-        btc = CryptoCurrency.objects.create(symbol="BTC", name="Bitcoin")
+        self.krw = krw = CryptoCurrency.objects.create(symbol="KRW", name="Korean Won")
+        self.btc = btc = CryptoCurrency.objects.create(symbol="BTC", name="Bitcoin")
+        TradingPair.objects.create(base_asset=btc, quote_asset=krw, min_price=1, max_price=1000000, tick_size=1, min_quantity="0.001", max_quantity=100, step_size="0.001")
 
         self.base_krw_amount = 100000
         self.base_btc_amount = 10
@@ -202,6 +505,13 @@ class TradeAPITestCase(BaseAPITestCase):
         self.buy_order = Order.objects.create(user=self.buyer, side="buy", order_type="limit", price=self.price, amount=self.amount, base_currency=btc, quote_currency=krw)
         self.sell_order = Order.objects.create(user=self.seller, side="sell", order_type="limit", price=self.price, amount=self.amount, base_currency=btc, quote_currency=krw)
 
+    def place_order(self, user, side, amount, price=None, order_type="limit", locked=None, **options):
+        # 주문 API와 같이 필요한 잔고를 먼저 예약한 뒤 주문을 생성
+        if locked is None:
+            locked = order_hold(side, order_type, price and Decimal(price), Decimal(amount), Decimal(self.price))
+        self.assertTrue(hold_balance(user.id, self.krw.id if side == "buy" else self.btc.id, locked))
+        return create_open_order(user=user, side=side, order_type=order_type, price=price, amount=amount, locked=locked, base_currency=self.btc, quote_currency=self.krw, **options)
+
     def test_trade_match_success(self):
         match_orders()
         self.assertEqual(Order.objects.get(id=self.buy_order.id).status, "completed")
@@ -221,8 +531,625 @@ class TradeAPITestCase(BaseAPITestCase):
         self.assertEqual(self.user.wallet.balances.get(currency__symbol="KRW").amount, 100000)
         self.assertEqual(self.user.wallet.balances.get(currency__symbol="BTC").amount, 10)
 
+    def test_trade_match_trading_pair(self):
+        match_orders()
+        trade = Trade.objects.get()
+        self.assertEqual((trade.base_currency_id, trade.quote_currency_id), (self.buy_order.base_currency_id, self.buy_order.quote_currency_id))
+        self.assertEqual(trade.taker_side, "sell")
+
+    def test_trade_match_partial_fill(self):
+        self.sell_order.amount = "1.0"
+        self.sell_order.save()
+
+        match_orders()
+        buy_order = Order.objects.get(id=self.buy_order.id)
+        self.assertEqual(buy_order.status, "open")
+        self.assertEqual(buy_order.amount, Decimal("0.5"))
+        self.assertEqual(Order.objects.get(id=self.sell_order.id).status, "completed")
+        self.assertEqual(Trade.objects.count(), 1)
+
+    def test_trade_match_incremental(self):
+        match_orders()
+        self.assertEqual(Trade.objects.count(), 1)
+
+        # 이미 반영된 주문은 다시 매칭하지 않고 새로 들어온 주문만 호가창에 제출
+        match_orders()
+        self.assertEqual(Trade.objects.count(), 1)
+
+        create_open_order(
+            user=self.seller, side="sell", order_type="limit", price=90, amount=1, base_currency=self.sell_order.base_currency, quote_currency=self.sell_order.quote_currency
+        )
+        create_open_order(
+            user=self.buyer, side="buy", order_type="limit", price=95, amount=1, base_currency=self.buy_order.base_currency, quote_currency=self.buy_order.quote_currency
+        )
+        match_orders()
+        self.assertEqual(Trade.objects.count(), 2)
+        self.assertEqual(Trade.objects.last().price, 90)
+
+    def test_trade_match_commit_order(self):
+        self.buy_order.price = "50.00"
+        self.buy_order.save()
+        match_orders()
+
+        # id가 작은 주문이 나중에 commit되어도 변경 목록에 추가된 순서대로 호가창에 반영
+        earlier_order = Order.objects.create(user=self.buyer, side="buy", order_type="limit", price=self.price, amount="1", base_currency=self.btc, quote_currency=self.krw)
+        later_order = create_open_order(user=self.buyer, side="buy", order_type="limit", price=60, amount="1", base_currency=self.btc, quote_currency=self.krw)
+        match_orders()
+        book = get_order_book(self.btc.id, self.krw.id)
+        self.assertIn(later_order.id, book)
+        self.assertNotIn(earlier_order.id, book)
+
+        push_book_updates({(self.btc.id, self.krw.id): [(earlier_order.id, NEW_ORDER)]})
+        match_orders()
+        self.assertEqual(Trade.objects.get().buy_order_id, earlier_order.id)
+
+    def test_trade_match_resync(self):
+        self.buy_order.price = "50.00"
+        self.buy_order.save()
+        match_orders()
+        book = get_order_book(self.btc.id, self.krw.id)
+
+        # 변경 목록 추가가 유실된 주문은 beat가 요청한 비교에서 호가창에 반영되고, 취소된 주문은 제거
+        lost_order = Order.objects.create(user=self.buyer, side="buy", order_type="limit", price=60, amount="1", base_currency=self.btc, quote_currency=self.krw)
+        Order.objects.filter(id=self.buy_order.id).update(status="canceled")
+        match_orders()
+        self.assertNotIn(lost_order.id, book)
+        self.assertIn(self.buy_order.id, book)
+
+        request_order_book_resync(self.btc.id, self.krw.id)
+        match_orders()
+        self.assertIn(lost_order.id, book)
+        self.assertNotIn(self.buy_order.id, book)
+
+    def test_trade_match_batched_settlement(self):
+        base_currency, quote_currency = self.sell_order.base_currency, self.sell_order.quote_currency
+        self.sell_order.amount = "0.5"
+        self.sell_order.save()
+        for price in [99, 98]:
+            Order.objects.create(user=self.seller, side="sell", order_type="limit", price=price, amount="0.5", base_currency=base_currency, quote_currency=quote_currency)
+
+        # 매수 주문이 먼저 들어와 maker가 되므로 모든 체결은 매수 주문의 가격으로 이루어짐
+        with CaptureQueriesContext(connection) as context:
+            match_orders()
+        trade_inserts = [query for query in context.captured_queries if query["sql"].startswith('INSERT INTO "orders_trade"')]
+        self.assertEqual(len(trade_inserts), 1)
+        self.assertEqual(Trade.objects.count(), 3)
+        self.assertEqual(Order.objects.get(id=self.buy_order.id).status, "completed")
+        self.assertEqual(self.buyer.wallet.balances.get(currency__symbol="KRW").amount, self.base_krw_amount - Decimal("150"))
+        self.assertEqual(self.seller.wallet.balances.get(currency__symbol="BTC").amount, self.base_btc_amount - Decimal("1.5"))
+
+    def test_trade_match_batched_publish(self):
+        Order.objects.create(
+            user=self.seller, side="sell", order_type="limit", price=99, amount="0.5", base_currency=self.sell_order.base_currency, quote_currency=self.sell_order.quote_currency
+        )
+        self.buy_order.amount = "2.0"
+        self.buy_order.save()
+
+        # 체결은 commit 이후에 거래쌍별로 한 번만 전송
+        with mock.patch("orders.services.send_trade_data") as send_trade_data:
+            with self.captureOnCommitCallbacks() as callbacks:
+                match_orders()
+            send_trade_data.assert_not_called()
+            with self.assertNumQueries(0):
+                for callback in callbacks[:2]:
+                    callback()
+
+        send_trade_data.assert_called_once()
+        symbol, trade_data = send_trade_data.call_args.args
+        self.assertEqual(symbol, "BTCKRW")
+        self.assertEqual([trade["amount"] for trade in trade_data], ["1.50000000", "0.50000000"])
+
+    def test_trade_match_updates_ticker(self):
+        redis_conn = get_redis_connection("default")
+        redis_conn.delete("tickers")
+        with self.captureOnCommitCallbacks(execute=True):
+            match_orders()
+        ticker = json.loads(redis_conn.hget("tickers", "BTC/KRW"))
+        self.assertEqual((ticker["last_price"], ticker["volume"], ticker["best_bid"]), ("100.00000000", "1.50000000", None))
+
+        # 이후 체결은 DB를 다시 읽지 않고 메모리의 bucket에 반영
+        create_open_order(
+            user=self.seller, side="sell", order_type="limit", price=90, amount=1, base_currency=self.sell_order.base_currency, quote_currency=self.sell_order.quote_currency
+        )
+        create_open_order(
+            user=self.buyer, side="buy", order_type="limit", price=95, amount=2, base_currency=self.buy_order.base_currency, quote_currency=self.buy_order.quote_currency
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            match_orders()
+        ticker = json.loads(redis_conn.hget("tickers", "BTC/KRW"))
+        self.assertEqual((ticker["last_price"], ticker["low"], ticker["high"], ticker["best_bid"]), ("90.00000000", "90.00000000", "100.00000000", "95.00000000"))
+        self.assertEqual(Decimal(ticker["volume"]), Decimal("2.5"))
+        redis_conn.delete("tickers")
+
+    def test_trade_match_records_last_price(self):
+        base_currency_id, quote_currency_id = self.buy_order.base_currency_id, self.buy_order.quote_currency_id
+        redis_conn = get_redis_connection("default")
+        redis_conn.hdel("last_prices", f"{base_currency_id}:{quote_currency_id}")
+
+        # 체결이 없는 거래쌍도 한 번 조회한 뒤에는 DB를 다시 읽지 않음
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_last_price(base_currency_id, quote_currency_id))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_last_price(base_currency_id, quote_currency_id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            match_orders()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_last_price(base_currency_id, quote_currency_id), Decimal("100"))
+
+    def test_trade_match_creates_missing_balance(self):
+        self.buyer.wallet.balances.filter(currency__symbol="BTC").delete()
+
+        match_orders()
+        self.assertEqual(self.buyer.wallet.balances.get(currency__symbol="BTC").amount, Decimal("1.5"))
+
+    def test_trade_match_stale_order_book(self):
+        self.buy_order.price = "50.00"
+        self.buy_order.save()
+        match_orders()
+
+        # 호가창에 올라간 주문이 DB에서 변경되면 매칭을 되돌리고 호가창을 다시 생성
+        Order.objects.filter(id=self.sell_order.id).update(status="canceled")
+        create_open_order(
+            user=self.buyer,
+            side="buy",
+            order_type="limit",
+            price=self.price,
+            amount=self.amount,
+            base_currency=self.sell_order.base_currency,
+            quote_currency=self.sell_order.quote_currency,
+        )
+        with self.assertRaises(StaleOrderBookError):
+            match_orders()
+        self.assertEqual(Trade.objects.count(), 0)
+
+        match_orders()
+        self.assertEqual(Trade.objects.count(), 0)
+        self.assertEqual(Order.objects.filter(status="open").count(), 2)
+
+    def test_trade_match_market_order(self):
+        base_currency, quote_currency = self.sell_order.base_currency, self.sell_order.quote_currency
+        Order.objects.create(user=self.seller, side="sell", order_type="limit", price=102, amount="1", base_currency=base_currency, quote_currency=quote_currency)
+        Order.objects.create(user=self.seller, side="sell", order_type="limit", price=110, amount="1", base_currency=base_currency, quote_currency=quote_currency)
+        self.buy_order.delete()
+        match_orders()
+
+        # slippage 범위(기본 5%)를 벗어난 110 호가는 체결되지 않고 남은 수량은 취소
+        market_order = self.place_order(self.buyer, "buy", "3", order_type="market")
+        match_orders()
+        market_order.refresh_from_db()
+        self.assertEqual(market_order.status, "canceled")
+        self.assertEqual(market_order.amount, Decimal("0.5"))
+        self.assertEqual(sorted(Trade.objects.values_list("price", flat=True)), [100, 102])
+        # 체결되지 않은 수량에 예약된 잔고는 해제
+        krw_balance = self.buyer.wallet.balances.get(currency__symbol="KRW")
+        self.assertEqual((krw_balance.amount, krw_balance.locked, market_order.locked), (self.base_krw_amount - Decimal("252"), 0, 0))
+
+    def test_trade_match_market_order_no_liquidity(self):
+        self.sell_order.delete()
+        market_order = Order.objects.create(
+            user=self.seller, side="sell", order_type="market", amount="1", base_currency=self.buy_order.base_currency, quote_currency=self.buy_order.quote_currency
+        )
+        self.buy_order.delete()
+
+        match_orders()
+        market_order.refresh_from_db()
+        self.assertEqual(market_order.status, "canceled")
+        self.assertEqual(Trade.objects.count(), 0)
+
+    def test_trade_match_market_order_budget(self):
+        self.buyer.wallet.balances.filter(currency__symbol="KRW").update(amount=50)
+        self.buy_order.delete()
+        # 예약한 잔고만큼만 체결
+        market_order = self.place_order(self.buyer, "buy", "1", order_type="market", locked=Decimal("50"))
+
+        match_orders()
+        market_order.refresh_from_db()
+        self.assertEqual(market_order.status, "canceled")
+        self.assertEqual(Trade.objects.get().amount, Decimal("0.5"))
+        self.assertEqual(self.buyer.wallet.balances.get(currency__symbol="KRW").amount, 0)
+
+    def test_trade_match_releases_holds(self):
+        Order.objects.all().delete()
+        sell_order = self.place_order(self.seller, "sell", "1", "100")
+        buy_order = self.place_order(self.buyer, "buy", "2", "110")
+
+        # 매수 주문은 더 낮은 maker 가격으로 일부 체결되며, 남은 수량에 대한 예약만 유지
+        match_orders()
+        sell_order.refresh_from_db()
+        buy_order.refresh_from_db()
+        self.assertEqual((sell_order.status, sell_order.locked), ("completed", 0))
+        self.assertEqual((buy_order.status, buy_order.locked), ("open", Decimal("120")))
+        self.assertEqual(self.seller.wallet.balances.get(currency__symbol="BTC").locked, 0)
+        krw_balance = self.buyer.wallet.balances.get(currency__symbol="KRW")
+        self.assertEqual((krw_balance.amount, krw_balance.locked), (self.base_krw_amount - Decimal("100"), Decimal("120")))
+
+        # 주문이 완료되면 가격 개선분을 포함해 남은 예약을 모두 해제
+        self.place_order(self.seller, "sell", "1", "110")
+        match_orders()
+        buy_order.refresh_from_db()
+        self.assertEqual((buy_order.status, buy_order.locked), ("completed", 0))
+        krw_balance = self.buyer.wallet.balances.get(currency__symbol="KRW")
+        self.assertEqual((krw_balance.amount, krw_balance.locked), (self.base_krw_amount - Decimal("210"), 0))
+
+    def test_trade_match_cancel_removes_from_book(self):
+        self.buy_order.price = "50.00"
+        self.buy_order.save()
+        match_orders()
+        book = get_order_book(self.btc.id, self.krw.id)
+        self.assertIn(self.sell_order.id, book)
+
+        # 취소된 주문은 다음 매칭에서 DB를 다시 읽지 않고 호가창에서 제거되어 체결되지 않음
+        with self.captureOnCommitCallbacks(execute=True):
+            cancel_orders(self.seller, id=self.sell_order.id)
+        self.place_order(self.buyer, "buy", "1", "100")
+        match_orders()
+        self.assertNotIn(self.sell_order.id, book)
+        self.assertEqual(book.best_ask(), None)
+        self.assertEqual(Trade.objects.count(), 0)
+        self.assertEqual(Order.objects.get(id=self.sell_order.id).status, "canceled")
+
+    def test_trade_match_amend(self):
+        self.buy_order.price = "50.00"
+        self.buy_order.save()
+        match_orders()
+        book = get_order_book(self.btc.id, self.krw.id)
+
+        # 수량을 줄인 주문은 호가창에서 id로 바로 차감
+        with self.captureOnCommitCallbacks(execute=True):
+            amend_order(self.seller, self.sell_order.id, amount=Decimal("1"))
+        match_orders()
+        self.assertEqual(book.orders[self.sell_order.id].amount, Decimal("1"))
+
+        # 가격을 바꾼 매수 주문은 새 주문으로 다시 접수되어 반대편 호가와 체결
+        with self.captureOnCommitCallbacks(execute=True):
+            new_order = amend_order(self.buyer, self.buy_order.id, price=Decimal("100"))
+        match_orders()
+        self.assertNotIn(self.buy_order.id, book)
+        self.assertEqual(Trade.objects.get().amount, Decimal("1"))
+        self.assertEqual(Order.objects.get(id=self.sell_order.id).status, "completed")
+        new_order.refresh_from_db()
+        self.assertEqual((new_order.status, new_order.amount), ("open", Decimal("0.5")))
+        self.assertEqual(book.orders[new_order.id].amount, Decimal("0.5"))
+
+    def test_trade_match_amend_after_rebuild(self):
+        self.buy_order.price = "50.00"
+        self.buy_order.save()
+        match_orders()
+
+        # 수량 변경이 전달되기 전에 호가창을 DB에서 다시 만들어도 줄어든 수량을 두 번 차감하지 않음
+        with self.captureOnCommitCallbacks() as callbacks:
+            amend_order(self.seller, self.sell_order.id, amount=Decimal("1"))
+        drop_order_book(self.btc.id, self.krw.id)
+        match_orders()
+        for callback in callbacks:
+            callback()
+        match_orders()
+        self.assertEqual(get_order_book(self.btc.id, self.krw.id).orders[self.sell_order.id].amount, Decimal("1"))
+
+    def test_trade_match_time_in_force(self):
+        self.buy_order.delete()
+
+        # 전체 수량을 체결할 수 없는 FOK 주문과 교차하는 post-only 주문은 체결 없이 취소
+        fok_order = self.place_order(self.buyer, "buy", "2", "100", time_in_force="FOK")
+        post_only_order = self.place_order(self.buyer, "buy", "1", "100", post_only=True)
+        # IOC 주문은 체결되지 않은 수량을 호가창에 올리지 않고 취소
+        ioc_order = self.place_order(self.buyer, "buy", "2", "100", time_in_force="IOC")
+        match_orders()
+
+        for order in [fok_order, post_only_order, ioc_order]:
+            order.refresh_from_db()
+            self.assertEqual((order.status, order.locked), ("canceled", 0))
+        self.assertEqual(ioc_order.amount, Decimal("0.5"))
+        self.assertEqual(Trade.objects.get().buy_order_id, ioc_order.id)
+        self.assertIsNone(get_order_book(self.btc.id, self.krw.id).best_bid())
+        krw_balance = self.buyer.wallet.balances.get(currency=self.krw)
+        self.assertEqual((krw_balance.amount, krw_balance.locked), (self.base_krw_amount - Decimal("150"), 0))
+
+    def test_trade_match_gtd_expiry(self):
+        self.buy_order.delete()
+        self.sell_order.delete()
+        now = timezone.now()
+        gtd_order = self.place_order(self.seller, "sell", "1", "100", time_in_force="GTD", expires_at=now + timedelta(seconds=30))
+        expired_order = self.place_order(self.seller, "sell", "1", "101", time_in_force="GTD", expires_at=now - timedelta(seconds=1))
+        match_orders()
+        book = get_order_book(self.btc.id, self.krw.id)
+        self.assertIn(gtd_order.id, book)
+        self.assertEqual(Order.objects.get(id=expired_order.id).status, "canceled")
+
+        # 만료 시간이 지나면 주문 테이블을 확인하지 않고 time wheel에서 꺼내 취소
+        with mock.patch("django.utils.timezone.now", return_value=now + timedelta(seconds=31)):
+            match_orders(self.btc.id, self.krw.id)
+        self.assertNotIn(gtd_order.id, book)
+        gtd_order.refresh_from_db()
+        self.assertEqual((gtd_order.status, gtd_order.locked), ("canceled", 0))
+        self.assertEqual(self.seller.wallet.balances.get(currency=self.btc).locked, 0)
+
+    def test_trading_pair_matching_engine(self):
+        base_currency_id, quote_currency_id = self.buy_order.base_currency_id, self.buy_order.quote_currency_id
+        run_trading_pair_matching_engine(base_currency_id, quote_currency_id)
+        self.assertEqual(Order.objects.get(id=self.buy_order.id).status, "completed")
+        self.assertEqual(Order.objects.get(id=self.sell_order.id).status, "completed")
+
+    def test_trading_pair_matching_engine_locked(self):
+        base_currency_id, quote_currency_id = self.buy_order.base_currency_id, self.buy_order.quote_currency_id
+        lock = self.r.lock(f"matching:lock:{base_currency_id}:{quote_currency_id}", timeout=10)
+        lock.acquire()
+        try:
+            with self.assertRaises(Retry):
+                run_trading_pair_matching_engine(base_currency_id, quote_currency_id)
+        finally:
+            lock.release()
+        self.assertEqual(Order.objects.get(id=self.buy_order.id).status, "open")
+        self.assertEqual(Trade.objects.count(), 0)
+
+    def test_trading_pair_matching_engine_lock_expired(self):
+        # 매칭 도중 lock이 만료되어도 이미 commit된 매칭 결과로 task를 마침
+        base_currency_id, quote_currency_id = self.buy_order.base_currency_id, self.buy_order.quote_currency_id
+        lock_key = f"matching:lock:{base_currency_id}:{quote_currency_id}"
+        with mock.patch("orders.tasks.match_trading_pair", side_effect=lambda *pair: self.r.delete(lock_key)):
+            run_trading_pair_matching_engine(base_currency_id, quote_currency_id)
+        self.assertFalse(self.r.exists(lock_key))
+
+    def test_trading_pair_matching_engine_stale_order_book(self):
+        # 호가창이 DB와 어긋나 매칭이 실패하면 다시 만든 호가창으로 바로 매칭하도록 다시 요청
+        base_currency_id, quote_currency_id = self.buy_order.base_currency_id, self.buy_order.quote_currency_id
+        with mock.patch("orders.tasks.match_trading_pair", side_effect=StaleOrderBookError), mock.patch("orders.tasks.run_trading_pair_matching_engine.apply_async") as apply_async:
+            run_trading_pair_matching_engine(base_currency_id, quote_currency_id)
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs["args"], [base_currency_id, quote_currency_id])
+        self.r.delete(f"matching:pending:{base_currency_id}:{quote_currency_id}")
+
+    def test_trading_pair_matching_engine_clears_pending(self):
+        base_currency_id, quote_currency_id = self.buy_order.base_currency_id, self.buy_order.quote_currency_id
+        with mock.patch("orders.tasks.run_trading_pair_matching_engine.apply_async") as apply_async:
+            dispatch_trading_pair_matching(base_currency_id, quote_currency_id)
+            dispatch_trading_pair_matching(base_currency_id, quote_currency_id)
+            self.assertEqual(apply_async.call_count, 1)
+
+            run_trading_pair_matching_engine(base_currency_id, quote_currency_id)
+            dispatch_trading_pair_matching(base_currency_id, quote_currency_id)
+            self.assertEqual(apply_async.call_count, 2)
+        self.r.delete(f"matching:pending:{base_currency_id}:{quote_currency_id}")
+
+    def test_schedule_order_expiry(self):
+        # 가까운 만료 시간은 같은 초끼리 하나의 ETA task로 합치고, 먼 만료 시간은 beat의 주기적인 매칭에 맡김
+        base_currency_id, quote_currency_id = self.buy_order.base_currency_id, self.buy_order.quote_currency_id
+        expires_at = timezone.now().replace(microsecond=0) + timedelta(minutes=5)
+        with mock.patch("orders.tasks.run_trading_pair_matching_engine.apply_async") as apply_async:
+            schedule_order_expiry(base_currency_id, quote_currency_id, expires_at)
+            schedule_order_expiry(base_currency_id, quote_currency_id, expires_at + timedelta(milliseconds=500))
+            schedule_order_expiry(base_currency_id, quote_currency_id, timezone.now() + timedelta(seconds=ORDER_EXPIRY_SCHEDULE_LIMIT + 60))
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs["eta"], expires_at + timedelta(seconds=1))
+        self.r.delete(f"matching:expiry:{base_currency_id}:{quote_currency_id}:{int(expires_at.timestamp())}")
+
+    def test_matching_queue(self):
+        queue = matching_queue(self.buy_order.base_currency_id, self.buy_order.quote_currency_id)
+        self.assertEqual(queue, matching_queue(self.buy_order.base_currency_id, self.buy_order.quote_currency_id))
+        self.assertIn(queue, [f"matching-{partition}" for partition in range(settings.MATCHING_PARTITIONS)])
+
+
+class OrderQueryPlanTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(**USER_DATA)
+        cls.krw = CryptoCurrency.objects.create(symbol="KRW", name="Korean Won")
+        cls.bases = [CryptoCurrency.objects.create(symbol=f"C{i}", name=f"Coin {i}") for i in range(10)]
+
+        # 대부분의 주문은 체결된 상태이고 일부만 open 상태인 실제 운영 환경과 비슷한 분포로 데이터를 생성
+        orders = [
+            Order(
+                user=user,
+                order_type="limit",
+                base_currency=cls.bases[i % 10],
+                quote_currency=cls.krw,
+                side="buy" if i % 2 else "sell",
+                price=1000 + i % 97,
+                amount=1,
+                status="open" if i % 20 == 0 else "completed",
+            )
+            for i in range(5000)
+        ]
+        Order.objects.bulk_create(orders)
+        completed_order = Order.objects.filter(status="completed").first()
+        Trade.objects.bulk_create(
+            [
+                Trade(buy_order=completed_order, sell_order=completed_order, base_currency=cls.bases[i % 10], quote_currency=cls.krw, taker_side="buy", price=1000, amount=1)
+                for i in range(5000)
+            ]
+        )
+
+        with connection.cursor() as cursor:
+            # bulk_create는 auto_now_add 값을 덮어쓰므로 체결 시간을 직접 분산
+            cursor.execute("UPDATE orders_trade SET created_at = now() - id * interval '1 minute'")
+            cursor.execute("ANALYZE orders_order")
+            cursor.execute("ANALYZE orders_trade")
+
+    def assertIndexScan(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertNotIn("Seq Scan on orders_", plan)
+        self.assertIn(index_name, plan)
+
+    def test_new_open_orders_plan(self):
+        # 두 부분 인덱스 모두 거래쌍 조건으로 시작하므로 planner가 어느 쪽을 선택해도 open 주문만 읽음
+        self.assertIndexScan(open_orders(self.bases[0].id, self.krw.id), "order_open_")
+
+    def test_open_order_book_side_plan(self):
+        queryset = Order.objects.filter(base_currency=self.bases[0], quote_currency=self.krw, side="buy", status="open").order_by("-price", "created_at")
+        self.assertIndexScan(queryset, "order_open_book_idx")
+
+    def test_trade_time_range_plan(self):
+        now = timezone.now()
+        self.assertIndexScan(Trade.objects.filter(created_at__gte=now - timedelta(hours=1), created_at__lt=now), "trade_created_at_idx")
+
+    def test_trade_pair_time_range_plan(self):
+        now = timezone.now()
+        queryset = Trade.objects.filter(base_currency=self.bases[0], quote_currency=self.krw, created_at__gte=now - timedelta(days=1), created_at__lt=now)
+        self.assertIndexScan(queryset, "trade_")
+        self.assertNotIn("orders_order", str(queryset.query))
+
+
+class OrderBookTestCase(SimpleTestCase):
+    def setUp(self):
+        self.book = OrderBook(("BTC", "KRW"))
+
+    def test_best_bid_ask(self):
+        self.book.submit(1, "buy", Decimal("100"), Decimal("1"))
+        self.book.submit(2, "buy", Decimal("101"), Decimal("1"))
+        self.book.submit(3, "sell", Decimal("105"), Decimal("1"))
+        self.book.submit(4, "sell", Decimal("103"), Decimal("1"))
+        self.assertEqual(self.book.best_bid(), Decimal("101"))
+        self.assertEqual(self.book.best_ask(), Decimal("103"))
+
+    def test_price_time_priority(self):
+        self.book.submit(1, "sell", Decimal("100"), Decimal("1"))
+        self.book.submit(2, "sell", Decimal("99"), Decimal("1"))
+        self.book.submit(3, "sell", Decimal("99"), Decimal("1"))
+
+        fills = self.book.submit(4, "buy", Decimal("100"), Decimal("2.5"))
+        self.assertEqual(
+            [(fill.maker_id, fill.price, fill.amount) for fill in fills], [(2, Decimal("99"), Decimal("1")), (3, Decimal("99"), Decimal("1")), (1, Decimal("100"), Decimal("0.5"))]
+        )
+        self.assertEqual(self.book.orders[1].amount, Decimal("0.5"))
+        self.assertNotIn(4, self.book)
+
+    def test_reduce_keeps_priority(self):
+        self.book.submit(1, "sell", Decimal("100"), Decimal("2"))
+        self.book.submit(2, "sell", Decimal("100"), Decimal("1"))
+
+        # 수량만 줄인 주문은 같은 가격대에서 먼저 체결
+        self.book.reduce_to(1, Decimal("0.5"))
+        self.assertEqual(self.book.asks.depth(), [(Decimal("100"), Decimal("1.5"))])
+        # 이미 남은 수량 이하라면 바뀌지 않으므로 같은 변경을 다시 반영해도 결과가 같음
+        self.book.reduce_to(1, Decimal("0.5"))
+        self.assertEqual(self.book.asks.depth(), [(Decimal("100"), Decimal("1.5"))])
+        fills = self.book.submit(3, "buy", Decimal("100"), Decimal("0.5"))
+        self.assertEqual([(fill.maker_id, fill.amount) for fill in fills], [(1, Decimal("0.5"))])
+
+        self.assertIsNone(self.book.reduce_to(4, Decimal("1")))
+        self.book.reduce_to(2, Decimal("0"))
+        self.assertNotIn(2, self.book)
+        self.assertIsNone(self.book.best_ask())
+
+    def test_time_in_force(self):
+        self.book.submit(1, "sell", Decimal("100"), Decimal("1"))
+        self.book.submit(2, "sell", Decimal("101"), Decimal("1"))
+
+        # FOK는 지정가 안에서 전체 수량을 채울 수 없으면 체결하지 않음
+        self.assertEqual(self.book.submit(3, "buy", Decimal("100"), Decimal("1.5"), "FOK"), [])
+        self.assertEqual(len(self.book.submit(4, "buy", Decimal("101"), Decimal("1.5"), "FOK")), 2)
+
+        # IOC는 체결되지 않은 수량을 호가창에 올리지 않음
+        fills = self.book.submit(5, "buy", Decimal("101"), Decimal("1"), "IOC")
+        self.assertEqual([fill.amount for fill in fills], [Decimal("0.5")])
+        self.assertNotIn(5, self.book)
+
+        # post-only는 교차하면 거절되고, 교차하지 않으면 호가창에 올라감
+        self.book.submit(7, "buy", Decimal("99"), Decimal("1"))
+        self.assertEqual(self.book.submit(8, "sell", Decimal("99"), Decimal("1"), post_only=True), [])
+        self.assertNotIn(8, self.book)
+        self.book.submit(9, "sell", Decimal("100"), Decimal("1"), post_only=True)
+        self.assertEqual(self.book.best_ask(), Decimal("100"))
+
+    def test_gtd_expire(self):
+        self.book.submit(1, "sell", Decimal("100"), Decimal("1"), "GTD", expires_at=1000.5)
+        self.book.submit(2, "sell", Decimal("101"), Decimal("1"), "GTD", expires_at=1000 + 3600 * 2)
+        self.book.submit(3, "sell", Decimal("102"), Decimal("1"), "GTD", expires_at=1010)
+        self.book.cancel(3)
+
+        self.assertEqual(self.book.expire(999), [])
+        self.assertEqual(self.book.expire(1001), [1])
+        # 같은 slot에 들어간 더 먼 만료 시간의 주문과 이미 취소된 주문은 꺼내지 않음
+        self.assertEqual(self.book.expire(1000 + 3600), [])
+        self.assertEqual(self.book.expire(1000 + 3600 * 2), [2])
+        self.assertIsNone(self.book.best_ask())
+
+    def test_rest_remaining_amount(self):
+        self.book.submit(1, "sell", Decimal("100"), Decimal("1"))
+        fills = self.book.submit(2, "buy", Decimal("100"), Decimal("3"))
+        self.assertEqual(len(fills), 1)
+        self.assertEqual(self.book.best_bid(), Decimal("100"))
+        self.assertEqual(self.book.orders[2].amount, Decimal("2"))
+        self.assertIsNone(self.book.best_ask())
+
+    def test_submit_market(self):
+        self.book.submit(1, "sell", Decimal("100"), Decimal("1"))
+        self.book.submit(2, "sell", Decimal("104"), Decimal("1"))
+        self.book.submit(3, "sell", Decimal("106"), Decimal("1"))
+
+        fills, remaining = self.book.submit_market(4, "buy", Decimal("5"), Decimal("0.05"))
+        self.assertEqual([fill.maker_id for fill in fills], [1, 2])
+        self.assertEqual(remaining, Decimal("3"))
+        self.assertNotIn(4, self.book)
+        self.assertEqual(self.book.best_ask(), Decimal("106"))
+
+    def test_submit_market_budget(self):
+        self.book.submit(1, "sell", Decimal("100"), Decimal("1"))
+        fills, remaining = self.book.submit_market(2, "buy", Decimal("1"), Decimal("0.05"), budget=Decimal("25"))
+        self.assertEqual(fills[0].amount, Decimal("0.25"))
+        self.assertEqual(remaining, Decimal("0.75"))
+
+    def test_cancel(self):
+        self.book.submit(1, "buy", Decimal("100"), Decimal("1"))
+        self.book.submit(2, "buy", Decimal("100"), Decimal("1"))
+        self.book.cancel(1)
+        self.assertNotIn(1, self.book)
+
+        fills = self.book.submit(3, "sell", Decimal("100"), Decimal("1"))
+        self.assertEqual(fills[0].maker_id, 2)
+        self.assertIsNone(self.book.best_bid())
+        self.assertIsNone(self.book.cancel(1))
+
+    def test_depth_changes(self):
+        self.book.submit(1, "buy", Decimal("100"), Decimal("1"))
+        self.book.submit(2, "buy", Decimal("100"), Decimal("2"))
+        self.book.submit(3, "buy", Decimal("99"), Decimal("1"))
+        self.assertEqual(self.book.bids.depth(), [(Decimal("100"), Decimal("3")), (Decimal("99"), Decimal("1"))])
+        self.book.depth_changes()
+
+        # 같은 가격이 여러 번 바뀌어도 최종 수량만 남고, 모두 사라진 가격은 0
+        self.book.submit(4, "sell", Decimal("99"), Decimal("3.5"))
+        self.assertEqual(self.book.depth_changes(), {"bids": {Decimal("100"): 0, Decimal("99"): Decimal("0.5")}, "asks": {}})
+        self.assertEqual(self.book.depth_changes(), {"bids": {}, "asks": {}})
+
 
-class TradeConsumerTestCase(TestCase):
+class DepthPublishTestCase(TestCase):
+    def setUp(self):
+        self.btc = CryptoCurrency.objects.create(symbol="BTC", name="Bitcoin")
+        self.krw = CryptoCurrency.objects.create(symbol="KRW", name="Korean Won")
+        self.user = User.objects.create_user(**USER_DATA)
+        self.redis_conn = get_redis_connection("default")
+        self.redis_conn.delete("depth:BTCKRW:bids", "depth:BTCKRW:asks", "depth:BTCKRW:seq")
+
+    def create_order(self, side, price, amount):
+        return create_open_order(user=self.user, side=side, order_type="limit", price=price, amount=amount, base_currency=self.btc, quote_currency=self.krw)
+
+    def test_publish_snapshot_then_deltas(self):
+        self.create_order("buy", 100, 1)
+        self.create_order("sell", 110, 2)
+        with mock.patch("orders.services.send_depth_data") as send_depth_data, self.captureOnCommitCallbacks(execute=True):
+            match_orders()
+        symbol, depth_data = send_depth_data.call_args.args
+        self.assertEqual(symbol, "BTCKRW")
+        self.assertEqual(depth_data, {"type": "snapshot", "seq": 1, "bids": [["100.00000000", "1.00000000"]], "asks": [["110.00000000", "2.00000000"]]})
+
+        self.create_order("sell", 100, "0.4")
+        with mock.patch("orders.services.send_depth_data") as send_depth_data, self.captureOnCommitCallbacks(execute=True):
+            match_orders()
+        depth_data = send_depth_data.call_args.args[1]
+        self.assertEqual(depth_data, {"type": "delta", "prev_seq": 1, "seq": 2, "bids": {"100.00000000": "0.60000000"}, "asks": {}})
+        self.assertEqual(self.redis_conn.hgetall("depth:BTCKRW:bids"), {b"100.00000000": b"0.60000000"})
+
+        # 호가창을 다시 만들면 snapshot을 다시 전송
+        drop_order_book(self.btc.id, self.krw.id)
+        with mock.patch("orders.services.send_depth_data") as send_depth_data, self.captureOnCommitCallbacks(execute=True):
+            match_orders(self.btc.id, self.krw.id)
+        self.assertEqual(send_depth_data.call_args.args[1]["type"], "snapshot")
+
+
+# consumer는 메시지를 처리할 때마다 오래된 DB 연결을 닫으므로 트랜잭션으로 감싸는 TestCase 대신 TransactionTestCase를 사용
+class TradeConsumerTestCase(TransactionTestCase):
     def setUp(self):
         base = CryptoCurrency.objects.create(symbol="BTC", name="Bitcoin")
         quote = CryptoCurrency.objects.create(symbol="KRW", name="Korean Won")
@@ -251,8 +1178,127 @@ class TradeConsumerTestCase(TestCase):
 
             response = await communicator.receive_json_from()
 
-            self.assertEqual(response["price"], self.price)
-            self.assertEqual(response["amount"], self.amount)
+            self.assertEqual(len(response), 1)
+            self.assertEqual(response[0]["price"], self.price)
+            self.assertEqual(response[0]["amount"], self.amount)
+
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    @mock.patch.object(TradeConsumer, "send_interval", 0.5)
+    def test_trade_consumer_buffers_trades(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(application, "/ws/orders/BTCKRW/")
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            # 전송 간격 안에 들어온 체결 메시지는 하나의 frame으로 이어 붙임
+            for trade_data in [[{"price": "1"}], [{"price": "2"}, {"price": "3"}]]:
+                await get_channel_layer().group_send("orders_BTCKRW", {"type": "send_trade_data", "symbol": "BTCKRW", "text": json.dumps(trade_data)})
+            self.assertEqual(await communicator.receive_json_from(), [{"price": "1"}, {"price": "2"}, {"price": "3"}])
+
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    @mock.patch.object(TradeConsumer, "send_interval", 0.5)
+    def test_trade_consumer_bounded_buffer(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(application, "/ws/orders/BTCKRW/")
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            # 버퍼가 가득 차면 오래된 메시지부터 버림
+            for price in range(TradeConsumer.max_buffered_frames + 10):
+                await get_channel_layer().group_send("orders_BTCKRW", {"type": "send_trade_data", "symbol": "BTCKRW", "text": json.dumps([{"price": str(price)}])})
+            response = await communicator.receive_json_from()
+            self.assertEqual(len(response), TradeConsumer.max_buffered_frames)
+            self.assertEqual(response[0]["price"], "10")
+
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_trade_consumer_indicators(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(application, "/ws/orders/BTCKRW/?interval=1m&indicators=ma:1,vwap")
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            await sync_to_async(Trade.objects.create)(buy_order=self.buy_order, sell_order=self.sell_order, price=self.price, amount=self.amount)
+            await communicator.receive_json_from()
+
+            candles = await sync_to_async(list)(Candle.objects.all())
+            await sync_to_async(publish_candles)(candles, {(self.buy_order.base_currency_id, self.buy_order.quote_currency_id): "BTCKRW"})
+
+            response = await communicator.receive_json_from()
+            self.assertEqual(response["interval"], "1m")
+            self.assertEqual(response["indicators"], {"ma:1": 10000.0, "vwap": 10000.0})
+
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+        clear_candle_cache()
+
+    def test_stream_consumer(self):
+        get_redis_connection("default").delete("depth:BTCKRW:bids", "depth:BTCKRW:asks", "depth:BTCKRW:seq")
+
+        async def scenario():
+            communicator = WebsocketCommunicator(application, "/ws/stream/")
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            for channel in ["trades", "depth"]:
+                await communicator.send_json_to({"action": "subscribe", "channel": channel, "symbol": "BTCKRW"})
+                self.assertEqual(await communicator.receive_json_from(), {"type": "subscribed", "channel": channel, "symbol": "BTCKRW"})
+            self.assertEqual(await communicator.receive_json_from(), {"channel": "depth", "symbol": "BTCKRW", "data": {"type": "snapshot", "seq": 0, "bids": [], "asks": []}})
+
+            await communicator.send_json_to({"action": "subscribe", "channel": "orders", "symbol": "BTCKRW"})
+            self.assertEqual(await communicator.receive_json_from(), {"type": "error", "message": "Invalid channel"})
+
+            await sync_to_async(Trade.objects.create)(buy_order=self.buy_order, sell_order=self.sell_order, price=self.price, amount=self.amount)
+            response = await communicator.receive_json_from()
+            self.assertEqual((response["channel"], response["symbol"]), ("trades", "BTCKRW"))
+            self.assertEqual(response["data"][0]["price"], self.price)
+
+            # 구독을 해지한 stream은 더 이상 전송하지 않음
+            await communicator.send_json_to({"action": "unsubscribe", "channel": "trades", "symbol": "BTCKRW"})
+            self.assertEqual(await communicator.receive_json_from(), {"type": "unsubscribed", "channel": "trades", "symbol": "BTCKRW"})
+            await get_channel_layer().group_send("orders_BTCKRW", {"type": "send_trade_data", "symbol": "BTCKRW", "text": "[]"})
+            self.assertTrue(await communicator.receive_nothing(timeout=0.2))
+
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_depth_consumer(self):
+        get_redis_connection("default").delete("depth:BTCKRW:bids", "depth:BTCKRW:asks", "depth:BTCKRW:seq")
+
+        async def scenario():
+            communicator = WebsocketCommunicator(application, "/ws/orders/BTCKRW/depth/")
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            self.assertEqual(await communicator.receive_json_from(), {"type": "snapshot", "seq": 0, "bids": [], "asks": []})
+
+            # 주문이 모두 체결되어 새로 만든 호가창의 snapshot은 비어 있음
+            await sync_to_async(match_orders)()
+            self.assertEqual(await communicator.receive_json_from(), {"type": "snapshot", "seq": 1, "bids": [], "asks": []})
+
+            # 짧은 시간 안에 들어온 변경은 가격별로 합쳐서 전송
+            for amount in ["1", "2"]:
+                await sync_to_async(create_open_order)(
+                    user=self.buy_order.user,
+                    side="buy",
+                    order_type="limit",
+                    price="9000",
+                    amount=amount,
+                    base_currency=self.buy_order.base_currency,
+                    quote_currency=self.buy_order.quote_currency,
+                )
+                await sync_to_async(match_orders)()
+            response = await communicator.receive_json_from()
+            self.assertEqual(response, {"type": "delta", "prev_seq": 1, "seq": 3, "bids": {"9000.00000000": "3.00000000"}, "asks": {}})
 
             await communicator.disconnect()
 
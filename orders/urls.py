@@ -1,7 +1,9 @@
 from django.urls import path
 
-from .views import OrderView
+from .views import OrderBatchView, OrderDetailView, OrderView
 
 urlpatterns = [
     path("order/", OrderView.as_view(), name="order"),
+    path("order/batch/", OrderBatchView.as_view(), name="order-batch"),
+    path("order/<int:order_id>/", OrderDetailView.as_view(), name="order-detail"),
 ]
@@ -1,9 +1,13 @@
+from django.db import transaction
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .serializers import OrderSerializer
+from .serializers import OrderAmendSerializer, OrderBatchSerializer, OrderSerializer
+from .services import OrderAmendError, amend_order, cancel_orders, place_orders
+from .tasks import dispatch_trading_pair_matching, schedule_order_expiry
+from markets.utils import get_currency
 
 
 class OrderView(APIView):
@@ -12,6 +16,99 @@ class OrderView(APIView):
     def post(self, request):
         serializer = OrderSerializer(data=request.data, context={"request": request})
         if serializer.is_valid():
-            serializer.save(user=request.user)
+            order = serializer.save(user=request.user)
+            # 주문이 commit된 이후에 매칭을 요청해야 worker가 새 주문을 읽을 수 있음
+            transaction.on_commit(lambda: dispatch_trading_pair_matching(order.base_currency_id, order.quote_currency_id))
+            if order.time_in_force == "GTD":
+                transaction.on_commit(lambda: schedule_order_expiry(order.base_currency_id, order.quote_currency_id, order.expires_at))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def delete(self, request):
+        # symbol이 없다면 모든 거래쌍의 미체결 주문을 취소
+        filters = {}
+        symbol = request.query_params.get("symbol")
+        if symbol:
+            base, _, quote = symbol.partition("/")
+            base_currency, quote_currency = get_currency(base), get_currency(quote)
+            if base_currency is None or quote_currency is None:
+                return Response({"error": "Invalid symbol"}, status=status.HTTP_400_BAD_REQUEST)
+            filters = {"base_currency_id": base_currency.id, "quote_currency_id": quote_currency.id}
+
+        canceled = cancel_orders(request.user, **filters)
+        dispatch_canceled_pairs(canceled)
+        return Response({"canceled": sorted(order_id for order_ids in canceled.values() for order_id in order_ids)}, status=status.HTTP_200_OK)
+
+
+class OrderBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        # 여러 주문을 한 번의 요청으로 접수, 결과는 요청한 주문 순서대로 반환
+        batch = OrderBatchSerializer(data=request.data)
+        if not batch.is_valid():
+            return Response(batch.errors, status=status.HTTP_400_BAD_REQUEST)
+        atomic = batch.validated_data["atomic"]
+
+        results, order_serializers = [], {}
+        for index, order_data in enumerate(batch.validated_data["orders"]):
+            serializer = OrderSerializer(data=order_data, context={"request": request})
+            if serializer.is_valid():
+                order_serializers[index] = serializer
+                results.append(None)
+            else:
+                results.append({"status": "rejected", "errors": serializer.errors})
+
+        # 잔고는 주문마다 읽지 않고 place_orders에서 한 번의 snapshot으로 검사한 뒤 통화별로 한 번에 예약
+        orders = {index: serializer.build_order({**serializer.validated_data, "user": request.user}) for index, serializer in order_serializers.items()}
+        if atomic and len(orders) < len(results):
+            created, error = [], "Another order in the batch is invalid."
+        else:
+            created, error = place_orders(request.user, list(orders.values()), atomic)[0], "Not enough balance."
+
+        created_ids = {id(order) for order in created}
+        for index, order in orders.items():
+            if id(order) in created_ids:
+                order_serializers[index].instance = order
+                results[index] = {"status": "created", "order": order_serializers[index].data}
+            else:
+                results[index] = {"status": "rejected", "errors": {"non_field_errors": [error]}}
+
+        for pair in {(order.base_currency_id, order.quote_currency_id) for order in created}:
+            transaction.on_commit(lambda pair=pair: dispatch_trading_pair_matching(*pair))
+        for order in created:
+            if order.time_in_force == "GTD":
+                transaction.on_commit(lambda order=order: schedule_order_expiry(order.base_currency_id, order.quote_currency_id, order.expires_at))
+        return Response({"results": results}, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
+
+class OrderDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def patch(self, request, order_id):
+        # 미체결 지정가 주문의 가격, 수량을 한 번의 요청으로 변경, 가격이 바뀌면 새 id의 주문으로 다시 접수됨
+        serializer = OrderAmendSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            order = amend_order(request.user, order_id, **serializer.validated_data)
+        except OrderAmendError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if order is None:
+            return Response({"error": "Open order not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        transaction.on_commit(lambda: dispatch_trading_pair_matching(order.base_currency_id, order.quote_currency_id))
+        return Response(OrderSerializer(order).data, status=status.HTTP_200_OK)
+
+    def delete(self, request, order_id):
+        canceled = cancel_orders(request.user, id=order_id)
+        if not canceled:
+            return Response({"error": "Open order not found"}, status=status.HTTP_404_NOT_FOUND)
+        dispatch_canceled_pairs(canceled)
+        return Response({"canceled": [order_id]}, status=status.HTTP_200_OK)
+
+
+def dispatch_canceled_pairs(canceled):
+    # 취소 목록이 Redis에 추가된 이후에 매칭을 요청해 worker가 바로 호가창에서 제거하고 호가를 전송하도록 함
+    for base_currency_id, quote_currency_id in canceled:
+        transaction.on_commit(lambda pair=(base_currency_id, quote_currency_id): dispatch_trading_pair_matching(*pair))
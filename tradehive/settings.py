@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 import os
 from datetime import timedelta
+from decimal import Decimal
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -244,3 +245,9 @@ CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND")
 
 CELERY_ACCEPT_CONTENT = ["json"]  # 요청을 받을 수 있는 content type
 CELERY_TASK_SERIALIZER = "json"  # task 직렬화
+
+# 매칭 엔진 파티션 수, 거래쌍은 matching-{n} 큐 중 하나에 고정 배정되고 각 큐는 concurrency 1인 worker 하나가 소비
+MATCHING_PARTITIONS = int(os.getenv("MATCHING_PARTITIONS", 4))
+
+# 시장가 주문이 최우선 호가에서 벗어나 체결될 수 있는 최대 비율, 범위를 벗어난 수량은 취소
+MARKET_ORDER_SLIPPAGE = Decimal(os.getenv("MARKET_ORDER_SLIPPAGE", "0.05"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0007_suspiciousrequest"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="walletbalance",
+            name="locked",
+            field=models.DecimalField(decimal_places=8, default=0, max_digits=20),
+        ),
+    ]
@@ -38,6 +38,8 @@ class WalletBalance(models.Model):
     wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="balances")
     currency = models.ForeignKey(CryptoCurrency, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    # 미체결 주문에 예약된 수량, 주문에 사용할 수 있는 잔고는 amount - locked
+    locked = models.DecimalField(max_digits=20, decimal_places=8, default=0)
 
     class Meta:
         unique_together = ("wallet", "currency")
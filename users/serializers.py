@@ -5,6 +5,8 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.core.validators import validate_email, RegexValidator
 from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
 from rest_framework import serializers
 from rest_framework_simplejwt.tokens import RefreshToken
 
@@ -242,7 +244,8 @@ class TransactionSerializer(serializers.ModelSerializer):
         wallet = self.context.get("request").user.wallet
         wallet_balance = wallet.balances.filter(currency=currency).first()
         if transaction_type == "withdraw":
-            if not wallet_balance or wallet_balance.amount < (amount * (1 + fee_input)):
+            # 미체결 주문에 예약된 잔고는 출금할 수 없음
+            if not wallet_balance or wallet_balance.amount - wallet_balance.locked < (amount * (1 + fee_input)):
                 raise serializers.ValidationError("Not enough balance to withdraw.")
 
         return data
@@ -254,14 +257,19 @@ class TransactionSerializer(serializers.ModelSerializer):
         fee = validated_data["fee"]
 
         currency = validated_data["currency"]
-        wallet_balance = wallet.balances.get_or_create(currency=currency)[0]
         # admin_wallet_balance = User.objects.get(is_superuser=True).wallet.balances.get_or_create(currency=currency_instance)[0]  # TODO: 관리자 지갑에 수수료 추가
-        if transaction_type == "deposit":
-            wallet_balance.amount += amount * (1 - fee)
-        elif transaction_type == "withdraw":
-            wallet_balance.amount -= amount * (1 + fee)
-        # admin_wallet_balance.amount += amount * fee
-        wallet_balance.save()
-        # admin_wallet_balance.save()
-
-        return Transaction.objects.create(wallet=wallet, transaction_type=transaction_type, currency=currency, amount=wallet_balance.amount, fee=amount * fee)
+        # 잔고를 읽고 저장하면 그 사이 주문이 바꾼 locked를 덮어쓰므로 amount만 조건부 UPDATE로 변경
+        with transaction.atomic():
+            balances = WalletBalance.objects.filter(wallet=wallet, currency=currency)
+            if transaction_type == "deposit":
+                wallet.balances.get_or_create(currency=currency)
+                balances.update(amount=F("amount") + amount * (1 - fee))
+            elif transaction_type == "withdraw":
+                # 사용 가능한 잔고 검사와 차감을 한 번에 처리해 동시에 접수된 주문이 예약한 잔고를 출금하지 않도록 함
+                total = amount * (1 + fee)
+                if not balances.filter(amount__gte=F("locked") + total).update(amount=F("amount") - total):
+                    raise serializers.ValidationError("Not enough balance to withdraw.")
+            # admin_wallet_balance.amount += amount * fee
+            # admin_wallet_balance.save()
+
+            return Transaction.objects.create(wallet=wallet, transaction_type=transaction_type, currency=currency, amount=balances.get().amount, fee=amount * fee)
@@ -1,4 +1,5 @@
 import base64
+from unittest import mock
 
 import pyotp
 import redis
@@ -8,7 +9,8 @@ from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import CustomUserTOTPDevice
+from .models import CustomUserTOTPDevice, WalletBalance
+from .serializers import TransactionSerializer
 from markets.models import CryptoCurrency
 
 USER_DATA = {
@@ -317,6 +319,34 @@ class TransactionsAPITestCase(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(float(self.user.wallet.balances.get(currency=self.btc).amount), 1 - (0.001 + 0.001 * 0.0001))
 
+    def test_withdraw_locked_balance(self):
+        # 미체결 주문에 예약된 잔고는 출금할 수 없음
+        self.user.wallet.balances.create(currency=self.btc, amount=1, locked="0.9995")
+        response = self.client.post(self.transactions_url, {"transaction_type": "withdraw", "currency": "BTC", "amount": 0.001})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_withdraw_concurrent_hold(self):
+        # 출금 검증 이후 주문이 잔고를 예약하면 출금은 거절되고 예약은 덮어쓰지 않음
+        balance = self.user.wallet.balances.create(currency=self.btc, amount=1)
+        validate = TransactionSerializer.validate
+
+        def validate_then_hold(serializer, data):
+            data = validate(serializer, data)
+            WalletBalance.objects.filter(id=balance.id).update(locked="0.9995")
+            return data
+
+        with mock.patch.object(TransactionSerializer, "validate", validate_then_hold):
+            response = self.client.post(self.transactions_url, {"transaction_type": "withdraw", "currency": "BTC", "amount": 0.001})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        balance.refresh_from_db()
+        self.assertEqual((float(balance.amount), float(balance.locked)), (1, 0.9995))
+
+        # 입금은 예약된 잔고를 유지한 채 amount만 증가
+        response = self.client.post(self.transactions_url, {"transaction_type": "deposit", "currency": "BTC", "amount": 1})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        balance.refresh_from_db()
+        self.assertEqual(float(balance.locked), 0.9995)
+
     def test_withdraw_not_enough_balance(self):
         response = self.client.post(self.transactions_url, {"transaction_type": "withdraw", "currency": "BTC", "amount": 0.001})
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)